@@ -0,0 +1,84 @@
+import os
+import random
+import socket
+import threading
+import time
+
+
+class DeviceUnavailableError(Exception):
+    """Raised when a device cannot be reached or its handshake fails"""
+
+
+def probe_tcp(host, port, timeout=None):
+    """Cheap reachability check: can a TCP connection be opened within timeout seconds?"""
+    timeout = float(timeout or os.getenv('DEVICE_PROBE_TIMEOUT', 2))
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class CircuitBreaker:
+    """
+    Per-device circuit breaker.
+    
+    After failure_threshold consecutive failures the circuit opens and the
+    device is skipped for an exponentially growing, jittered delay. When the
+    delay has passed a single half-open trial is allowed: success closes the
+    circuit, failure re-opens it with a longer delay.
+    """
+
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self, name, failure_threshold=None, base_delay=None, max_delay=None):
+        self.name = name
+        self.failure_threshold = int(failure_threshold or os.getenv('BREAKER_FAILURE_THRESHOLD', 3))
+        self.base_delay = float(base_delay or os.getenv('BREAKER_BASE_DELAY', 60))
+        self.max_delay = float(max_delay or os.getenv('BREAKER_MAX_DELAY', 1800))
+        
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if the device should be contacted now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self.retry_at:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def seconds_until_retry(self):
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def record_success(self):
+        """Close the circuit; returns True if it was open or half-open before"""
+        with self._lock:
+            recovered = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trips = 0
+            return recovered
+
+    def record_failure(self):
+        """Count a failure; returns True if this failure opened the circuit"""
+        with self._lock:
+            self.failures += 1
+            if self.state != self.HALF_OPEN and self.failures < self.failure_threshold:
+                return False
+                
+            was_closed = self.state == self.CLOSED
+            self.trips += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (self.trips - 1))
+            # Equal jitter keeps devices that failed together from retrying in lockstep
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            self.retry_at = time.monotonic() + delay
+            self.state = self.OPEN
+            return was_closed
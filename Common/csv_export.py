@@ -0,0 +1,53 @@
+import csv
+import gzip
+import os
+from Common.db import PooledConnection
+
+
+def export_query_to_csv(db_connection, path, query, params, header, format_row=None,
+                        chunk_size=None, compress=False):
+    """
+    Stream the rows of a query into a CSV file.
+    
+    Rows are read through an unbuffered cursor and written chunk by chunk,
+    so memory use does not depend on the size of the result. With compress
+    the file is gzip-compressed and '.gz' is appended to the path.
+    If writing fails mid-stream, the unread rows are discarded and a pooled
+    connection is closed rather than returned to the pool.
+    Returns (path, row count).
+    """
+    chunk_size = int(chunk_size or os.getenv('EXPORT_CHUNK_SIZE', 5000))
+    if compress:
+        path += '.gz'
+        file = gzip.open(path, mode='wt', newline='', encoding='utf-8')
+    else:
+        file = open(path, mode='w', newline='', encoding='utf-8')
+        
+    row_count = 0
+    cursor = db_connection.cursor(buffered=False)
+    try:
+        with file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.writerows(map(format_row, rows) if format_row else rows)
+                row_count += len(rows)
+    except Exception:
+        # Closing the cursor over an unread result raises "Unread result found",
+        # which would hide this error
+        try:
+            db_connection.consume_results()
+            cursor.close()
+        except Exception:
+            pass
+        if isinstance(db_connection, PooledConnection):
+            db_connection.discard()
+        raise
+        
+    cursor.close()
+    return path, row_count
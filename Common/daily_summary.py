@@ -0,0 +1,135 @@
+import logging
+from datetime import timedelta
+from mysql.connector import Error
+from Common.shift_resolver import shift_timestamp_window
+
+logger = logging.getLogger(__name__)
+
+# MySQL error for a missing table (attendance_daily before its migration ran)
+ER_NO_SUCH_TABLE = 1146
+
+
+class DailySummaryUpdater:
+    """
+    Keeps attendance_daily (one row per user and shift_date) current as events are stored.
+
+    Each reader type owns one side of the row: entry readers first_in and
+    in_count, exit readers last_out and out_count. After a batch is inserted
+    the touched (user_id, shift_date) keys are re-aggregated from attendance
+    for this reader's event type only (a covering range on idx_shift_lookup)
+    and upserted, and punch_count/worked_seconds are derived from both sides.
+    Readers of the same type commit under the shared shift lock, so the
+    aggregate always includes the previous batches of that type.
+    """
+
+    def __init__(self, event_type):
+        self.event_type = event_type
+        self.is_entry = event_type == 'IN'
+        self.time_column = 'first_in' if self.is_entry else 'last_out'
+        self.count_column = 'in_count' if self.is_entry else 'out_count'
+        self.supported = True
+
+    def _aggregate(self, cursor, keys):
+        user_ids = sorted({user_id for user_id, _ in keys})
+        first_date = min(shift_date for _, shift_date in keys)
+        last_date = max(shift_date for _, shift_date in keys)
+        aggregate = 'MIN' if self.is_entry else 'MAX'
+
+        cursor.execute(f"""
+            SELECT user_id, shift_date, {aggregate}(timestamp), COUNT(*)
+            FROM attendance
+            WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})
+            AND shift_date BETWEEN %s AND %s
+            AND event_type = %s
+            AND timestamp >= %s AND timestamp < %s
+            GROUP BY user_id, shift_date
+        """, (*user_ids, first_date, last_date, self.event_type, *shift_timestamp_window(first_date, last_date)))
+        return {(str(user_id), shift_date): (timestamp, count) for user_id, shift_date, timestamp, count in cursor.fetchall()}
+
+    def update(self, cursor, keys):
+        """
+        Refresh this reader's side of attendance_daily for keys, a dict of
+        (user_id, shift_date) -> shift_id. Runs in the batch's transaction.
+        """
+        if not keys or not self.supported:
+            return
+
+        aggregates = self._aggregate(cursor, keys)
+        rows = [
+            (user_id, shift_date, keys[(user_id, shift_date)], timestamp, count, count)
+            for (user_id, shift_date), (timestamp, count) in aggregates.items()
+            if (user_id, shift_date) in keys
+        ]
+        if not rows:
+            return
+
+        other_time = 'last_out' if self.is_entry else 'first_in'
+        other_count = 'out_count' if self.is_entry else 'in_count'
+        first_in, last_out = (
+            (f"VALUES({self.time_column})", other_time) if self.is_entry else (other_time, f"VALUES({self.time_column})")
+        )
+        try:
+            cursor.executemany(f"""
+                INSERT INTO attendance_daily (
+                    user_id, shift_date, shift_id, {self.time_column}, {self.count_column}, punch_count
+                ) VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    shift_id = VALUES(shift_id),
+                    {self.time_column} = VALUES({self.time_column}),
+                    {self.count_column} = VALUES({self.count_column}),
+                    punch_count = VALUES({self.count_column}) + {other_count},
+                    worked_seconds = CASE
+                        WHEN {last_out} > {first_in} THEN TIMESTAMPDIFF(SECOND, {first_in}, {last_out})
+                    END
+            """, rows)
+        except Error as e:
+            if e.errno != ER_NO_SUCH_TABLE:
+                raise
+            # Schema without attendance_daily: keep ingesting, setup/migrate.py adds it
+            logger.warning(f"attendance_daily is missing, daily summary disabled until restart: {e}")
+            self.supported = False
+
+
+def rebuild_daily_summary(connection, start_date, end_date):
+    """
+    Regenerate attendance_daily for shift dates in [start_date, end_date]
+    from the attendance table, one committed day at a time. Days with no
+    rows left in attendance (archived partitions) keep their summary rows.
+    Returns the number of summary rows written.
+    """
+    cursor = connection.cursor()
+    written = 0
+    shift_date = start_date
+    while shift_date <= end_date:
+        cursor.execute("""
+            SELECT user_id, MAX(shift_id),
+                   MIN(CASE WHEN event_type = 'IN' THEN timestamp END),
+                   MAX(CASE WHEN event_type = 'OUT' THEN timestamp END),
+                   SUM(CASE WHEN event_type = 'IN' THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN event_type = 'OUT' THEN 1 ELSE 0 END)
+            FROM attendance
+            WHERE shift_date = %s
+            AND timestamp >= %s AND timestamp < %s
+            GROUP BY user_id
+        """, (shift_date, *shift_timestamp_window(shift_date, shift_date)))
+        rows = []
+        for user_id, shift_id, first_in, last_out, in_count, out_count in cursor.fetchall():
+            in_count, out_count = int(in_count or 0), int(out_count or 0)
+            worked_seconds = None
+            if first_in and last_out and last_out > first_in:
+                worked_seconds = int((last_out - first_in).total_seconds())
+            rows.append((user_id, shift_date, shift_id, first_in, last_out, worked_seconds,
+                         in_count + out_count, in_count, out_count))
+
+        if rows:
+            cursor.execute("DELETE FROM attendance_daily WHERE shift_date = %s", (shift_date,))
+            cursor.executemany("""
+                INSERT INTO attendance_daily (
+                    user_id, shift_date, shift_id, first_in, last_out, worked_seconds,
+                    punch_count, in_count, out_count
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, rows)
+            connection.commit()
+            written += len(rows)
+        shift_date += timedelta(days=1)
+    return written
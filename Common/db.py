@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+
+def load_db_config():
+    """Build MySQL connection settings from the DB_* environment variables"""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'database': os.getenv('DB_NAME', 'attendance_db'),
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD', ''),
+        'port': int(os.getenv('DB_PORT', 3306))
+    }
+
+
+class PooledConnection:
+    """
+    Connection handed out by ConnectionPool.
+    Behaves like a mysql.connector connection, except close() returns it to the pool.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def close(self):
+        if self._connection is not None:
+            self._pool.release(self._connection)
+            self._connection = None
+
+    def discard(self):
+        """Close the connection instead of returning it to the pool"""
+        if self._connection is not None:
+            self._pool.discard(self._connection)
+            self._connection = None
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of MySQL connections shared by the whole process.
+    
+    Idle connections are reused most-recently-used first and pinged on
+    checkout when they have been idle longer than ping_interval. When all
+    max_size connections are in use, callers wait up to wait_timeout.
+    """
+
+    def __init__(self, config=None, max_size=None, wait_timeout=None, ping_interval=None):
+        self.config = config or load_db_config()
+        self.max_size = int(max_size or os.getenv('DB_POOL_SIZE', 5))
+        self.wait_timeout = float(wait_timeout or os.getenv('DB_POOL_TIMEOUT', 10))
+        self.ping_interval = float(ping_interval or os.getenv('DB_POOL_PING_INTERVAL', 30))
+        
+        self._idle = []  # (connection, released_at)
+        self._size = 0
+        self._condition = threading.Condition()
+        
+        self.stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'timeouts': 0,
+            'discarded': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+        }
+
+    def _discard(self, connection):
+        self.stats['discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, connection, released_at):
+        if time.monotonic() - released_at < self.ping_interval:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def get_connection(self):
+        """Check out a connection, waiting for one to be released if the pool is exhausted"""
+        started = time.monotonic()
+        waited = False
+        
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    connection = None
+                    self._size += 1
+                    break
+                    
+                remaining = self.wait_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolError(f"No database connection available within {self.wait_timeout}s (pool size {self.max_size})")
+                waited = True
+                self._condition.wait(remaining)
+            
+            if waited:
+                wait_time = time.monotonic() - started
+                self.stats['waits'] += 1
+                self.stats['wait_time'] += wait_time
+                self.stats['max_wait_time'] = max(self.stats['max_wait_time'], wait_time)
+
+        # Health check and connect outside the lock
+        if connection is not None and not self._is_healthy(connection, released_at):
+            with self._condition:
+                self._discard(connection)
+            connection = None
+            
+        if connection is None:
+            try:
+                connection = mysql.connector.connect(**self.config)
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self.stats['created'] += 1
+        
+        with self._condition:
+            self.stats['checkouts'] += 1
+            self.stats['in_use'] += 1
+            self.stats['peak_in_use'] = max(self.stats['peak_in_use'], self.stats['in_use'])
+            
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        """
+        Return a connection to the pool, discarding it if the rollback fails.
+        Liveness is not checked here: get_connection pings connections that
+        have been idle longer than ping_interval.
+        """
+        try:
+            # Never hand out a connection with an open transaction or a stale snapshot
+            connection.rollback()
+            reusable = True
+        except Exception:
+            reusable = False
+            
+        with self._condition:
+            self.stats['in_use'] -= 1
+            if reusable:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                self._discard(connection)
+                self._size -= 1
+            self._condition.notify()
+
+    def discard(self, connection):
+        """Close a checked-out connection that must not be reused, e.g. one left mid-result"""
+        with self._condition:
+            self.stats['in_use'] -= 1
+            self._discard(connection)
+            self._size -= 1
+            self._condition.notify()
+
+    def close_all(self):
+        """Close idle connections, e.g. on shutdown"""
+        with self._condition:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._size -= 1
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    def stats_summary(self):
+        with self._condition:
+            stats = dict(self.stats)
+            size = self._size
+            idle = len(self._idle)
+        average_wait = stats['wait_time'] / stats['waits'] if stats['waits'] else 0.0
+        return (f"size {size}/{self.max_size}, in use {stats['in_use']} (peak {stats['peak_in_use']}), idle {idle}, "
+                f"checkouts {stats['checkouts']}, created {stats['created']}, discarded {stats['discarded']}, "
+                f"waits {stats['waits']} (avg {average_wait * 1000:.1f}ms, max {stats['max_wait_time'] * 1000:.1f}ms), "
+                f"timeouts {stats['timeouts']}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
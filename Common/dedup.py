@@ -0,0 +1,180 @@
+import hashlib
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings; may report false positives, never false negatives"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def _bloom_item(user_id, timestamp):
+    return f"{user_id}|{timestamp:%Y-%m-%d %H:%M:%S}"
+
+
+class RecentKeyIndex:
+    """
+    In-memory index of the unique_clock_record keys one reader has already stored.
+
+    Device reads overlap (the ZK log is re-read on reconcile, HikVision from
+    midnight), so most records of a cycle are already in attendance. Keys
+    (user_id, timestamp) of the last DEDUP_WINDOW_HOURS are kept in hourly
+    buckets, loaded from attendance on first use and evicted as the window
+    moves; records found there are dropped before shift resolution and never
+    reach the database.
+
+    With DEDUP_BLOOM_DAYS set, keys up to that many days old are also kept in a
+    Bloom filter. Its hits are confirmed with one SELECT per batch, since a
+    false positive must not drop a new record.
+
+    Keys are only added once their batch is committed (commit()), and records
+    the index does not know are left to the INSERT as before, so rows written
+    by other processes are still handled by the unique key. Callers serialize
+    access under the manager's shift lock.
+    """
+
+    def __init__(self, device_type, device_ip, window_hours=None, bloom_days=None, bloom_capacity=None):
+        self.device_type = device_type
+        self.device_ip = device_ip
+        self.window = timedelta(hours=int(window_hours if window_hours is not None else os.getenv('DEDUP_WINDOW_HOURS', 48)))
+        self.bloom_window = timedelta(days=int(bloom_days if bloom_days is not None else os.getenv('DEDUP_BLOOM_DAYS', 0)))
+        self.bloom = None
+        if self.bloom_window > self.window:
+            self.bloom = BloomFilter(int(bloom_capacity or os.getenv('DEDUP_BLOOM_CAPACITY', 1000000)))
+        self._buckets = {}
+        self._staged = []
+        self._warmed = False
+        self._bloom_full = False
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.window > timedelta(0)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def _bucket(self, timestamp):
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+
+    def _horizons(self):
+        now = datetime.now()
+        return self._bucket(now - self.window), now - self.bloom_window
+
+    def _add(self, keys, horizon, bloom_horizon):
+        for user_id, timestamp in keys:
+            if timestamp >= horizon:
+                self._buckets.setdefault(self._bucket(timestamp), set()).add((user_id, timestamp))
+            elif self.bloom is not None and timestamp >= bloom_horizon:
+                self.bloom.add(_bloom_item(user_id, timestamp))
+        if self.bloom is not None and self.bloom.count > self.bloom.capacity and not self._bloom_full:
+            self._bloom_full = True
+            logger.warning(f"Dedup Bloom filter for {self.device_ip} holds {self.bloom.count} keys, above "
+                           f"DEDUP_BLOOM_CAPACITY={self.bloom.capacity}; its false positive rate is rising")
+
+    def _evict(self, horizon):
+        for hour in [hour for hour in self._buckets if hour < horizon]:
+            bucket = self._buckets.pop(hour)
+            if self.bloom is not None:
+                for user_id, timestamp in bucket:
+                    self.bloom.add(_bloom_item(user_id, timestamp))
+
+    def warm(self, cursor):
+        """Load the keys already stored for this reader within the index windows"""
+        self._warmed = True
+        horizon, bloom_horizon = self._horizons()
+        cursor.execute("""
+            SELECT user_id, timestamp FROM attendance
+            WHERE device_type = %s AND device_ip = %s AND timestamp >= %s
+        """, (self.device_type, self.device_ip, min(horizon, bloom_horizon)))
+        rows = cursor.fetchall()
+        self._add(((str(user_id), timestamp) for user_id, timestamp in rows), horizon, bloom_horizon)
+        logger.info(f"Dedup index for {self.device_ip} loaded {len(rows)} stored keys")
+
+    def _confirm(self, cursor, candidates):
+        """Keys of candidates that really are in attendance"""
+        timestamps = [timestamp for _, timestamp in candidates]
+        cursor.execute(f"""
+            SELECT user_id, timestamp FROM attendance
+            WHERE device_type = %s AND device_ip = %s
+            AND timestamp BETWEEN %s AND %s
+            AND (user_id, timestamp) IN ({', '.join(['(%s, %s)'] * len(candidates))})
+        """, (self.device_type, self.device_ip, min(timestamps), max(timestamps),
+              *[value for key in candidates for value in key]))
+        return {(str(user_id), timestamp) for user_id, timestamp in cursor.fetchall()}
+
+    def filter(self, cursor, records):
+        """
+        Drop records whose key is already stored, or repeated within records.
+        Returns (remaining records, number dropped).
+        """
+        self._staged = []
+        if not self.enabled or not records:
+            return records, 0
+        if not self._warmed:
+            self.warm(cursor)
+        horizon, bloom_horizon = self._horizons()
+        self._evict(horizon)
+
+        remaining = []
+        candidates = []
+        seen = set()
+        for record in records:
+            key = (record.user_id, record.timestamp)
+            if key in seen:
+                continue
+            seen.add(key)
+            if record.timestamp >= horizon:
+                bucket = self._buckets.get(self._bucket(record.timestamp))
+                if bucket is not None and key in bucket:
+                    continue
+            elif self.bloom is not None and record.timestamp >= bloom_horizon \
+                    and _bloom_item(*key) in self.bloom:
+                candidates.append(key)
+            remaining.append(record)
+
+        if candidates:
+            stored = self._confirm(cursor, candidates)
+            if stored:
+                remaining = [record for record in remaining if (record.user_id, record.timestamp) not in stored]
+
+        dropped = len(records) - len(remaining)
+        self.hits += dropped
+        self.misses += len(remaining)
+        return remaining, dropped
+
+    def stage(self, keys):
+        """Remember keys written by the current batch until it is committed"""
+        self._staged.extend(keys)
+
+    def commit(self):
+        """The current batch was committed: its keys are now known to be stored"""
+        if self._staged and self.enabled:
+            self._add(self._staged, *self._horizons())
+        self._staged = []
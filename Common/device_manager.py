@@ -0,0 +1,480 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from mysql.connector import Error
+from Common.circuit_breaker import probe_tcp
+from Common.csv_export import export_query_to_csv
+from Common.db import get_db_pool
+from Common.dedup import RecentKeyIndex
+from Common.log import DeviceLogAdapter
+from Common.metrics import metrics
+from Common.partitions import add_months, month_start
+from Common.pipeline import DatabaseSink, SyncPipeline
+from Common.shift_cache import user_shift_cache
+
+# Readers of the same type share shift flags (first IN / last OUT of a shift
+# day across all entry or exit readers), so their resolve-and-commit steps
+# are serialized while device reads stay concurrent
+_shift_locks = {}
+_shift_locks_guard = threading.Lock()
+
+# MySQL error for an unknown column (devices watermark columns before their migration ran)
+ER_BAD_FIELD_ERROR = 1054
+
+
+def _shift_lock(device_type):
+    with _shift_locks_guard:
+        return _shift_locks.setdefault(device_type, threading.Lock())
+
+
+class DeviceManager:
+    """
+    Database, shift and export logic shared by all attendance readers.
+
+    Subclasses set the class attributes below and implement the device side:
+    connect_to_device, disconnect_from_device, is_connected, ensure_connected,
+    keepalive, normalize_record, iter_batches and the sync watermark methods.
+    """
+
+    device_type = None
+    purpose = None
+    display_name = 'Device'
+    log_prefix = 'device'
+    # Which shift flag this reader sets, for the store summary
+    shift_count_key = 'shift_starts'
+
+    # Columns, header and row formatter used by export_clocking_logs
+    export_columns = "user_id, timestamp, event_type, device_type, device_ip, device_location"
+    export_header = ['User ID', 'Timestamp', 'Event Type', 'Device Type', 'Device IP', 'Device Location']
+
+    def __init__(self, ip, port, timeout, device_location):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.device_location = device_location
+        self.logger = DeviceLogAdapter(logging.getLogger(type(self).__module__), self)
+
+        # The device session is kept across sync cycles; the lock serializes
+        # commands on it and keepalives are sent when it has been idle
+        self.device_lock = threading.RLock()
+        self.keepalive_interval = int(os.getenv('DEVICE_KEEPALIVE_INTERVAL', 30))
+        self.last_activity = 0.0
+
+        # Connections come from the process-wide pool configured from DB_* variables
+        self.db_pool = get_db_pool()
+        self.db_config = self.db_pool.config
+
+        self.shift_cache = user_shift_cache
+        self.shift_lock = _shift_lock(self.device_type)
+
+        self.log_dir = os.getenv('LOG_DIR', './logs')
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        # Number of attendance records resolved and written per batch
+        self.batch_size = int(os.getenv('DB_BATCH_SIZE', 500))
+        self.watermark_supported = True
+        
+        # Months of attendance kept before setup/maintain_partitions.py archives them (0 keeps everything)
+        self.retention_months = int(os.getenv('ATTENDANCE_RETENTION_MONTHS', 0))
+        
+        # Keys this reader already stored, so re-read records skip the database
+        self.recent_keys = RecentKeyIndex(self.device_type, self.ip)
+        
+        # Local AttendanceSpool, set when device reads are spooled before MySQL
+        self.spool = None
+
+    @property
+    def name(self):
+        return f"{self.display_name} {self.ip}"
+
+    def connect_to_db(self):
+        """Check out a MySQL connection from the shared pool; close() returns it"""
+        try:
+            return self.db_pool.get_connection()
+        except Error as e:
+            self.logger.error(f"Error connecting to MySQL database: {e}")
+            return None
+
+    def get_user_shift_info(self, user_id):
+        """Get user's shift information from the shared in-memory cache"""
+        return self.shift_cache.get(user_id, self.connect_to_db)
+
+    def calculate_shift_date_range(self, timestamp, shift_start, shift_end):
+        """
+        Calculate the shift date range for a given timestamp and shift times
+        Handles night shifts that span across two days
+        """
+        record_time = timestamp.time()
+        record_date = timestamp.date()
+
+        # Convert shift times to time objects if they're strings
+        if isinstance(shift_start, str):
+            shift_start = datetime.strptime(shift_start, '%H:%M:%S').time()
+        if isinstance(shift_end, str):
+            shift_end = datetime.strptime(shift_end, '%H:%M:%S').time()
+
+        # For night shifts (end time < start time)
+        if shift_end < shift_start:
+            if record_time >= shift_start:  # After midnight, still same shift day
+                shift_date = record_date
+            else:  # Before midnight, previous day's shift
+                shift_date = record_date - timedelta(days=1)
+        else:
+            # Normal shift (same day)
+            shift_date = record_date
+
+        return shift_date
+
+    def get_shift_date(self, timestamp, shift_info):
+        """Shift day an event belongs to, stored as attendance.shift_date; None without a shift"""
+        if not shift_info or shift_info['start_time'] is None or shift_info['end_time'] is None:
+            return None
+        return self.calculate_shift_date_range(timestamp, shift_info['start_time'], shift_info['end_time'])
+
+    def test_connections(self):
+        """Test both device and database connections"""
+        self.logger.info(f"Testing {self.display_name} connections...")
+        self.logger.info(f"Device Target: {self.ip}:{self.port}")
+        self.logger.info(f"Database Target: {self.db_config['host']}:{self.db_config['port']}")
+
+        if self.connect_to_device():
+            self.logger.info(f"✓ {self.display_name} device connection successful")
+            self.disconnect_from_device()
+        else:
+            self.logger.error(f"✗ {self.display_name} device connection failed")
+
+        db_conn = self.connect_to_db()
+        if db_conn:
+            self.logger.info("✓ Database connection successful")
+            db_conn.close()
+        else:
+            self.logger.error("✗ Database connection failed")
+
+    def is_reachable(self):
+        """Fast TCP probe of the device port, run before the full protocol handshake"""
+        return probe_tcp(self.ip, self.port)
+
+    def update_device_status(self, status):
+        """Set devices.status (ONLINE/OFFLINE) for this reader"""
+        db_connection = self.connect_to_db()
+        if not db_connection:
+            return False
+
+        try:
+            cursor = db_connection.cursor()
+            cursor.execute("""
+                UPDATE devices SET status = %s WHERE device_ip = %s
+            """, (status, self.ip))
+            db_connection.commit()
+            return True
+        except Error as e:
+            self.logger.error(f"Error updating {self.display_name} device status: {e}")
+            return False
+        finally:
+            db_connection.close()
+
+    def prepare_sync(self):
+        """Hook run on the open device session before each attendance sync"""
+
+    def finish_sync(self):
+        """Hook run on the open device session after each attendance sync has been stored"""
+
+    def register_sync(self, cursor):
+        """Upsert this reader into the devices table and mark it synced"""
+        cursor.execute("""
+            INSERT INTO devices (device_type, device_ip, device_location, purpose, last_sync, status)
+            VALUES (%s, %s, %s, %s, NOW(), 'ONLINE')
+            ON DUPLICATE KEY UPDATE last_sync = NOW(), status = 'ONLINE'
+        """, (self.device_type, self.ip, self.device_location, self.purpose))
+
+    def load_sync_watermark(self, db_connection=None):
+        """
+        Read the sync watermark on db_connection, the connection the sync
+        writes through, so a sync never holds two pooled connections; without
+        one a connection is checked out for the read.
+        While this device has batches waiting in the local spool, the spool's
+        watermark is ahead of MySQL and is used instead; it is also the fallback
+        when the database is unavailable. None when the device was never synced.
+        Raises ConnectionError when the watermark cannot be read, rather than
+        restarting from the beginning of the device log.
+        """
+        if self.spool and self.spool.has_pending(self.ip):
+            watermark = self.spooled_watermark()
+            if watermark is not None:
+                return watermark
+                
+        if db_connection is not None:
+            return self.get_sync_watermark(db_connection.cursor(buffered=True))
+            
+        db_connection = self.connect_to_db()
+        if not db_connection:
+            watermark = self.spooled_watermark() if self.spool else None
+            if watermark is None:
+                raise ConnectionError(f"Database is unavailable, cannot read the {self.display_name} sync watermark")
+            return watermark
+        try:
+            return self.get_sync_watermark(db_connection.cursor(buffered=True))
+        finally:
+            db_connection.close()
+
+    def spooled_watermark(self):
+        """
+        The spool keeps watermarks as update_sync_watermark arguments; return
+        it in get_sync_watermark's form, or None
+        """
+        return self.spool.local_watermark(self.ip)
+
+    def archive_cutoff(self):
+        """Start of the oldest month still kept in attendance, or None without a retention window"""
+        if not self.retention_months:
+            return None
+        return datetime.combine(add_months(month_start(datetime.now()), -self.retention_months), datetime.min.time())
+
+    def raw_user_id(self, record):
+        """User ID of a raw device record, for error messages"""
+        return getattr(record, 'user_id', 'Unknown')
+
+    def normalize_records(self, records):
+        """
+        Normalization stage: convert raw device records to AttendanceEvents once,
+        skipping records normalize_record returns None for.
+        Returns (AttendanceEvents, error count).
+        """
+        normalize = self.normalize_record
+        normalized = []
+        errors = 0
+        for record in records:
+            try:
+                event = normalize(record)
+            except Exception as e:
+                self.logger.error("Unexpected error for %s record %s: %s", self.display_name,
+                                  self.raw_user_id(record), e, extra={'rate_key': 'parse_record'})
+                errors += 1
+                continue
+            if event is not None:
+                normalized.append(event)
+        metrics.inc(self, 'parse_errors', errors)
+        return normalized, errors
+
+    def _insert_attendance_batch(self, cursor, rows):
+        """
+        Insert a batch of attendance rows with a single multi-row INSERT.
+        Duplicates of unique_clock_record missed by the recent key index are
+        skipped by the server, so the
+        affected row count is the number of new records.
+        Returns a (new, duplicate, error) tuple.
+        """
+        insert_query = """
+            INSERT INTO attendance (
+                user_id, employee_name, timestamp, shift_date, event_type,
+                status_code, status_description, device_type,
+                device_ip, device_location, verification_mode,
+                shift_id, shift_name, is_shift_start, is_shift_end
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """
+        if not rows:
+            return 0, 0, 0
+
+        try:
+            cursor.executemany(insert_query, rows)
+            new_count = cursor.rowcount
+            return new_count, len(rows) - new_count, 0
+        except Error as e:
+            self.logger.warning("Batch insert of %d %s records failed, retrying individually: %s",
+                                len(rows), self.display_name, e, extra={'rate_key': 'batch_insert'})
+
+        # Fall back to row-by-row inserts so one bad record does not drop the batch
+        new_count = duplicate_count = error_count = 0
+        for row in rows:
+            try:
+                cursor.execute(insert_query, row)
+                if cursor.rowcount == 1:
+                    new_count += 1
+                else:
+                    duplicate_count += 1
+            except Error as e:
+                # Per-record messages are rate limited and formatted on the logging thread
+                self.logger.error("Error inserting %s record for user %s: %s",
+                                  self.display_name, row[0], e, extra={'rate_key': 'insert_record'})
+                error_count += 1
+        return new_count, duplicate_count, error_count
+
+    def store_batch(self, cursor, records, counts):
+        """
+        Resolve shift flags for and insert one batch of AttendanceEvents, updating counts in place.
+        Callers commit the batch with commit_batch.
+        """
+        before = dict(counts)
+        
+        # Events from archived months are no longer in attendance's unique key and
+        # would be stored again on a full device reconcile, so they count as duplicates
+        cutoff = self.archive_cutoff()
+        if cutoff and records:
+            kept = [record for record in records if record.timestamp >= cutoff]
+            counts['duplicates'] += len(records) - len(kept)
+            records = kept
+            
+        # Records this reader already stored are dropped before any shift or insert work
+        with metrics.timer(self, 'dedup'):
+            records, known = self.recent_keys.filter(cursor, records)
+        counts['duplicates'] += known
+        if not records:
+            metrics.add_counts(self, {key: counts[key] - before[key] for key in counts})
+            return
+
+        # Get user shift information and resolve shift flags for the whole batch
+        with metrics.timer(self, 'shift_lookup'):
+            shift_infos = [self.get_user_shift_info(record.user_id) for record in records]
+            events = [
+                (record.user_id, record.timestamp, self.get_shift_date(record.timestamp, shift_info))
+                for record, shift_info in zip(records, shift_infos)
+            ]
+            flags = self.shift_resolver.resolve(cursor, events)
+
+        # Rows are grouped by shift flags so the affected row count
+        # also tells us how many new records started or ended a shift
+        groups = {}
+
+        for record, shift_info, (_, _, shift_date), (event_type, is_shift_start, is_shift_end) in zip(
+                records, shift_infos, events, flags):
+            try:
+                # Get user details
+                employee_name = record.employee_name or f"User_{record.user_id}"
+                shift_id = None
+                shift_name = None
+
+                if shift_info:
+                    employee_name = shift_info['name']
+                    shift_id = shift_info['shift_id']
+                    shift_name = shift_info['shift_name']
+
+                row = (
+                    record.user_id,
+                    employee_name,
+                    record.timestamp,
+                    shift_date,
+                    event_type,
+                    record.status_code,
+                    record.status_description,
+                    self.device_type,
+                    self.ip,
+                    self.device_location,
+                    record.verification_mode,
+                    shift_id,
+                    shift_name,
+                    is_shift_start,
+                    is_shift_end
+                )
+                groups.setdefault((bool(is_shift_start), bool(is_shift_end)), []).append(row)
+
+            except Exception as e:
+                self.logger.error("Unexpected error for %s record %s: %s",
+                                  self.display_name, record.user_id, e, extra={'rate_key': 'prepare_record'})
+                counts['errors'] += 1
+
+        with metrics.timer(self, 'insert'):
+            for (is_shift_start, is_shift_end), rows in groups.items():
+                new_count, duplicate_count, error_count = self._insert_attendance_batch(cursor, rows)
+                if not error_count:
+                    self.recent_keys.stage((row[0], row[2]) for row in rows)
+                counts['new'] += new_count
+                counts['duplicates'] += duplicate_count
+                counts['errors'] += error_count
+                if is_shift_start:
+                    counts['shift_starts'] += new_count
+                if is_shift_end:
+                    counts['shift_ends'] += new_count
+                    
+        # Keep the per-day summary in step, in the same transaction as the new rows
+        if counts['new'] > before['new']:
+            with metrics.timer(self, 'daily_summary'):
+                self.daily_summary.update(cursor, {
+                    (str(user_id), shift_date): shift_info['shift_id']
+                    for (user_id, _, shift_date), shift_info in zip(events, shift_infos)
+                    if shift_date is not None
+                })
+                    
+        metrics.add_counts(self, {key: counts[key] - before[key] for key in counts})
+
+    def commit_batch(self, db_connection):
+        """Commit a stored batch; only then are its keys added to the recent key index"""
+        db_connection.commit()
+        self.recent_keys.commit()
+
+    def report_counts(self, counts, label='attendance'):
+        """Log the outcome of a store run"""
+        shift_label = self.shift_count_key.replace('_', ' ').title()
+        self.logger.info(f"{self.display_name} {label} - New: {counts['new']}, {shift_label}: {counts[self.shift_count_key]}, Duplicates: {counts['duplicates']}, Errors: {counts['errors']}")
+
+    def store_attendance_to_db(self, **fetch_options):
+        """
+        Store attendance records from the device to the database with shift logic.
+        fetch_options are passed to iter_batches; returns True when new records were stored.
+        """
+        return SyncPipeline(self, [DatabaseSink(self)]).run(**fetch_options)['database']
+
+    def clocking_log_options(self):
+        """iter_batches options covering the records main.py's clocking log has always listed"""
+        return {}
+
+    def format_export_row(self, row):
+        return list(row)
+
+    def export_clocking_logs(self, filename=None, start_time=None, end_time=None, compress=None):
+        """
+        Export this device's attendance records from the database to a CSV file.
+        Streams rows for [start_time, end_time) (default: today) straight from the
+        attendance table, optionally gzip-compressed, with no per-row queries.
+        """
+        if not filename:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"{self.log_prefix}_attendance_{timestamp}.csv"
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if start_time is None:
+            start_time = today
+        if end_time is None:
+            end_time = today + timedelta(days=1)
+        if compress is None:
+            compress = os.getenv('EXPORT_COMPRESS', 'false').lower() in ('1', 'true', 'yes')
+
+        log_path = os.path.join(self.log_dir, filename)
+
+        self.logger.info(f"Exporting {self.display_name} attendance logs to {log_path}...")
+
+        db_connection = self.connect_to_db()
+        if not db_connection:
+            return False
+
+        try:
+            log_path, row_count = export_query_to_csv(
+                db_connection,
+                log_path,
+                f"""
+                SELECT {self.export_columns}
+                FROM attendance
+                WHERE device_type = %s
+                AND device_ip = %s
+                AND timestamp >= %s AND timestamp < %s
+                ORDER BY timestamp
+                """,
+                (self.device_type, self.ip, start_time, end_time),
+                self.export_header,
+                format_row=self.format_export_row,
+                compress=compress
+            )
+
+            if not row_count:
+                self.logger.info(f"No {self.display_name} attendance records found")
+                os.remove(log_path)
+                return False
+
+            self.logger.info(f"Successfully exported {row_count} {self.display_name} records to {log_path}")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Error exporting {self.display_name} logs: {str(e)}")
+            return False
+        finally:
+            db_connection.close()
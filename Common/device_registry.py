@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+from mysql.connector import Error
+from Common.db import get_db_pool
+from HikVisionDevice.manager import HikVisionDeviceManager
+from ZKDevice.manager import ZKDeviceManager
+
+logger = logging.getLogger(__name__)
+
+# MySQL error for an unknown column (devices.polled before its migration ran)
+ER_BAD_FIELD_ERROR = 1054
+
+MANAGER_CLASSES = {
+    'ZK': ZKDeviceManager,
+    'HIKVISION': HikVisionDeviceManager,
+}
+
+
+def load_config_file(path):
+    """
+    Read the device list from a JSON file: a list of objects with device_type
+    and device_ip, and optionally device_port, device_location, device_name,
+    username, password, sync_interval, sync_deadline and enabled.
+    """
+    with open(path, encoding='utf-8') as f:
+        devices = json.load(f)
+    if isinstance(devices, dict):
+        devices = devices.get('devices', [])
+    return [device for device in devices if device.get('enabled', True)]
+
+
+def load_devices_table():
+    """
+    Read the device list from the devices table: the rows marked polled, except
+    readers in MAINTENANCE. Rows are also upserted by every sync, so only the
+    polled flag makes a row a configured reader.
+    """
+    try:
+        db_connection = get_db_pool().get_connection()
+    except Error as e:
+        logger.error(f"Error loading devices from database: {e}")
+        return []
+
+    try:
+        # SELECT * so optional columns (e.g. device_port) are used when present
+        cursor = db_connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM devices WHERE polled AND status <> 'MAINTENANCE' ORDER BY id")
+        return cursor.fetchall()
+    except Error as e:
+        if e.errno == ER_BAD_FIELD_ERROR:
+            logger.warning("devices.polled is missing, run setup/migrate.py to poll readers from the devices table")
+            return []
+        logger.error(f"Error loading devices from database: {e}")
+        return []
+    finally:
+        db_connection.close()
+
+
+def load_device_configs():
+    """
+    Return the configured readers as a list of dicts.
+    DEVICES_CONFIG (a JSON file) takes precedence over the polled rows of the
+    devices table; with neither, the single ZK_* / HIK_* reader pair from the
+    environment is used.
+    """
+    config_path = os.getenv('DEVICES_CONFIG')
+    if config_path:
+        devices = load_config_file(config_path)
+        source = config_path
+    else:
+        devices = load_devices_table()
+        source = 'devices table'
+
+    devices = [device for device in devices if device.get('device_type') in MANAGER_CLASSES]
+    if devices:
+        logger.info(f"Loaded {len(devices)} devices from {source}")
+        return devices
+
+    logger.info("No devices configured, using HIK_* and ZK_* environment settings")
+    return [{'device_type': 'HIKVISION'}, {'device_type': 'ZK'}]
+
+
+def create_manager(config):
+    """Build the device manager for one registry entry; unset fields fall back to the environment"""
+    manager_class = MANAGER_CLASSES[config['device_type']]
+    options = {
+        'ip': config.get('device_ip'),
+        'port': config.get('device_port'),
+        'timeout': config.get('timeout'),
+        'device_location': config.get('device_location'),
+    }
+    if manager_class is HikVisionDeviceManager:
+        options['username'] = config.get('username')
+        options['password'] = config.get('password')
+    return manager_class(**options)
+
+
+def load_managers():
+    """Create a manager for every configured reader"""
+    return [create_manager(config) for config in load_device_configs()]
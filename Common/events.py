@@ -0,0 +1,59 @@
+import sys
+from datetime import datetime
+
+
+def intern_id(value):
+    """Share one string object per user ID / device code across all events in the process"""
+    return sys.intern(str(value))
+
+
+def parse_iso_timestamp(value):
+    """
+    Parse an ISO-8601 device time such as '2026-01-05T08:00:00+08:00',
+    '2026-01-05T00:00:00Z' or '2026-01-05 08:00:00'.
+    Returns (wall-clock datetime without tzinfo, UTC offset in minutes or None),
+    so the local time stored in attendance is unchanged and the offset is kept.
+    """
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    offset = parsed.utcoffset()
+    if offset is None:
+        return parsed, None
+    return parsed.replace(tzinfo=None), int(offset.total_seconds()) // 60
+
+
+class AttendanceEvent:
+    """
+    Device-independent form of one clock event, built once per record when it is read.
+
+    timestamp is the device's wall-clock time as stored in attendance (no
+    tzinfo); utc_offset is the offset the device reported, in minutes, or
+    None when it sent none. user_id is interned, so events of the same user
+    share one string.
+    """
+
+    __slots__ = ('user_id', 'timestamp', 'utc_offset', 'status_code', 'status_description',
+                 'employee_name', 'verification_mode')
+
+    def __init__(self, user_id, timestamp, status_code=None, status_description=None,
+                 employee_name=None, verification_mode=None, utc_offset=None):
+        self.user_id = intern_id(user_id)
+        self.timestamp = timestamp
+        self.utc_offset = utc_offset
+        self.status_code = status_code
+        self.status_description = status_description
+        self.employee_name = employee_name
+        self.verification_mode = verification_mode
+
+    def isoformat(self):
+        """Timestamp with its UTC offset when known, e.g. for the spool; parse_iso_timestamp reverses it"""
+        text = self.timestamp.isoformat()
+        if self.utc_offset is None:
+            return text
+        sign = '-' if self.utc_offset < 0 else '+'
+        hours, minutes = divmod(abs(self.utc_offset), 60)
+        return f"{text}{sign}{hours:02d}:{minutes:02d}"
+
+    def __repr__(self):
+        return f"AttendanceEvent(user_id={self.user_id!r}, timestamp={self.isoformat()!r})"
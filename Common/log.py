@@ -0,0 +1,174 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Extra record attributes carried into the JSON output
+CONTEXT_FIELDS = ('device', 'device_type', 'device_ip', 'device_location', 'suppressed')
+
+_listener = None
+_listener_guard = threading.Lock()
+
+
+def _env_flag(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the record's device context"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `limit` records per `window` seconds for each
+    (logger, device, rate_key). Records without a rate_key are never limited.
+    The first record let through after a suppressed stretch carries the
+    number of records dropped in its `suppressed` attribute.
+    """
+
+    def __init__(self, limit=None, window=None):
+        super().__init__()
+        self.limit = int(limit or os.getenv('LOG_RATE_LIMIT', 10))
+        self.window = float(window or os.getenv('LOG_RATE_WINDOW', 60))
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def filter(self, record):
+        rate_key = getattr(record, 'rate_key', None)
+        if rate_key is None:
+            return True
+
+        key = (record.name, getattr(record, 'device_ip', None), rate_key)
+        now = time.monotonic()
+        with self._lock:
+            window_start, emitted, suppressed = self._buckets.get(key, (now, 0, 0))
+            if now - window_start >= self.window:
+                window_start, emitted = now, 0
+            if emitted >= self.limit:
+                self._buckets[key] = (window_start, emitted, suppressed + 1)
+                return False
+            self._buckets[key] = (window_start, emitted + 1, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Queue the record itself; message formatting, JSON encoding and file I/O
+    all happen on the listener thread. Records stay in-process, so only the
+    traceback is rendered here (it cannot outlive the calling frame).
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class DeviceLogAdapter(logging.LoggerAdapter):
+    """Adds the reader's identity to every record logged through it"""
+
+    def __init__(self, logger, manager):
+        super().__init__(logger, {
+            'device': manager.name,
+            'device_type': manager.device_type,
+            'device_ip': manager.ip,
+            'device_location': manager.device_location,
+        })
+
+    def process(self, msg, kwargs):
+        kwargs['extra'] = {**self.extra, **kwargs.get('extra', {})}
+        return msg, kwargs
+
+
+def setup_logging(log_file=None, console=None, level=None):
+    """
+    Route all logging through a queue drained by a background listener thread.
+
+    log_file receives JSON lines (LOG_FORMAT=text for the plain format); the
+    console gets plain text and is on by default only when stdout is a
+    terminal (LOG_CONSOLE overrides), since a Windows service has nobody
+    reading it. Calling again once configured keeps the first setup.
+    Returns the QueueListener.
+    """
+    global _listener
+    with _listener_guard:
+        if _listener is not None:
+            return _listener
+
+        if console is None:
+            console = _env_flag('LOG_CONSOLE', bool(sys.stdout and sys.stdout.isatty()))
+        level = level or os.getenv('LOG_LEVEL', 'INFO').upper()
+
+        handlers = []
+        if log_file:
+            file_handler = logging.FileHandler(log_file, encoding='utf-8')
+            if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+                file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+            else:
+                file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        if console and sys.stdout:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+            handlers.append(console_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _listener_guard:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
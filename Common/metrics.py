@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{str(value)}"' for key, value in labels.items())
+
+
+class MetricsRegistry:
+    """
+    In-memory sync metrics for the whole process.
+
+    Per-device phase timings and record counters are updated by the sync
+    path; /metrics, /health and /ready are rendered from this state only, so
+    scraping never touches the database or the devices.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._counters = {}
+        self._devices = {}
+        self._collectors = []
+        self.started_at = time.time()
+        self.heartbeat_at = None
+        self.polled_devices = 0
+
+    @staticmethod
+    def _key(manager):
+        return manager.device_type, manager.ip
+
+    @contextmanager
+    def timer(self, manager, phase):
+        """Add the time spent in the block to the device's phase total"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            key = (*self._key(manager), phase)
+            with self._lock:
+                total, count = self._phases.get(key, (0.0, 0))
+                self._phases[key] = (total + elapsed, count + 1)
+
+    def inc(self, manager, name, value=1):
+        if not value:
+            return
+        key = (*self._key(manager), name)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_counts(self, manager, counts):
+        """Add a store counts dict (new, duplicates, errors, shift_starts, shift_ends)"""
+        for name, value in counts.items():
+            self.inc(manager, name, value)
+
+    def sync_finished(self, manager, outcome, duration, circuit_state):
+        """Record the end of one device sync; outcome is success, no_data, failure or deadline"""
+        self.inc(manager, f"sync_{outcome}")
+        now = time.time()
+        with self._lock:
+            state = self._devices.setdefault(self._key(manager), {})
+            state['last_attempt'] = now
+            state['last_duration'] = duration
+            state['circuit_state'] = circuit_state
+            state['last_outcome'] = outcome
+            if outcome in ('success', 'no_data'):
+                state['last_success'] = now
+
+    def heartbeat(self):
+        self.heartbeat_at = time.time()
+
+    def add_collector(self, collector):
+        """collector() returns extra (name, type, help, value) gauges, e.g. pool statistics"""
+        self._collectors.append(collector)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            phases = dict(self._phases)
+            counters = dict(self._counters)
+            devices = {key: dict(state) for key, state in self._devices.items()}
+
+        lines.append("# HELP attendance_phase_seconds Time spent per device and sync phase")
+        lines.append("# TYPE attendance_phase_seconds summary")
+        for (device_type, device_ip, phase), (total, count) in sorted(phases.items()):
+            labels = _labels(device_type=device_type, device_ip=device_ip, phase=phase)
+            lines.append(f"attendance_phase_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"attendance_phase_seconds_count{{{labels}}} {count}")
+
+        lines.append("# HELP attendance_events_total Records and syncs per device")
+        lines.append("# TYPE attendance_events_total counter")
+        for (device_type, device_ip, name), value in sorted(counters.items()):
+            labels = _labels(device_type=device_type, device_ip=device_ip, event=name)
+            lines.append(f"attendance_events_total{{{labels}}} {value}")
+
+        lines.append("# HELP attendance_last_sync_success_timestamp_seconds Last successful sync per device")
+        lines.append("# TYPE attendance_last_sync_success_timestamp_seconds gauge")
+        for (device_type, device_ip), state in sorted(devices.items()):
+            if 'last_success' in state:
+                labels = _labels(device_type=device_type, device_ip=device_ip)
+                lines.append(f"attendance_last_sync_success_timestamp_seconds{{{labels}}} {state['last_success']:.3f}")
+
+        lines.append("# HELP attendance_last_sync_duration_seconds Duration of the last sync per device")
+        lines.append("# TYPE attendance_last_sync_duration_seconds gauge")
+        for (device_type, device_ip), state in sorted(devices.items()):
+            labels = _labels(device_type=device_type, device_ip=device_ip)
+            lines.append(f"attendance_last_sync_duration_seconds{{{labels}}} {state.get('last_duration', 0):.3f}")
+
+        lines.append("# HELP attendance_device_up 1 while the device circuit is closed")
+        lines.append("# TYPE attendance_device_up gauge")
+        for (device_type, device_ip), state in sorted(devices.items()):
+            labels = _labels(device_type=device_type, device_ip=device_ip)
+            lines.append(f"attendance_device_up{{{labels}}} {int(state.get('circuit_state') == 'CLOSED')}")
+
+        if self.heartbeat_at:
+            lines.append("# TYPE attendance_loop_heartbeat_timestamp_seconds gauge")
+            lines.append(f"attendance_loop_heartbeat_timestamp_seconds {self.heartbeat_at:.3f}")
+
+        for collector in self._collectors:
+            try:
+                for name, metric_type, help_text, value in collector():
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    lines.append(f"{name} {value}")
+            except Exception as e:
+                lines.append(f"# collector error: {e}")
+
+        return '\n'.join(lines) + '\n'
+
+    def health(self, max_heartbeat_age):
+        """Liveness: the scheduler loop has ticked recently"""
+        now = time.time()
+        age = now - self.heartbeat_at if self.heartbeat_at else None
+        healthy = age is not None and age <= max_heartbeat_age
+        return healthy, {'status': 'ok' if healthy else 'stalled', 'heartbeat_age': age,
+                         'uptime': now - self.started_at}
+
+    def ready(self, max_sync_age):
+        """Readiness: at least one polled device synced within max_sync_age (or nothing is polled)"""
+        now = time.time()
+        with self._lock:
+            devices = {f"{device_type} {device_ip}": dict(state)
+                       for (device_type, device_ip), state in self._devices.items()}
+        recent = [name for name, state in devices.items()
+                  if state.get('last_success') and now - state['last_success'] <= max_sync_age]
+        ready = bool(self.heartbeat_at) and (bool(recent) or not self.polled_devices)
+        return ready, {
+            'status': 'ready' if ready else 'not ready',
+            'devices': {
+                name: {
+                    'last_outcome': state.get('last_outcome'),
+                    'circuit_state': state.get('circuit_state'),
+                    'last_success_age': now - state['last_success'] if state.get('last_success') else None,
+                }
+                for name, state in devices.items()
+            },
+        }
+
+
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            self._send(200, server.registry.render(), 'text/plain; version=0.0.4')
+        elif path == '/health':
+            ok, body = server.registry.health(server.max_heartbeat_age)
+            self._send(200 if ok else 503, json.dumps(body), 'application/json')
+        elif path == '/ready':
+            ok, body = server.registry.ready(server.max_sync_age)
+            self._send(200 if ok else 503, json.dumps(body), 'application/json')
+        else:
+            self._send(404, 'not found\n', 'text/plain')
+
+
+class MetricsServer:
+    """Serves /metrics, /health and /ready from a MetricsRegistry on a background thread"""
+
+    def __init__(self, registry=None, host=None, port=None, max_heartbeat_age=None, max_sync_age=None):
+        self.host = host or os.getenv('METRICS_HOST', '127.0.0.1')
+        self.port = int(port if port is not None else os.getenv('METRICS_PORT', 9108))
+        self.httpd = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry or metrics
+        self.httpd.max_heartbeat_age = float(max_heartbeat_age or os.getenv('HEALTH_MAX_HEARTBEAT_AGE', 30))
+        self.httpd.max_sync_age = float(max_sync_age or os.getenv('READY_MAX_SYNC_AGE', 300))
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,171 @@
+import logging
+import os
+from datetime import date, datetime
+from Common.csv_export import export_query_to_csv
+
+logger = logging.getLogger(__name__)
+
+# attendance columns, in table order, copied to attendance_archive
+ATTENDANCE_COLUMNS = (
+    "id, user_id, employee_name, timestamp, shift_date, event_type, status_code, "
+    "status_description, device_type, device_ip, device_location, verification_mode, "
+    "shift_id, shift_name, is_shift_start, is_shift_end, created_at, updated_at"
+)
+
+ARCHIVE_CHUNK_SIZE = 10000
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Partitions are named after the month they hold: p202601 is [2026-01-01, 2026-02-01)"""
+    return f"p{month.year:04d}{month.month:02d}"
+
+
+def partition_definitions(first_month, last_month):
+    """PARTITION clauses for every month from first_month to last_month, followed by pmax"""
+    definitions = []
+    month = first_month
+    while month <= last_month:
+        definitions.append(
+            f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1).isoformat()} 00:00:00')"
+        )
+        month = add_months(month, 1)
+    definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return definitions
+
+
+def list_partitions(cursor, table='attendance'):
+    """
+    Return [(name, upper bound as a date, or None for MAXVALUE)] in order,
+    or [] when the table is not partitioned.
+    """
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    partitions = []
+    for name, description in cursor.fetchall():
+        if description == 'MAXVALUE':
+            partitions.append((name, None))
+        else:
+            partitions.append((name, datetime.strptime(description.strip("'")[:10], '%Y-%m-%d').date()))
+    return partitions
+
+
+def ensure_future_partitions(connection, months_ahead, today=None):
+    """
+    Split pmax so every month up to months_ahead from now has its own partition.
+    When only pmax exists, history is split from the month of the oldest event.
+    Returns the names of the partitions added.
+    """
+    cursor = connection.cursor()
+    partitions = list_partitions(cursor)
+    if not partitions:
+        logger.warning("attendance is not partitioned; run setup/migrate.py first")
+        return []
+
+    bounds = [upper for _, upper in partitions if upper is not None]
+    if bounds:
+        first_month = max(bounds)
+    else:
+        cursor.execute("SELECT MIN(timestamp) FROM attendance")
+        oldest = cursor.fetchone()[0]
+        first_month = month_start(oldest or today or date.today())
+    last_month = add_months(month_start(today or date.today()), months_ahead)
+    if first_month > last_month:
+        return []
+
+    definitions = partition_definitions(first_month, last_month)
+    cursor.execute(f"ALTER TABLE attendance REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})")
+    added = [definition.split()[1] for definition in definitions[:-1]]
+    logger.info(f"Added attendance partitions {added[0]} to {added[-1]}")
+    return added
+
+
+def _archive_to_table(connection, name):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT MIN(id), MAX(id), COUNT(*) FROM attendance PARTITION ({name})")
+    first_id, last_id, row_count = cursor.fetchone()
+    if not row_count:
+        return 0
+
+    # INSERT IGNORE on (id, timestamp) makes an interrupted archive safe to re-run
+    for start in range(first_id, last_id + 1, ARCHIVE_CHUNK_SIZE):
+        cursor.execute(f"""
+            INSERT IGNORE INTO attendance_archive ({ATTENDANCE_COLUMNS})
+            SELECT {ATTENDANCE_COLUMNS}
+            FROM attendance PARTITION ({name})
+            WHERE id >= %s AND id < %s
+        """, (start, start + ARCHIVE_CHUNK_SIZE))
+        connection.commit()
+
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM attendance_archive a
+        JOIN attendance PARTITION ({name}) p ON p.id = a.id AND p.timestamp = a.timestamp
+    """)
+    archived = cursor.fetchone()[0]
+    if archived != row_count:
+        raise RuntimeError(f"only {archived} of {row_count} rows of {name} reached attendance_archive")
+    return row_count
+
+
+def _archive_to_file(connection, name, archive_dir):
+    os.makedirs(archive_dir, exist_ok=True)
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM attendance PARTITION ({name})")
+    row_count = cursor.fetchone()[0]
+    if not row_count:
+        return 0
+
+    path, written = export_query_to_csv(
+        connection,
+        os.path.join(archive_dir, f"attendance_{name}.csv"),
+        f"SELECT {ATTENDANCE_COLUMNS} FROM attendance PARTITION ({name}) ORDER BY timestamp",
+        (),
+        [column.strip() for column in ATTENDANCE_COLUMNS.split(',')],
+        compress=True
+    )
+    if written != row_count:
+        raise RuntimeError(f"only {written} of {row_count} rows of {name} were written to {path}")
+    logger.info(f"Archived {name} to {path}")
+    return row_count
+
+
+def archive_partitions(connection, retention_months, archive_dir=None, today=None, dry_run=False):
+    """
+    Move every monthly partition that ends more than retention_months before
+    the current month out of attendance, then drop it.
+
+    Rows go to the compressed attendance_archive table, or to a gzip CSV per
+    partition in archive_dir when one is given. A partition is dropped only
+    after all of its rows are confirmed archived. attendance_daily keeps its
+    rows for archived months. Returns [(partition name, rows archived)].
+    """
+    cursor = connection.cursor()
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    expired = [name for name, upper in list_partitions(cursor) if upper is not None and upper <= cutoff]
+
+    archived = []
+    for name in expired:
+        if dry_run:
+            logger.info(f"Would archive and drop {name}")
+            continue
+        if archive_dir:
+            row_count = _archive_to_file(connection, name, archive_dir)
+        else:
+            row_count = _archive_to_table(connection, name)
+        cursor.execute(f"ALTER TABLE attendance DROP PARTITION {name}")
+        logger.info(f"Archived {row_count} rows and dropped partition {name}")
+        archived.append((name, row_count))
+    return archived
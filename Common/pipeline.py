@@ -0,0 +1,252 @@
+import csv
+import os
+from datetime import datetime
+from Common.metrics import metrics
+
+
+class AttendanceBatch:
+    """
+    A chunk of AttendanceEvents read from one device during a sync cycle.
+    
+    watermark holds the arguments for the manager's update_sync_watermark
+    once this batch is committed; errors counts records that could not be
+    normalized. stored batches hold records an earlier sync already
+    committed, read only for sinks that list the whole log (the clocking
+    log); the database and spool sinks skip them.
+    """
+
+    def __init__(self, device_type, device_ip, device_location, records, watermark=None, errors=0, stored=False):
+        self.device_type = device_type
+        self.device_ip = device_ip
+        self.device_location = device_location
+        self.records = records
+        self.watermark = watermark
+        self.errors = errors
+        self.stored = stored
+
+    def __len__(self):
+        return len(self.records)
+
+
+class AttendanceSink:
+    """Destination for the batches read from a device. Subclasses implement write()."""
+
+    name = 'sink'
+
+    def open(self):
+        """Prepare the sink before the first batch; raise if it cannot be used"""
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def close(self):
+        """Finish the run; returns the sink's result"""
+        return True
+
+
+class DatabaseSink(AttendanceSink):
+    """Writes batches to MySQL through the manager's shift/insert path, committing the watermark per batch"""
+
+    name = 'database'
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.db_connection = None
+        self.cursor = None
+        self.counts = None
+        self.advance_watermark = True
+
+    def open(self):
+        self.db_connection = self.manager.connect_to_db()
+        if not self.db_connection:
+            raise ConnectionError("Database is unavailable")
+            
+        try:
+            # Reload user shift map only if users/shifts changed since the last sync
+            self.manager.shift_cache.refresh(self.db_connection)
+            
+            self.cursor = self.db_connection.cursor()
+            self.manager.register_sync(self.cursor)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.close()
+            self.db_connection = None
+            raise
+        
+        self.counts = {'new': 0, 'duplicates': 0, 'errors': 0, 'shift_starts': 0, 'shift_ends': 0}
+        self.advance_watermark = True
+
+    def write(self, batch):
+        if batch.stored:
+            return
+        batch_errors = self.counts['errors']
+        self.counts['errors'] += batch.errors
+        
+        # Readers of the same type resolve shift flags against each other's rows
+        with self.manager.shift_lock:
+            self.manager.store_batch(self.cursor, batch.records, self.counts)
+            
+            # Stop advancing the watermark once a batch has errors so the failed
+            # records are read again next cycle
+            if self.counts['errors'] > batch_errors:
+                self.advance_watermark = False
+            if self.advance_watermark and batch.watermark:
+                self.manager.update_sync_watermark(self.cursor, *batch.watermark)
+            with metrics.timer(self.manager, 'commit'):
+                self.manager.commit_batch(self.db_connection)
+
+    def stored_rows(self, batch, columns):
+        """
+        The attendance rows (columns, starting with user_id, timestamp) stored for
+        the batch's records, keyed by (user_id, timestamp). Read on the sink's own
+        connection once write() has resolved the batch.
+        """
+        if not self.cursor or not batch.records:
+            return {}
+        timestamps = [record.timestamp for record in batch.records]
+        self.cursor.execute(f"""
+            SELECT {columns} FROM attendance
+            WHERE device_type = %s AND device_ip = %s AND timestamp BETWEEN %s AND %s
+        """, (batch.device_type, batch.device_ip, min(timestamps), max(timestamps)))
+        return {(str(row[0]), row[1]): row for row in self.cursor.fetchall()}
+
+    def close(self):
+        if not self.db_connection:
+            return False
+        self.db_connection.close()
+        self.db_connection = None
+        self.manager.report_counts(self.counts)
+        return self.counts['new'] > 0
+
+
+class CsvLogSink(AttendanceSink):
+    """
+    Writes the records read in this run to a clocking log CSV in the manager's
+    log directory, in the manager's export columns.
+    
+    With database set to the run's DatabaseSink (listed before this sink), the
+    Event Type and Shift Start/End columns are those the database sink resolved
+    and stored; otherwise the shift flags are left as No.
+    """
+
+    name = 'csv'
+
+    def __init__(self, manager, filename=None, database=None):
+        self.manager = manager
+        self.filename = filename
+        self.database = database
+        self.columns = [column.strip() for column in manager.export_columns.split(',')]
+        self.path = None
+        self.file = None
+        self.writer = None
+        self.row_count = 0
+
+    def open(self):
+        filename = self.filename
+        if not filename:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"{self.manager.log_prefix}_attendance_{timestamp}.csv"
+        self.path = os.path.join(self.manager.log_dir, filename)
+        self.file = open(self.path, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.manager.export_header)
+        self.row_count = 0
+
+    def unresolved_row(self, batch, record):
+        """An export row built from the record alone, for records the database sink has not stored"""
+        values = {
+            'user_id': record.user_id,
+            'timestamp': record.timestamp,
+            'status_code': record.status_code if record.status_code is not None else '',
+            'status_description': record.status_description,
+            'employee_name': record.employee_name or '',
+            'verification_mode': record.verification_mode,
+            'event_type': self.manager.shift_resolver.event_type,
+            'device_type': batch.device_type,
+            'device_ip': batch.device_ip,
+            'device_location': batch.device_location,
+            'is_shift_start': False,
+            'is_shift_end': False
+        }
+        return tuple(values[column] for column in self.columns)
+
+    def write(self, batch):
+        stored = {}
+        if self.database:
+            try:
+                stored = self.database.stored_rows(batch, self.manager.export_columns)
+            except Exception as e:
+                self.manager.logger.warning(f"Could not read stored shift flags for the clocking log: {e}")
+                self.database = None
+        self.writer.writerows(
+            self.manager.format_export_row(
+                stored.get((record.user_id, record.timestamp)) or self.unresolved_row(batch, record)
+            )
+            for record in batch.records
+        )
+        self.row_count += len(batch.records)
+
+    def close(self):
+        if not self.file:
+            return False
+        self.file.close()
+        self.file = None
+        if not self.row_count:
+            os.remove(self.path)
+            return False
+        self.manager.logger.info(f"Wrote {self.row_count} records to {self.path}")
+        return True
+
+
+class SyncPipeline:
+    """
+    Reads a device once per run and fans every batch out to all sinks.
+    
+    The manager provides iter_batches(); adding a sink never adds another
+    device fetch. A sink that fails is dropped for the rest of the run
+    without affecting the others.
+    """
+
+    def __init__(self, manager, sinks):
+        self.manager = manager
+        self.sinks = sinks
+
+    def run(self, **fetch_options):
+        """Run one sync; returns {sink name: result}"""
+        opened = []
+        for sink in self.sinks:
+            try:
+                sink.open()
+                opened.append(sink)
+            except Exception as e:
+                self.manager.logger.error(f"Could not open {sink.name} sink: {e}")
+                
+        results = {sink.name: False for sink in self.sinks}
+        if not opened:
+            return results
+            
+        # The sync watermark is read on the database sink's connection, so a
+        # sync never waits on the pool for a second one
+        db_connection = next((sink.db_connection for sink in opened if getattr(sink, 'db_connection', None)), None)
+        
+        active = list(opened)
+        try:
+            for batch in self.manager.iter_batches(db_connection=db_connection, **fetch_options):
+                for sink in list(active):
+                    try:
+                        sink.write(batch)
+                    except Exception as e:
+                        self.manager.logger.error(f"{sink.name} sink failed, skipping it for this run: {e}")
+                        active.remove(sink)
+                if not active:
+                    break
+        finally:
+            for sink in opened:
+                try:
+                    result = sink.close()
+                except Exception as e:
+                    self.manager.logger.error(f"Error closing {sink.name} sink: {e}")
+                    result = False
+                results[sink.name] = result and sink in active
+                
+        return results
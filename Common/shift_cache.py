@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import monotonic
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+
+def _to_time(value):
+    """Normalize a TIME column (returned as timedelta by mysql.connector) to a time object"""
+    if isinstance(value, timedelta):
+        return (datetime.min + value % timedelta(days=1)).time()
+    return value
+
+
+class UserShiftCache:
+    """
+    Process-wide in-memory map of user_id -> shift information.
+    
+    The whole map is loaded with one query and only reloaded when the users
+    or shifts tables change, so lookups on the ingestion path are served
+    from memory. Unknown user IDs are cached negatively; lookups that failed
+    with a database error are not cached. After such a failure, lookups that
+    need the database return None without trying it again until
+    refresh_interval seconds have passed, so an outage does not turn into a
+    connection and a query per event.
+    
+    Batch syncs call refresh() once per run; paths that store events as they
+    arrive (push, live capture) call refresh_if_stale(), which runs the same
+    version check at most every refresh_interval seconds.
+    """
+
+    USER_SHIFT_QUERY = """
+        SELECT u.user_id, u.name, u.shift_id, s.name as shift_name, 
+               s.start_time, s.end_time
+        FROM users u 
+        LEFT JOIN shifts s ON u.shift_id = s.id
+    """
+
+    VERSION_QUERY = """
+        SELECT (SELECT COUNT(*) FROM users),
+               (SELECT MAX(updated_at) FROM users),
+               (SELECT COUNT(*) FROM shifts),
+               (SELECT BIT_XOR(CRC32(CONCAT_WS('|', id, name, start_time, end_time))) FROM shifts)
+    """
+
+    def __init__(self, max_size=None, max_unknown=None, refresh_interval=None):
+        self.max_size = int(max_size or os.getenv('SHIFT_CACHE_MAX_USERS', 20000))
+        self.max_unknown = int(max_unknown or os.getenv('SHIFT_CACHE_MAX_UNKNOWN', 1000))
+        self.refresh_interval = int(refresh_interval if refresh_interval is not None
+                                    else os.getenv('SHIFT_CACHE_REFRESH_INTERVAL', 60))
+        self._checked_at = 0.0
+        self._failed_at = None
+        self._entries = OrderedDict()
+        self._unknown = OrderedDict()
+        self._version = None
+        self._complete = False
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+
+    def _normalize(self, row):
+        row['start_time'] = _to_time(row['start_time'])
+        row['end_time'] = _to_time(row['end_time'])
+        return row
+
+    def refresh(self, db_connection, force=False):
+        """
+        Reload the map if users or shifts changed since the last load.
+        Returns True when the map was reloaded.
+        """
+        try:
+            cursor = db_connection.cursor()
+            cursor.execute(self.VERSION_QUERY)
+            version = tuple(cursor.fetchone())
+            cursor.close()
+            self._checked_at = monotonic()
+            
+            if not force and version == self._version:
+                return False
+
+            cursor = db_connection.cursor(dictionary=True)
+            cursor.execute(self.USER_SHIFT_QUERY + " LIMIT %s", (self.max_size + 1,))
+            rows = cursor.fetchall()
+            cursor.close()
+        except Error as e:
+            logger.error(f"Error loading user shift cache: {e}")
+            self._checked_at = self._failed_at = monotonic()
+            return False
+
+        entries = OrderedDict()
+        for row in rows[:self.max_size]:
+            entries[str(row['user_id'])] = self._normalize(row)
+
+        with self._lock:
+            self._entries = entries
+            self._unknown = OrderedDict()
+            self._complete = len(rows) <= self.max_size
+            self._version = version
+            self._failed_at = None
+
+        logger.info(f"Loaded shift information for {len(entries)} users")
+        return True
+
+    def refresh_if_stale(self, db_connection):
+        """refresh() if the version was last checked more than refresh_interval seconds ago"""
+        with self._lock:
+            if monotonic() - self._checked_at < self.refresh_interval:
+                return False
+            self._checked_at = monotonic()
+        return self.refresh(db_connection)
+
+    def _remember(self, user_id, info):
+        with self._lock:
+            if info is None:
+                self._unknown[user_id] = True
+                if len(self._unknown) > self.max_unknown:
+                    self._unknown.popitem(last=False)
+            else:
+                self._entries[user_id] = info
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def _fetch_one(self, db_connection, user_id):
+        cursor = db_connection.cursor(dictionary=True)
+        cursor.execute(self.USER_SHIFT_QUERY + " WHERE u.user_id = %s", (user_id,))
+        row = cursor.fetchone()
+        return self._normalize(row) if row else None
+
+    def get(self, user_id, connect=None):
+        """
+        Return shift information for a user, or None for unknown users.
+        
+        Served from memory once the map is loaded. `connect` is only used to
+        load the map on first use, or when the map was truncated to max_size
+        and the user is not in it.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            info = self._entries.get(user_id)
+            if info is not None:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return info
+            if user_id in self._unknown:
+                self.hits += 1
+                return None
+            self.misses += 1
+            loaded = self._version is not None
+            complete = self._complete
+            backing_off = self._failed_at is not None and monotonic() - self._failed_at < self.refresh_interval
+
+        if loaded and complete:
+            self._remember(user_id, None)
+            return None
+        if not connect or backing_off:
+            return None
+
+        db_connection = connect()
+        if not db_connection:
+            self._failed_at = monotonic()
+            return None
+        try:
+            if not loaded:
+                if not self.refresh(db_connection) and self._version is None:
+                    return None
+                with self._lock:
+                    info = self._entries.get(user_id)
+                    complete = self._complete
+                if info is not None or complete:
+                    if info is None:
+                        self._remember(user_id, None)
+                    return info
+            info = self._fetch_one(db_connection, user_id)
+        except Error as e:
+            # Not remembered: the user is looked up again once the back-off has passed
+            logger.error("Error fetching user shift info: %s", e, extra={'rate_key': 'shift_lookup'})
+            self._failed_at = monotonic()
+            return None
+        finally:
+            db_connection.close()
+
+        self._remember(user_id, info)
+        return info
+
+
+# Shared by every device manager in the process
+user_shift_cache = UserShiftCache()
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+
+def shift_timestamp_window(first_date, last_date):
+    """
+    Timestamps that can belong to shift dates in [first_date, last_date].
+    An event's shift date is its calendar date or, on a night shift, the day
+    before, so the window ends two days after last_date. Filtering on it as
+    well as shift_date lets MySQL prune attendance's monthly partitions.
+    """
+    return datetime.combine(first_date, datetime.min.time()), datetime.combine(last_date + timedelta(days=2), datetime.min.time())
+
+
+class ShiftEventResolver:
+    """
+    Resolves shift start/end flags for a batch of clock events.
+    
+    Entry readers flag the first IN of a user's shift day as the shift start,
+    exit readers flag the last OUT as the shift end. Candidates are picked in
+    memory per (user_id, shift_date), merged with the extremes already stored
+    in one query, and superseded flags are cleared with one UPDATE per batch.
+    Both statements filter on the stored shift_date column so they are served
+    by idx_shift_lookup (user_id, shift_date, device_type, event_type, timestamp),
+    and on the matching timestamp window so only the relevant partitions are read.
+    """
+
+    def __init__(self, device_type, event_type):
+        self.device_type = device_type
+        self.event_type = event_type
+        
+        # IN events mark the shift start (earliest wins), OUT events the shift end (latest wins)
+        self.is_entry = event_type == 'IN'
+        self.flag_column = 'is_shift_start' if self.is_entry else 'is_shift_end'
+
+    def _beats(self, timestamp, other):
+        return timestamp < other if self.is_entry else timestamp > other
+
+    def _flags(self, flagged):
+        if self.is_entry:
+            return self.event_type, flagged, False
+        return self.event_type, False, flagged
+
+    def _date_range(self, keys):
+        shift_dates = [shift_date for _, shift_date in keys]
+        return min(shift_dates), max(shift_dates)
+
+    def _fetch_extremes(self, cursor, keys):
+        """Get the stored first IN / last OUT for every (user_id, shift_date) in one query"""
+        user_ids = sorted({user_id for user_id, _ in keys})
+        first_date, last_date = self._date_range(keys)
+        aggregate = 'MIN' if self.is_entry else 'MAX'
+        
+        cursor.execute(f"""
+            SELECT user_id, shift_date, {aggregate}(timestamp)
+            FROM attendance
+            WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})
+            AND shift_date BETWEEN %s AND %s
+            AND device_type = %s
+            AND event_type = %s
+            AND timestamp >= %s AND timestamp < %s
+            GROUP BY user_id, shift_date
+        """, (*user_ids, first_date, last_date, self.device_type, self.event_type,
+              *shift_timestamp_window(first_date, last_date)))
+        
+        return {(str(user_id), shift_date): timestamp for user_id, shift_date, timestamp in cursor.fetchall()}
+
+    def _clear_flags(self, cursor, keys):
+        """Remove the flag from stored events superseded by this batch"""
+        first_date, last_date = self._date_range(keys)
+        
+        cursor.execute(f"""
+            UPDATE attendance
+            SET {self.flag_column} = FALSE
+            WHERE (user_id, shift_date) IN ({', '.join(['(%s, %s)'] * len(keys))})
+            AND shift_date BETWEEN %s AND %s
+            AND device_type = %s
+            AND {self.flag_column} = TRUE
+            AND timestamp >= %s AND timestamp < %s
+        """, (*[value for key in keys for value in key], first_date, last_date, self.device_type,
+              *shift_timestamp_window(first_date, last_date)))
+
+    def resolve(self, cursor, events):
+        """
+        Resolve flags for a batch of (user_id, timestamp, shift_date) events;
+        events without a shift_date (no shift assigned) are never flagged.
+        Must run in the same transaction as, and before, the batch's INSERT.
+        Returns a list of (event_type, is_shift_start, is_shift_end) tuples aligned with events.
+        """
+        flags = [self._flags(False)] * len(events)
+        
+        # Pick the candidate event for every (user_id, shift_date) in memory
+        candidates = {}
+        for index, (user_id, timestamp, shift_date) in enumerate(events):
+            if shift_date is None:
+                continue
+                
+            key = (str(user_id), shift_date)
+            best = candidates.get(key)
+            if best is None or self._beats(timestamp, events[best][1]):
+                candidates[key] = index
+        
+        if not candidates:
+            return flags
+        
+        existing = self._fetch_extremes(cursor, candidates)
+        
+        superseded = []
+        for key, index in candidates.items():
+            timestamp = events[index][1]
+            current = existing.get(key)
+            if current is None or timestamp == current:
+                flags[index] = self._flags(True)
+            elif self._beats(timestamp, current):
+                flags[index] = self._flags(True)
+                superseded.append(key)
+        
+        if superseded:
+            self._clear_flags(cursor, superseded)
+            
+        return flags
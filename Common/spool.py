@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from mysql.connector import Error
+from Common.db import get_db_pool
+from Common.events import AttendanceEvent, parse_iso_timestamp
+from Common.pipeline import AttendanceBatch, AttendanceSink
+from Common.shift_cache import user_shift_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'spool', 'attendance_spool.db'
+)
+
+
+def _encode_watermark(watermark):
+    if watermark is None:
+        return None
+    return json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in watermark])
+
+
+def _decode_watermark(value):
+    if value is None:
+        return None
+    return tuple(datetime.fromisoformat(item) if isinstance(item, str) else item for item in json.loads(value))
+
+
+class AttendanceSpool:
+    """
+    Local append-only SQLite spool of normalized attendance batches.
+
+    Device reads are appended here first, one transaction (and one fsync) per
+    batch, and the drainer loads them into MySQL in order. The spool also keeps
+    the last device watermark it accepted, so device reads keep moving forward
+    while MySQL is down.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('SPOOL_PATH', DEFAULT_SPOOL_PATH)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS spool_batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_type TEXT NOT NULL,
+                device_ip TEXT NOT NULL,
+                device_location TEXT,
+                watermark TEXT,
+                errors INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_spool_device ON spool_batches (device_ip, id);
+            CREATE TABLE IF NOT EXISTS spool_records (
+                batch_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                status_code INTEGER,
+                status_description TEXT,
+                employee_name TEXT,
+                verification_mode TEXT,
+                PRIMARY KEY (batch_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS local_watermarks (
+                device_ip TEXT PRIMARY KEY,
+                watermark TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def append(self, batch, watermark):
+        """Durably add a batch; watermark (or None) is what the drainer commits to MySQL with it"""
+        now = datetime.now().isoformat()
+        with self._lock:
+            try:
+                cursor = self._conn.execute("""
+                    INSERT INTO spool_batches (device_type, device_ip, device_location, watermark, errors, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (batch.device_type, batch.device_ip, batch.device_location,
+                      _encode_watermark(watermark), batch.errors, now))
+                batch_id = cursor.lastrowid
+                self._conn.executemany("""
+                    INSERT INTO spool_records (batch_id, seq, user_id, timestamp, status_code,
+                                               status_description, employee_name, verification_mode)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (batch_id, seq, record.user_id, record.isoformat(), record.status_code,
+                     record.status_description, record.employee_name, record.verification_mode)
+                    for seq, record in enumerate(batch.records)
+                ])
+                if watermark is not None:
+                    self._conn.execute("""
+                        INSERT INTO local_watermarks (device_ip, watermark, updated_at) VALUES (?, ?, ?)
+                        ON CONFLICT(device_ip) DO UPDATE SET watermark = excluded.watermark, updated_at = excluded.updated_at
+                    """, (batch.device_ip, _encode_watermark(watermark), now))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return batch_id
+
+    def pending(self, device_ips, limit=50):
+        """Oldest spooled batches for the given devices, as (batch_id, AttendanceBatch) pairs"""
+        if not device_ips:
+            return []
+        placeholders = ', '.join(['?'] * len(device_ips))
+        with self._lock:
+            batches = self._conn.execute(f"""
+                SELECT id, device_type, device_ip, device_location, watermark, errors
+                FROM spool_batches
+                WHERE device_ip IN ({placeholders})
+                ORDER BY id
+                LIMIT ?
+            """, (*device_ips, limit)).fetchall()
+            result = []
+            for batch_id, device_type, device_ip, device_location, watermark, errors in batches:
+                rows = self._conn.execute("""
+                    SELECT user_id, timestamp, status_code, status_description, employee_name, verification_mode
+                    FROM spool_records WHERE batch_id = ? ORDER BY seq
+                """, (batch_id,)).fetchall()
+                records = []
+                for user_id, timestamp, status_code, status_description, employee_name, verification_mode in rows:
+                    timestamp, utc_offset = parse_iso_timestamp(timestamp)
+                    records.append(AttendanceEvent(user_id, timestamp, status_code, status_description,
+                                                   employee_name, verification_mode, utc_offset))
+                result.append((batch_id, AttendanceBatch(
+                    device_type, device_ip, device_location, records, _decode_watermark(watermark), errors
+                )))
+        return result
+
+    def remove(self, batch_id):
+        """Drop a batch once it is committed to MySQL"""
+        with self._lock:
+            self._conn.execute("DELETE FROM spool_records WHERE batch_id = ?", (batch_id,))
+            self._conn.execute("DELETE FROM spool_batches WHERE id = ?", (batch_id,))
+            self._conn.commit()
+
+    def has_pending(self, device_ip):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM spool_batches WHERE device_ip = ? LIMIT 1", (device_ip,)
+            ).fetchone()
+        return row is not None
+
+    def local_watermark(self, device_ip):
+        """Last watermark spooled for the device, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT watermark FROM local_watermarks WHERE device_ip = ?", (device_ip,)
+            ).fetchone()
+        return _decode_watermark(row[0]) if row else None
+
+    def stats_summary(self):
+        with self._lock:
+            batches, records = self._conn.execute("""
+                SELECT COUNT(DISTINCT b.id), COUNT(r.batch_id)
+                FROM spool_batches b LEFT JOIN spool_records r ON r.batch_id = b.id
+            """).fetchone()
+        return f"pending batches: {batches}, pending records: {records}"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SpoolSink(AttendanceSink):
+    """Appends batches to the local spool instead of writing MySQL directly"""
+
+    name = 'spool'
+
+    def __init__(self, spool):
+        self.spool = spool
+        self.record_count = 0
+        self.advance_watermark = True
+
+    def open(self):
+        self.record_count = 0
+        self.advance_watermark = True
+
+    def write(self, batch):
+        if batch.stored:
+            return
+        # Same rule as DatabaseSink: stop advancing the watermark after a batch with errors
+        if batch.errors:
+            self.advance_watermark = False
+        self.spool.append(batch, batch.watermark if self.advance_watermark else None)
+        self.record_count += len(batch.records)
+
+    def close(self):
+        return self.record_count > 0
+
+
+class SpoolDrainer:
+    """
+    Background loader from the spool into MySQL.
+
+    Batches are loaded oldest first, each committed together with its device
+    watermark and then removed from the spool. Inserts skip duplicates, so a
+    batch loaded again after a crash between the two steps is harmless. While
+    MySQL is unavailable the drainer backs off and retries.
+    """
+
+    def __init__(self, spool, managers, interval=None, limit=None, max_retry_delay=None):
+        self.spool = spool
+        self.managers = {manager.ip: manager for manager in managers}
+        self.interval = float(interval or os.getenv('SPOOL_DRAIN_INTERVAL', 2))
+        self.limit = int(limit or os.getenv('SPOOL_DRAIN_LIMIT', 50))
+        self.max_retry_delay = float(max_retry_delay or os.getenv('SPOOL_MAX_RETRY_DELAY', 60))
+
+    def drain(self):
+        """Load pending batches until the spool is empty; returns the number of new rows"""
+        total_new = 0
+        registered = set()
+
+        while True:
+            pending = self.spool.pending(list(self.managers), self.limit)
+            if not pending:
+                return total_new
+
+            db_connection = get_db_pool().get_connection()
+            try:
+                user_shift_cache.refresh(db_connection)
+                cursor = db_connection.cursor()
+
+                for batch_id, batch in pending:
+                    manager = self.managers[batch.device_ip]
+                    if manager.ip not in registered:
+                        manager.register_sync(cursor)
+                        db_connection.commit()
+                        registered.add(manager.ip)
+
+                    counts = {'new': 0, 'duplicates': 0, 'errors': batch.errors, 'shift_starts': 0, 'shift_ends': 0}
+                    with manager.shift_lock:
+                        manager.store_batch(cursor, batch.records, counts)
+                        if counts['errors']:
+                            manager.logger.warning(f"{manager.name}: {counts['errors']} spooled records could not be loaded; watermark not advanced")
+                        elif batch.watermark:
+                            manager.update_sync_watermark(cursor, *batch.watermark)
+                        manager.commit_batch(db_connection)
+                    self.spool.remove(batch_id)
+
+                    total_new += counts['new']
+                    if counts['new']:
+                        manager.report_counts(counts, 'spool')
+
+            except Error:
+                db_connection.rollback()
+                raise
+            finally:
+                db_connection.close()
+
+    def run(self, stop_event):
+        """Drain every interval seconds until stop_event is set"""
+        retry_delay = self.interval
+        while not stop_event.is_set():
+            try:
+                self.drain()
+                retry_delay = self.interval
+            except Exception as e:
+                logger.warning(f"Spool drain paused ({e}); retrying in {retry_delay:.0f}s. {self.spool.stats_summary()}")
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+            stop_event.wait(retry_delay)
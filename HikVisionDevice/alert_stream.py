@@ -0,0 +1,124 @@
+import json
+
+# AcsEvent codes of the events stored as attendance. The AcsEvent search and
+# the alertStream filter use the same pair, so push and poll store the same events
+ATTENDANCE_MAJOR = 5
+ATTENDANCE_MINOR = 1
+
+
+class MultipartStreamParser:
+    """
+    Incremental parser for the multipart/mixed body of an ISAPI alertStream.
+    
+    Bytes are fed as they arrive from the socket and complete parts are
+    returned as (headers, body) tuples. Parts with a Content-Length are cut
+    by length; parts without one end at the next boundary.
+    """
+
+    def __init__(self, boundary):
+        if isinstance(boundary, str):
+            boundary = boundary.encode()
+        self.delimiter = b'--' + boundary.strip(b'"')
+        self.buffer = b''
+        self.headers = None
+
+    def feed(self, data):
+        """Add received bytes; return the list of parts completed by them"""
+        self.buffer += data
+        parts = []
+        
+        while True:
+            if self.headers is None:
+                # Wait for a boundary line followed by a complete header block
+                start = self.buffer.find(self.delimiter)
+                if start < 0:
+                    # Keep a tail in case the delimiter is split across chunks
+                    self.buffer = self.buffer[-len(self.delimiter):]
+                    break
+                header_end = self.buffer.find(b'\r\n\r\n', start)
+                if header_end < 0:
+                    self.buffer = self.buffer[start:]
+                    break
+                    
+                header_lines = self.buffer[start + len(self.delimiter):header_end].split(b'\r\n')
+                self.headers = {}
+                for line in header_lines:
+                    name, _, value = line.decode('latin-1').partition(':')
+                    if value:
+                        self.headers[name.strip().lower()] = value.strip()
+                self.buffer = self.buffer[header_end + 4:]
+            
+            content_length = self.headers.get('content-length')
+            if content_length is not None and content_length.isdigit():
+                length = int(content_length)
+                if len(self.buffer) < length:
+                    break
+                body = self.buffer[:length]
+                self.buffer = self.buffer[length:]
+            else:
+                end = self.buffer.find(self.delimiter)
+                if end < 0:
+                    break
+                body = self.buffer[:end].rstrip(b'\r\n')
+                self.buffer = self.buffer[end:]
+                
+            parts.append((self.headers, body))
+            self.headers = None
+            
+        return parts
+
+
+def iter_stream_chunks(response, chunk_size=65536):
+    """
+    Yield the bytes of a streamed requests response as soon as they arrive.
+    
+    Devices send alertStream without chunked encoding, and for such bodies
+    iter_content() waits for chunk_size bytes, or with chunk_size=None for the
+    connection to close. urllib3 2's read1 returns whatever has been received;
+    older urllib3 falls back to iter_content(chunk_size=None).
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=None)
+        return
+    while True:
+        data = read1(chunk_size)
+        if not data:
+            return
+        yield data
+
+
+def parse_alert_event(headers, body):
+    """
+    Convert an AccessControllerEvent part into the record shape returned by
+    AcsEvent searches (employeeNoString, time, name, ...).
+    Returns None for heartbeats, pictures, events without a person and any
+    event other than ATTENDANCE_MAJOR/ATTENDANCE_MINOR (e.g. failed authentications).
+    """
+    if 'json' not in headers.get('content-type', 'application/json').lower():
+        return None
+        
+    try:
+        alert = json.loads(body)
+    except ValueError:
+        return None
+        
+    if alert.get('eventType') != 'AccessControllerEvent':
+        return None
+        
+    event = alert.get('AccessControllerEvent') or {}
+    employee_no = event.get('employeeNoString') or event.get('employeeNo')
+    if not employee_no:
+        return None
+    if event.get('majorEventType') != ATTENDANCE_MAJOR or event.get('subEventType') != ATTENDANCE_MINOR:
+        return None
+        
+    return {
+        'employeeNoString': str(employee_no),
+        'time': alert.get('dateTime', ''),
+        'name': event.get('name', f"User_{employee_no}"),
+        'verificationMode': event.get('currentVerifyMode', 'Face'),
+        'major': event.get('majorEventType'),
+        'minor': event.get('subEventType'),
+        'serialNo': event.get('serialNo'),
+    }
@@ -1,418 +1,453 @@
 import os
+import uuid
 import requests
 from dotenv import load_dotenv
-import csv
-from datetime import datetime, timedelta
-import mysql.connector
+from datetime import datetime
+from time import monotonic
 from mysql.connector import Error
+from Common.daily_summary import DailySummaryUpdater
+from Common.device_manager import ER_BAD_FIELD_ERROR, DeviceManager
+from Common.metrics import metrics
+from Common.events import AttendanceEvent, parse_iso_timestamp
+from Common.pipeline import AttendanceBatch
+from Common.shift_resolver import ShiftEventResolver
+from HikVisionDevice.alert_stream import (
+    ATTENDANCE_MAJOR, ATTENDANCE_MINOR, MultipartStreamParser, iter_stream_chunks, parse_alert_event
+)
 
 load_dotenv()
 
-class HikVisionDeviceManager:
+class HikVisionDeviceManager(DeviceManager):
     
-    def __init__(self, ip=None, port=80, timeout=10):
-        self.ip = os.getenv('HIK_DEVICE_IP', '192.168.1.30')
-        self.port = int(os.getenv('HIK_DEVICE_PORT', 80))
-        self.username = os.getenv('HIK_USERNAME', 'admin')
-        self.password = os.getenv('HIK_PASSWORD', '')
-        self.timeout = int(os.getenv('HIK_TIMEOUT', 10))
-        self.device_location = os.getenv('HIK_DEVICE_LOCATION', 'Main Entrance')
+    device_type = 'HIKVISION'
+    purpose = 'ENTRY'
+    display_name = 'HikVision'
+    log_prefix = 'hikvision'
+    shift_count_key = 'shift_starts'
+    
+    export_columns = """user_id, timestamp, employee_name, event_type, device_type,
+                       device_ip, device_location, verification_mode, is_shift_start, is_shift_end"""
+    export_header = [
+        'User ID', 'Timestamp', 'Employee Name', 'Event Type', 
+        'Device Type', 'Device IP', 'Device Location', 'Verification Mode',
+        'Shift Start', 'Shift End'
+    ]
+    
+    def __init__(self, ip=None, port=None, timeout=None, device_location=None, username=None, password=None):
+        super().__init__(
+            ip or os.getenv('HIK_DEVICE_IP', '192.168.1.30'),
+            int(port or os.getenv('HIK_DEVICE_PORT', 80)),
+            int(timeout or os.getenv('HIK_TIMEOUT', 10)),
+            device_location or os.getenv('HIK_DEVICE_LOCATION', 'Main Entrance')
+        )
+        self.username = username or os.getenv('HIK_USERNAME', 'admin')
+        self.password = password if password is not None else os.getenv('HIK_PASSWORD', '')
         
         self.base_url = f"http://{self.ip}:{self.port}/ISAPI"
         self.session = None
         
-        self.db_config = {
-            'host': os.getenv('DB_HOST', 'localhost'),
-            'database': os.getenv('DB_NAME', 'attendance_db'),
-            'user': os.getenv('DB_USER', 'root'),
-            'password': os.getenv('DB_PASSWORD', ''),
-            'port': int(os.getenv('DB_PORT', 3306))
-        }
+        # The entry reader's first IN of a shift day marks the shift start
+        self.shift_resolver = ShiftEventResolver('HIKVISION', 'IN')
+        self.daily_summary = DailySummaryUpdater('IN')
 
-        self.log_dir = os.getenv('LOG_DIR', './logs')
-        os.makedirs(self.log_dir, exist_ok=True)
+        # Number of events requested per AcsEvent search page
+        self.page_size = int(os.getenv('HIK_PAGE_SIZE', 30))
         
-        print(f"Initializing HikVisionDeviceManager for ENTRY reader at {self.ip}:{self.port}")
+        # Push mode: read timeout on the alertStream (the device sends heartbeats)
+        # and the cap on the reconnect backoff
+        self.stream_timeout = int(os.getenv('HIK_STREAM_TIMEOUT', 90))
+        self.stream_max_retry_delay = int(os.getenv('HIK_STREAM_MAX_RETRY_DELAY', 60))
+        
+        self.logger.info(f"Initializing HikVisionDeviceManager for ENTRY reader at {self.ip}:{self.port}")
 
-    def connect_to_db(self):
-        """Establish connection to MySQL database"""
-        try:
-            return mysql.connector.connect(**self.db_config)
-        except Error as e:
-            print(f"Error connecting to MySQL database: {e}")
-            return None
+    def connect_to_device(self):
+        """Establish connection to the HikVision device"""
+        with self.device_lock:
+            try:
+                self.logger.info("Attempting to connect to HikVision device...")
+                self.session = requests.Session()
+                self.session.auth = (self.username, self.password)
+                
+                response = self.session.get(f"{self.base_url}/System/deviceInfo", timeout=self.timeout)
+                if response.status_code == 200:
+                    self.last_activity = monotonic()
+                    self.logger.info("Successfully connected to HikVision device!")
+                    return True
+                else:
+                    self.logger.error(f"Failed to connect to HikVision device. Status: {response.status_code}")
+                    self.disconnect_from_device()
+                    return False
+                    
+            except Exception as e:
+                self.logger.error(f"Failed to connect to HikVision device: {e}")
+                self.disconnect_from_device()
+                return False
 
-    def get_user_shift_info(self, user_id):
-        """Get user's shift information from database"""
-        db_connection = self.connect_to_db()
-        if not db_connection:
-            return None
-            
-        try:
-            cursor = db_connection.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT u.user_id, u.name, u.shift_id, s.name as shift_name, 
-                       s.start_time, s.end_time
-                FROM users u 
-                LEFT JOIN shifts s ON u.shift_id = s.id 
-                WHERE u.user_id = %s
-            """, (user_id,))
-            
-            result = cursor.fetchone()
-            return result
-            
-        except Error as e:
-            print(f"Error fetching user shift info: {e}")
-            return None
-        finally:
-            if db_connection:
-                db_connection.close()
+    def disconnect_from_device(self):
+        """Close the session"""
+        with self.device_lock:
+            if self.session:
+                self.session.close()
+                self.session = None
+                self.logger.info("Disconnected from HikVision device")
+
+    def is_connected(self):
+        """True while a device session is open"""
+        return self.session is not None
 
-    def calculate_shift_date_range(self, timestamp, shift_start, shift_end):
+    def ensure_connected(self):
+        """Reuse the open device session, connecting only if there is none"""
+        with self.device_lock:
+            if self.is_connected():
+                return True
+            return self.connect_to_device()
+
+    def _request(self, method, url, **kwargs):
         """
-        Calculate the shift date range for a given timestamp and shift times
-        Handles night shifts that span across two days
+        Send a request on the device session.
+        Pooled keep-alive sockets can be closed by the device while idle, so a
+        connection failure re-creates the session once and retries.
         """
-        record_time = timestamp.time()
-        record_date = timestamp.date()
-        
-        # Convert shift times to time objects if they're strings
-        if isinstance(shift_start, str):
-            shift_start = datetime.strptime(shift_start, '%H:%M:%S').time()
-        if isinstance(shift_end, str):
-            shift_end = datetime.strptime(shift_end, '%H:%M:%S').time()
-        
-        # For night shifts (end time < start time)
-        if shift_end < shift_start:
-            if record_time >= shift_start:  # After midnight, still same shift day
-                shift_date = record_date
-            else:  # Before midnight, previous day's shift
-                shift_date = record_date - timedelta(days=1)
-        else:
-            # Normal shift (same day)
-            shift_date = record_date
-            
-        return shift_date
+        kwargs.setdefault('timeout', self.timeout)
+        with self.device_lock:
+            if not self.session:
+                raise ConnectionError("No active connection to HikVision device")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                self.logger.warning(f"HikVision session looks stale ({e}), reconnecting...")
+                self.disconnect_from_device()
+                if not self.connect_to_device():
+                    raise
+                response = self.session.request(method, url, **kwargs)
+            self.last_activity = monotonic()
+            return response
 
-    def determine_shift_event(self, user_id, timestamp, shift_info):
+    def keepalive(self):
         """
-        Determine if this clock event is a shift start or end
-        Based on whether it's the first IN or last OUT for the shift day
+        Keep an idle device session open with a cheap request.
+        Skipped while a sync holds the session; a failed keepalive drops the
+        session so the next sync reconnects.
         """
-        if not shift_info:
-            return 'IN', False, False
-            
-        db_connection = self.connect_to_db()
-        if not db_connection:
-            return 'IN', False, False
-            
-        try:
-            cursor = db_connection.cursor()
-            
-            # Calculate shift date for this record
-            shift_date = self.calculate_shift_date_range(
-                timestamp, 
-                shift_info['start_time'], 
-                shift_info['end_time']
-            )
-            
-            # For HikVision device (ENTRY), we're looking for the first IN event of the shift day
-            # Check if this is the first IN event for this user's shift day
-            cursor.execute("""
-                SELECT timestamp 
-                FROM attendance 
-                WHERE user_id = %s 
-                AND DATE(timestamp) = %s
-                AND device_type = 'HIKVISION'
-                AND event_type = 'IN'
-                ORDER BY timestamp ASC 
-                LIMIT 1
-            """, (user_id, shift_date))
-            
-            result = cursor.fetchone()
-            is_shift_start = False
-            
-            if result:
-                # If this timestamp is earlier than or equal to the first recorded IN
-                existing_first_in = result[0]
-                if timestamp <= existing_first_in:
-                    is_shift_start = True
-                    # Update previous records to remove shift_start flag
-                    cursor.execute("""
-                        UPDATE attendance 
-                        SET is_shift_start = FALSE 
-                        WHERE user_id = %s 
-                        AND DATE(timestamp) = %s
-                        AND is_shift_start = TRUE
-                    """, (user_id, shift_date))
-            else:
-                # First IN record for this shift day
-                is_shift_start = True
-            
-            return 'IN', is_shift_start, False
-            
-        except Error as e:
-            print(f"Error determining shift event: {e}")
-            return 'IN', False, False
-        finally:
-            if db_connection:
-                db_connection.close()
-
-    def test_connections(self):
-        """Test both device and database connections"""
-        print("\nTesting HikVision connections...")
-        print(f"Device Target: {self.ip}:{self.port}")
-        print(f"Database Target: {self.db_config['host']}:{self.db_config['port']}")
-        
-        if self.connect_to_device():
-            print("✓ HikVision device connection successful")
-            self.disconnect_from_device()
-        else:
-            print("✗ HikVision device connection failed")
-        
-        db_conn = self.connect_to_db()
-        if db_conn:
-            print("✓ Database connection successful")
-            db_conn.close()
-        else:
-            print("✗ Database connection failed")
-
-    def connect_to_device(self):
-        """Establish connection to the HikVision device"""
+        if not self.session or monotonic() - self.last_activity < self.keepalive_interval:
+            return
+        if not self.device_lock.acquire(blocking=False):
+            return
         try:
-            print("Attempting to connect to HikVision device...")
-            self.session = requests.Session()
-            self.session.auth = (self.username, self.password)
-            self.session.timeout = self.timeout
-            
-            response = self.session.get(f"{self.base_url}/System/deviceInfo")
-            if response.status_code == 200:
-                print("Successfully connected to HikVision device!")
-                return True
-            else:
-                print(f"Failed to connect to HikVision device. Status: {response.status_code}")
-                return False
-                
+            response = self.session.get(f"{self.base_url}/System/deviceInfo", timeout=self.timeout)
+            if response.status_code != 200:
+                raise ConnectionError(f"Status: {response.status_code}")
+            self.last_activity = monotonic()
         except Exception as e:
-            print(f"Failed to connect to HikVision device: {e}")
-            return False
-
-    def disconnect_from_device(self):
-        """Close the session"""
-        if self.session:
-            self.session.close()
-            print("Disconnected from HikVision device")
+            self.logger.error(f"HikVision keepalive failed, dropping session: {e}")
+            self.disconnect_from_device()
+        finally:
+            self.device_lock.release()
 
-    def get_attendances(self):
-        """Retrieve all attendance records from the HikVision device"""
+    def iter_attendances(self, start_time=None, end_time=None):
+        """
+        Yield attendance events from the HikVision device page by page.
+        Pages through searchResultPosition until the device reports no more
+        results, so events are processed as they arrive and memory stays bounded.
+        Defaults to events since midnight.
+        """
         if not self.session:
-            print("No active connection to HikVision device")
-            return None
+            self.logger.warning("No active connection to HikVision device")
+            return
             
-        try:
-            print("Fetching attendance records from HikVision device...")
-            
-            # Get events from last 24 hours
-            end_time = datetime.now()
+        if start_time is None:
             start_time = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if end_time is None:
+            end_time = datetime.now()
             
-            start_time_str = start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
-            end_time_str = end_time.strftime("%Y-%m-%dT%H:%M:%SZ")
-            
-            url = f"{self.base_url}/AccessControl/AcsEvent?format=json"
-            
+        start_time_str = start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        end_time_str = end_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        
+        url = f"{self.base_url}/AccessControl/AcsEvent?format=json"
+        search_id = uuid.uuid4().hex
+        position = 0
+        
+        self.logger.info(f"Fetching HikVision attendance records since {start_time}...")
+        
+        while True:
             payload = {
                 "AcsEventCond": {
-                    "searchID": "1",
-                    "searchResultPosition": 0,
-                    "maxResults": 10000,
-                    "major": 5,
-                    "minor": 1,
+                    "searchID": search_id,
+                    "searchResultPosition": position,
+                    "maxResults": self.page_size,
+                    "major": ATTENDANCE_MAJOR,
+                    "minor": ATTENDANCE_MINOR,
                     "startTime": start_time_str,
                     "endTime": end_time_str
                 }
             }
             
-            response = self.session.post(url, json=payload)
+            with metrics.timer(self, 'fetch'):
+                response = self._request('POST', url, json=payload)
+                if response.status_code != 200:
+                    raise RuntimeError(f"AcsEvent search failed at position {position}. Status: {response.status_code}")
+                    
+                acs_event = response.json().get('AcsEvent', {})
+            events = acs_event.get('InfoList', [])
             
-            if response.status_code == 200:
-                events_data = response.json()
-                events = events_data.get('AcsEvent', {}).get('InfoList', [])
+            if isinstance(events, dict):
+                events = [events]
                 
-                if isinstance(events, dict):
-                    events = [events]
-                    
-                print(f"Successfully retrieved {len(events)} attendance records from HikVision")
-                return events
-            else:
-                print(f"Error fetching HikVision attendance. Status: {response.status_code}")
-                return None
+            for event in events:
+                yield event
+                
+            position += int(acs_event.get('numOfMatches', len(events)))
+            if acs_event.get('responseStatusStrg') != 'MORE' or not events:
+                break
                 
+        self.logger.info(f"Successfully retrieved {position} attendance records from HikVision")
+
+    def get_attendances(self, start_time=None, end_time=None):
+        """Retrieve all attendance records from the HikVision device"""
+        if not self.session:
+            self.logger.warning("No active connection to HikVision device")
+            return None
+            
+        try:
+            return list(self.iter_attendances(start_time, end_time))
         except Exception as e:
-            print(f"Error fetching attendance from HikVision: {e}")
+            self.logger.error(f"Error fetching attendance from HikVision: {e}")
             return None
 
-    def store_attendance_to_db(self):
-        """Store attendance records from HikVision device to database with shift logic"""
-        db_connection = self.connect_to_db()
-        if not db_connection:
-            return False
+    def get_sync_watermark(self, cursor):
+        """
+        Get the time of the last committed HikVision event, or None if never synced.
+        Database errors other than missing watermark columns are raised, so this
+        cycle fails and the next one retries instead of syncing since midnight.
+        """
+        try:
+            cursor.execute("""
+                SELECT sync_watermark_timestamp
+                FROM devices
+                WHERE device_ip = %s
+            """, (self.ip,))
+            result = cursor.fetchone()
+        except Error as e:
+            if e.errno != ER_BAD_FIELD_ERROR:
+                raise
+            # Schema without the watermark columns: keep syncing since midnight
+            self.logger.error(f"Error reading HikVision sync watermark, syncing since midnight: {e}")
+            self.watermark_supported = False
+            return None
             
-        attendances = self.get_attendances()
-        if not attendances:
-            print("No attendance records found on HikVision device")
-            db_connection.close()
-            return False
+        return result[0] if result else None
+
+    def update_sync_watermark(self, cursor, timestamp):
+        """Record the last event time committed together with the current transaction"""
+        if not self.watermark_supported:
+            return
+        cursor.execute("""
+            UPDATE devices
+            SET sync_watermark_timestamp = %s
+            WHERE device_ip = %s
+            AND (sync_watermark_timestamp IS NULL OR sync_watermark_timestamp < %s)
+        """, (timestamp, self.ip, timestamp))
+
+    def spooled_watermark(self):
+        watermark = self.spool.local_watermark(self.ip)
+        return watermark[0] if watermark else None
+
+    def normalize_record(self, record):
+        """
+        Convert a raw AcsEvent/alertStream event to an AttendanceEvent.
+        Returns None for events without a time; raises if the time cannot be parsed.
+        """
+        timestamp_str = record.get('time', '')
+        if not timestamp_str:
+            return None
             
+        # Device local time is stored as is; the reported UTC offset is kept on the event
+        timestamp, utc_offset = parse_iso_timestamp(timestamp_str)
+        
+        return AttendanceEvent(
+            user_id=record.get('employeeNoString', 'Unknown'),
+            timestamp=timestamp,
+            utc_offset=utc_offset,
+            status_code=None,
+            status_description='Check-in',
+            employee_name=record.get('name'),
+            verification_mode=record.get('verificationMode', 'Face')
+        )
+
+    def raw_user_id(self, record):
+        return record.get('employeeNoString', 'Unknown')
+
+    def _make_batches(self, raw_records, fetch_errors=0, stored_before=None):
+        """
+        Normalize a chunk of raw events into an AttendanceBatch whose watermark is
+        its latest event. Events before stored_before, committed by an earlier
+        sync, are split off into a stored batch yielded first.
+        """
+        with metrics.timer(self, 'parse'):
+            records, errors = self.normalize_records(raw_records)
+        if stored_before is not None:
+            stored = [record for record in records if record.timestamp < stored_before]
+            if stored:
+                yield AttendanceBatch(self.device_type, self.ip, self.device_location, stored, stored=True)
+                records = [record for record in records if record.timestamp >= stored_before]
+                if not records and not errors + fetch_errors:
+                    return
+        watermark = (max(record.timestamp for record in records),) if records else None
+        yield AttendanceBatch(
+            self.device_type, self.ip, self.device_location, records, watermark, errors + fetch_errors
+        )
+
+    def iter_batches(self, start_time=None, end_time=None, db_connection=None, include_stored=False):
+        """
+        Stream events from the device once, yielding AttendanceBatches of batch_size.
+        Resumes from the sync watermark (read on db_connection when given) unless
+        start_time is given; with include_stored, events from start_time up to the
+        watermark are yielded as stored batches, for sinks that list the whole log.
+        A fetch error ends the stream and is counted against the last batch, so the
+        watermark is not advanced past it.
+        """
+        if not self.session:
+            self.logger.warning("No active connection to HikVision device")
+            return
+            
+        # Resume from the last committed event instead of midnight
+        stored_before = None
+        if start_time is None:
+            start_time = self.load_sync_watermark(db_connection)
+        elif include_stored:
+            stored_before = self.load_sync_watermark(db_connection)
+            
+        batch = []
+        total_records = 0
+        fetch_errors = 0
+        
         try:
-            cursor = db_connection.cursor()
+            for record in self.iter_attendances(start_time, end_time):
+                total_records += 1
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    yield from self._make_batches(batch, stored_before=stored_before)
+                    batch = []
+        except Exception as e:
+            self.logger.error(f"Error fetching attendance from HikVision: {e}")
+            fetch_errors = 1
             
-            # Update device last sync
-            cursor.execute("""
-                INSERT INTO devices (device_type, device_ip, device_location, purpose, last_sync, status)
-                VALUES ('HIKVISION', %s, %s, 'ENTRY', NOW(), 'ONLINE')
-                ON DUPLICATE KEY UPDATE last_sync = NOW(), status = 'ONLINE'
-            """, (self.ip, self.device_location))
+        if batch or fetch_errors:
+            yield from self._make_batches(batch, fetch_errors, stored_before)
             
-            new_records_count = 0
-            duplicate_records_count = 0
-            error_records_count = 0
-            shift_start_records = 0
+        if not total_records:
+            self.logger.info("No attendance records found on HikVision device")
+
+    def store_events(self, records):
+        """
+        Store a small batch of events pushed by the device (alertStream) right away.
+        Uses the same shift resolution and insert path as polling.
+        """
+        db_connection = self.connect_to_db()
+        if not db_connection:
+            return False
             
-            for record in attendances:
-                try:
-                    user_id = record.get('employeeNoString', 'Unknown')
-                    timestamp_str = record.get('time', '')
-                    
-                    if not timestamp_str:
-                        continue
-                        
-                    # Parse timestamp
-                    timestamp_str = timestamp_str.split('+')[0]
-                    timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S")
-                    
-                    # Get user shift information
-                    shift_info = self.get_user_shift_info(user_id)
-                    
-                    # Determine event type and shift flags
-                    event_type, is_shift_start, is_shift_end = self.determine_shift_event(
-                        user_id, timestamp, shift_info
-                    )
-                    
-                    # Get additional info
-                    employee_name = record.get('name', f"User_{user_id}")
-                    verification_mode = record.get('verificationMode', 'Face')
-                    shift_id = None
-                    shift_name = None
-                    
-                    if shift_info:
-                        employee_name = shift_info['name']
-                        shift_id = shift_info['shift_id']
-                        shift_name = shift_info['shift_name']
-                    
-                    cursor.execute("""
-                        INSERT INTO attendance (
-                            user_id, employee_name, timestamp, event_type, 
-                            status_description, device_type, device_ip, 
-                            device_location, verification_mode,
-                            shift_id, shift_name, is_shift_start, is_shift_end
-                        ) VALUES (%s, %s, %s, %s, %s, 'HIKVISION', %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        user_id,
-                        employee_name,
-                        timestamp,
-                        event_type,
-                        'Check-in',
-                        self.ip,
-                        self.device_location,
-                        verification_mode,
-                        shift_id,
-                        shift_name,
-                        is_shift_start,
-                        is_shift_end
-                    ))
-                    
-                    new_records_count += 1
-                    if is_shift_start:
-                        shift_start_records += 1
-                    
-                except Error as e:
-                    if 'unique_clock_record' in str(e):
-                        duplicate_records_count += 1
-                    else:
-                        print(f"Error inserting HikVision record for user {user_id}: {e}")
-                        error_records_count += 1
-                except Exception as e:
-                    print(f"Unexpected error for HikVision record {user_id}: {e}")
-                    error_records_count += 1
+        try:
+            # No sync run reloads the shift map while events stream in
+            self.shift_cache.refresh_if_stale(db_connection)
             
-            db_connection.commit()
-            print(f"HikVision attendance - New: {new_records_count}, Shift Starts: {shift_start_records}, Duplicates: {duplicate_records_count}, Errors: {error_records_count}")
-            return new_records_count > 0
+            cursor = db_connection.cursor()
+            counts = {'new': 0, 'duplicates': 0, 'errors': 0, 'shift_starts': 0, 'shift_ends': 0}
+            normalized, counts['errors'] = self.normalize_records(records)
+            with self.shift_lock:
+                self.store_batch(cursor, normalized, counts)
+                if normalized and not counts['errors']:
+                    self.update_sync_watermark(cursor, max(record.timestamp for record in normalized))
+                self.commit_batch(db_connection)
+            
+            if counts['new']:
+                self.report_counts(counts, 'push')
+            return counts['new'] > 0
             
         except Error as e:
-            print(f"Error storing HikVision attendance to database: {e}")
+            self.logger.error(f"Error storing pushed HikVision events: {e}")
             return False
         finally:
-            if db_connection:
-                db_connection.close()
-
-    def export_clocking_logs(self, filename=None):
-        """Export attendance logs to CSV file"""
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"hikvision_attendance_{timestamp}.csv"
-
-        log_path = os.path.join(self.log_dir, filename)
-
-        print(f"Exporting HikVision attendance logs to {log_path}...")
-
-        attendances = self.get_attendances()
-        if not attendances:
-            print("No HikVision attendance records found")
-            return False
-
-        try:
-            with open(log_path, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow([
-                    'User ID', 'Timestamp', 'Employee Name', 'Event Type', 
-                    'Device Type', 'Device IP', 'Device Location', 'Verification Mode',
-                    'Shift Start', 'Shift End'
-                ])
+            db_connection.close()
 
-                for record in attendances:
-                    user_id = record.get('employeeNoString', 'Unknown')
-                    timestamp = record.get('time', '')
-                    employee_name = record.get('name', '')
-                    verification_mode = record.get('verificationMode', 'Face')
+    def listen_alert_stream(self, stop_event):
+        """
+        Push mode: subscribe to /Event/notification/alertStream and store
+        AccessControllerEvents as they arrive.
+        
+        Runs until stop_event is set. After every (re)connect the stream is
+        opened first and then a watermark-based AcsEvent poll fills the gap
+        left while it was down; events pushed meanwhile wait on the socket and
+        overlap the poll, so nothing between the two is lost (the overlap is
+        dropped as duplicates).
+        """
+        url = f"{self.base_url}/Event/notification/alertStream"
+        retry_delay = 1
+        
+        while not stop_event.is_set():
+            stream_session = None
+            try:
+                if not self.ensure_connected():
+                    raise ConnectionError("Failed to connect to HikVision")
                     
-                    if timestamp:
-                        timestamp = timestamp.split('+')[0]
+                stream_session = requests.Session()
+                stream_session.auth = (self.username, self.password)
+                response = stream_session.get(url, stream=True, timeout=(self.timeout, self.stream_timeout))
+                if response.status_code != 200:
+                    raise ConnectionError(f"alertStream subscription failed. Status: {response.status_code}")
                     
-                    # For CSV export, determine shift events
-                    shift_info = self.get_user_shift_info(user_id)
-                    timestamp_obj = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S") if timestamp else datetime.now()
-                    event_type, is_shift_start, is_shift_end = self.determine_shift_event(
-                        user_id, timestamp_obj, shift_info
-                    )
+                boundary = response.headers.get('Content-Type', '').partition('boundary=')[2] or 'boundary'
+                parser = MultipartStreamParser(boundary)
+                self.logger.info(f"Subscribed to HikVision alertStream at {url}")
+                
+                # Gap-fill what was missed while the stream was down; only now,
+                # with the subscription open, so later punches arrive on the stream
+                self.store_attendance_to_db()
+                retry_delay = 1
+                
+                for chunk in iter_stream_chunks(response):
+                    if stop_event.is_set():
+                        break
+                    # Everything completed by one read is written together
+                    records = [
+                        record for record in
+                        (parse_alert_event(headers, body) for headers, body in parser.feed(chunk))
+                        if record
+                    ]
+                    if records:
+                        self.store_events(records)
+                        
+                if not stop_event.is_set():
+                    raise ConnectionError("alertStream closed by device")
                     
-                    writer.writerow([
-                        user_id,
-                        timestamp,
-                        employee_name,
-                        event_type,
-                        'HIKVISION',
-                        self.ip,
-                        self.device_location,
-                        verification_mode,
-                        'Yes' if is_shift_start else 'No',
-                        'Yes' if is_shift_end else 'No'
-                    ])
+            except Exception as e:
+                self.logger.error(f"HikVision alertStream error: {e}; reconnecting in {retry_delay}s")
+                self.disconnect_from_device()
+                stop_event.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, self.stream_max_retry_delay)
+            finally:
+                if stream_session:
+                    stream_session.close()
 
-            print(f"Successfully exported {len(attendances)} HikVision records to {log_path}")
-            return True
+    def clocking_log_options(self):
+        # The clocking log lists today's events; only those past the watermark are stored
+        return {
+            'start_time': datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
+            'include_stored': True
+        }
 
-        except Exception as e:
-            print(f"Error exporting HikVision logs: {str(e)}")
-            return False
\ No newline at end of file
+    def format_export_row(self, row):
+        (user_id, timestamp, employee_name, event_type, device_type,
+         device_ip, device_location, verification_mode, is_shift_start, is_shift_end) = row
+        return [
+            user_id,
+            timestamp.strftime("%Y-%m-%dT%H:%M:%S"),
+            employee_name,
+            event_type,
+            device_type,
+            device_ip,
+            device_location,
+            verification_mode,
+            'Yes' if is_shift_start else 'No',
+            'Yes' if is_shift_end else 'No'
+        ]
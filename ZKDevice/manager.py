@@ -1,215 +1,177 @@
+import csv
+import gzip
+import hashlib
 import os
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import csv
-from datetime import datetime, time, timedelta
+from time import monotonic
 from zk import ZK, const
-import mysql.connector
 from mysql.connector import Error
+from Common.daily_summary import DailySummaryUpdater
+from Common.device_manager import ER_BAD_FIELD_ERROR, DeviceManager
+from Common.metrics import metrics
+from Common.events import AttendanceEvent
+from Common.pipeline import AttendanceBatch
+from Common.shift_resolver import ShiftEventResolver
 
 load_dotenv()
 
-class ZKDeviceManager:
+
+def _comparable(row):
+    """User row values as compared between the device and the users table (NULL and '' are equal)"""
+    return tuple('' if value is None else str(value) for value in row)
+
+
+class ZKDeviceManager(DeviceManager):
+    
+    device_type = 'ZK'
+    purpose = 'EXIT'
+    display_name = 'ZKTeco'
+    log_prefix = 'zkteco'
+    shift_count_key = 'shift_ends'
+    
+    # Changes whenever a users row is added, removed or updated
+    USER_TABLE_VERSION_QUERY = "SELECT COUNT(*), MAX(updated_at) FROM users"
     
-    def __init__(self, ip=None, port=4370, timeout=5):
-        self.ip = os.getenv('ZK_DEVICE_IP', '192.168.1.20')
-        self.port = int(os.getenv('ZK_DEVICE_PORT', 4370))
-        self.timeout = int(os.getenv('ZK_TIMEOUT', 5))
-        self.device_location = os.getenv('ZK_DEVICE_LOCATION', 'Main Exit')
+    export_columns = """user_id, timestamp, status_code, status_description, event_type,
+                       device_type, device_ip, device_location, is_shift_start, is_shift_end"""
+    export_header = [
+        'User ID', 'Timestamp', 'Status Code', 'Status Description', 
+        'Event Type', 'Device Type', 'Device IP', 'Device Location',
+        'Shift Start', 'Shift End'
+    ]
+    
+    def __init__(self, ip=None, port=None, timeout=None, device_location=None):
+        super().__init__(
+            ip or os.getenv('ZK_DEVICE_IP', '192.168.1.20'),
+            int(port or os.getenv('ZK_DEVICE_PORT', 4370)),
+            int(timeout or os.getenv('ZK_TIMEOUT', 5)),
+            device_location or os.getenv('ZK_DEVICE_LOCATION', 'Main Exit')
+        )
         self.conn = None
         self.zk = None
         
-        self.db_config = {
-            'host': os.getenv('DB_HOST', 'localhost'),
-            'database': os.getenv('DB_NAME', 'attendance_db'),
-            'user': os.getenv('DB_USER', 'root'),
-            'password': os.getenv('DB_PASSWORD', ''),
-            'port': int(os.getenv('DB_PORT', 3306))
-        }
-
-        self.log_dir = os.getenv('LOG_DIR', './logs')
-        os.makedirs(self.log_dir, exist_ok=True)
+        # The exit reader's last OUT of a shift day marks the shift end
+        self.shift_resolver = ShiftEventResolver('ZK', 'OUT')
+        self.daily_summary = DailySummaryUpdater('OUT')
         
-        print(f"Initializing ZKDeviceManager for EXIT reader at {self.ip}:{self.port}")
-
-    def connect_to_db(self):
-        """Establish connection to MySQL database"""
-        try:
-            return mysql.connector.connect(**self.db_config)
-        except Error as e:
-            print(f"Error connecting to MySQL database: {e}")
-            return None
-
-    def get_user_shift_info(self, user_id):
-        """Get user's shift information from database"""
-        db_connection = self.connect_to_db()
-        if not db_connection:
-            return None
-            
-        try:
-            cursor = db_connection.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT u.user_id, u.name, u.shift_id, s.name as shift_name, 
-                       s.start_time, s.end_time
-                FROM users u 
-                LEFT JOIN shifts s ON u.shift_id = s.id 
-                WHERE u.user_id = %s
-            """, (user_id,))
-            
-            result = cursor.fetchone()
-            return result
-            
-        except Error as e:
-            print(f"Error fetching user shift info: {e}")
-            return None
-        finally:
-            if db_connection:
-                db_connection.close()
-
-    def calculate_shift_date_range(self, timestamp, shift_start, shift_end):
-        """
-        Calculate the shift date range for a given timestamp and shift times
-        Handles night shifts that span across two days
-        """
-        record_time = timestamp.time()
-        record_date = timestamp.date()
+        # Live mode: micro-batch window for captured punches, how often the
+        # device log is reconciled while live, and the cap on reconnect backoff
+        self.live_flush_interval = int(os.getenv('ZK_LIVE_FLUSH_INTERVAL', 1))
+        self.live_reconcile_interval = int(os.getenv('ZK_LIVE_RECONCILE_INTERVAL', 900))
+        self.live_max_retry_delay = int(os.getenv('ZK_LIVE_MAX_RETRY_DELAY', 60))
         
-        # Convert shift times to time objects if they're strings
-        if isinstance(shift_start, str):
-            shift_start = datetime.strptime(shift_start, '%H:%M:%S').time()
-        if isinstance(shift_end, str):
-            shift_end = datetime.strptime(shift_end, '%H:%M:%S').time()
+        # Opt-in log rotation: once every record on the device is confirmed in
+        # attendance the device log is cleared, so each fetch only transfers the
+        # punches since the last rotation
+        self.rotate_enabled = os.getenv('ZK_ROTATE_LOG', 'false').lower() in ('1', 'true', 'yes')
+        self.rotate_min_records = int(os.getenv('ZK_ROTATE_MIN_RECORDS', 5000))
+        self.rotate_quiet_seconds = int(os.getenv('ZK_ROTATE_QUIET_SECONDS', 120))
+        self.rotate_archive_dir = os.getenv('ZK_ROTATE_ARCHIVE_DIR') or None
+        self.fetched_log = None
         
-        # For night shifts (end time < start time)
-        if shift_end < shift_start:
-            if record_time >= shift_start:  # After midnight, still same shift day
-                shift_date = record_date
-            else:  # Before midnight, previous day's shift
-                shift_date = record_date - timedelta(days=1)
-        else:
-            # Normal shift (same day)
-            shift_date = record_date
-            
-        return shift_date
-
-    def determine_shift_event(self, user_id, timestamp, shift_info):
-        """
-        Determine if this clock event is a shift start or end
-        Based on whether it's the first IN or last OUT for the shift day
-        """
-        if not shift_info:
-            return 'OUT', False, False
-            
-        db_connection = self.connect_to_db()
-        if not db_connection:
-            return 'OUT', False, False
-            
-        try:
-            cursor = db_connection.cursor()
-            
-            # Calculate shift date for this record
-            shift_date = self.calculate_shift_date_range(
-                timestamp, 
-                shift_info['start_time'], 
-                shift_info['end_time']
-            )
-            
-            # For ZK device (EXIT), we're looking for the last OUT event of the shift day
-            # Check if this is the last OUT event for this user's shift day
-            cursor.execute("""
-                SELECT timestamp 
-                FROM attendance
-                WHERE user_id = %s 
-                AND DATE(timestamp) = %s
-                AND device_type = 'ZK'
-                AND event_type = 'OUT'
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            """, (user_id, shift_date))
-            
-            result = cursor.fetchone()
-            is_shift_end = False
-            
-            if result:
-                # If this timestamp is later than or equal to the last recorded OUT
-                existing_last_out = result[0]
-                if timestamp >= existing_last_out:
-                    is_shift_end = True
-                    # Update previous records to remove shift_end flag
-                    cursor.execute("""
-                        UPDATE attendance 
-                        SET is_shift_end = FALSE 
-                        WHERE user_id = %s 
-                        AND DATE(timestamp) = %s
-                        AND is_shift_end = TRUE
-                    """, (user_id, shift_date))
-            else:
-                # First OUT record for this shift day
-                is_shift_end = True
-            
-            return 'OUT', False, is_shift_end
-            
-        except Error as e:
-            print(f"Error determining shift event: {e}")
-            return 'OUT', False, False
-        finally:
-            if db_connection:
-                db_connection.close()
-
-    def test_connections(self):
-        """Test both device and database connections"""
-        print("\nTesting ZKTeco connections...")
-        print(f"Device Target: {self.ip}:{self.port}")
-        print(f"Database Target: {self.db_config['host']}:{self.db_config['port']}")
+        # User sync: (user count, content hash, users table version) of the last
+        # synced device user list, and how often users are fully checked against the table
+        self.user_sync_interval = int(os.getenv('ZK_USER_SYNC_INTERVAL', 900))
+        self.user_snapshot = None
+        self.user_checked_at = 0.0
         
-        if self.connect_to_device():
-            print("✓ ZKTeco device connection successful")
-            self.disconnect_from_device()
-        else:
-            print("✗ ZKTeco device connection failed")
-        
-        db_conn = self.connect_to_db()
-        if db_conn:
-            print("✓ Database connection successful")
-            db_conn.close()
-        else:
-            print("✗ Database connection failed")
+        self.logger.info(f"Initializing ZKDeviceManager for EXIT reader at {self.ip}:{self.port}")
 
     def connect_to_device(self):
         """Establish connection to the ZKTeco device"""
-        try:
-            print("Attempting to connect to ZKTeco device...")
-            self.zk = ZK(self.ip, port=self.port, timeout=self.timeout)
-            self.conn = self.zk.connect()
-            print("Successfully connected to ZKTeco device!")
-            return True
-        except Exception as e:
-            print(f"Failed to connect to ZKTeco device: {e}")
-            return False
+        with self.device_lock:
+            try:
+                self.logger.info("Attempting to connect to ZKTeco device...")
+                self.zk = ZK(self.ip, port=self.port, timeout=self.timeout)
+                self.conn = self.zk.connect()
+                self.last_activity = monotonic()
+                self.logger.info("Successfully connected to ZKTeco device!")
+                return True
+            except Exception as e:
+                self.logger.error(f"Failed to connect to ZKTeco device: {e}")
+                self.conn = None
+                return False
 
     def disconnect_from_device(self):
         """Terminate the connection"""
-        if self.conn:
+        with self.device_lock:
+            if self.conn:
+                try:
+                    self.conn.disconnect()
+                    self.logger.info("Disconnected from ZKTeco device")
+                except Exception as e:
+                    self.logger.error(f"Error disconnecting from ZKTeco device: {e}")
+                finally:
+                    self.conn = None
+            else:
+                self.logger.info("No active ZKTeco connection to disconnect")
+
+    def is_connected(self):
+        """True while a device session is open"""
+        return bool(self.conn and getattr(self.conn, 'is_connect', True))
+
+    def ensure_connected(self):
+        """Reuse the open device session, connecting only if there is none"""
+        with self.device_lock:
+            if self.is_connected():
+                return True
+            if self.conn:
+                self.disconnect_from_device()
+            return self.connect_to_device()
+
+    def _call_device(self, action):
+        """
+        Run action(conn) on the device session.
+        A failure on a session that was idle may just mean the device dropped
+        the socket, so the session is re-established once and the call retried.
+        """
+        with self.device_lock:
+            if not self.conn:
+                raise ConnectionError("No active connection to ZKTeco device")
             try:
-                self.conn.disconnect()
-                print("Disconnected from ZKTeco device")
+                result = action(self.conn)
             except Exception as e:
-                print(f"Error disconnecting from ZKTeco device: {e}")
-        else:
-            print("No active ZKTeco connection to disconnect")
+                self.logger.warning(f"ZKTeco session looks stale ({e}), reconnecting...")
+                self.disconnect_from_device()
+                if not self.connect_to_device():
+                    raise
+                result = action(self.conn)
+            self.last_activity = monotonic()
+            return result
+
+    def keepalive(self):
+        """
+        Keep an idle device session open with a cheap command.
+        Skipped while a sync holds the session; a failed keepalive drops the
+        session so the next sync reconnects.
+        """
+        if not self.conn or monotonic() - self.last_activity < self.keepalive_interval:
+            return
+        if not self.device_lock.acquire(blocking=False):
+            return
+        try:
+            self.conn.get_time()
+            self.last_activity = monotonic()
+        except Exception as e:
+            self.logger.error(f"ZKTeco keepalive failed, dropping session: {e}")
+            self.disconnect_from_device()
+        finally:
+            self.device_lock.release()
 
     def get_attendances(self):
         """Retrieve all attendance records from the device"""
         if not self.conn:
-            print("No active connection to ZKTeco device")
+            self.logger.warning("No active connection to ZKTeco device")
             return None
             
         try:
-            print("Fetching attendance records from ZKTeco device...")
-            attendances = self.conn.get_attendance()
-            print(f"Successfully retrieved {len(attendances)} attendance records from ZKTeco")
+            self.logger.info("Fetching attendance records from ZKTeco device...")
+            attendances = self._call_device(lambda conn: conn.get_attendance())
+            self.logger.info(f"Successfully retrieved {len(attendances)} attendance records from ZKTeco")
             return attendances
         except Exception as e:
-            print(f"Error fetching attendance records from ZKTeco: {e}")
+            self.logger.error(f"Error fetching attendance records from ZKTeco: {e}")
             return None
 
     def map_status_description(self, status_code):
@@ -226,184 +188,434 @@ class ZKDeviceManager:
         }
         return status_mapping.get(status_code, "Unknown")
 
-    def store_attendance_to_db(self):
-        """Store attendance records from ZKTeco device to database with shift logic"""
-        db_connection = self.connect_to_db()
-        if not db_connection:
-            return False
+    def normalize_record(self, record):
+        """Convert a pyzk attendance record to an AttendanceEvent (pyzk times carry no offset)"""
+        return AttendanceEvent(
+            user_id=record.user_id,
+            timestamp=record.timestamp,
+            status_code=record.status,
+            status_description=self.map_status_description(record.status),
+            employee_name=None,
+            verification_mode='Face'
+        )
+
+    def get_sync_watermark(self, cursor):
+        """
+        Get the (timestamp, record count) of the last committed device log position.
+        Returns (None, 0) when the device has never been synced. Other database
+        errors are raised, so this cycle fails and the next one retries.
+        """
+        try:
+            cursor.execute("""
+                SELECT sync_watermark_timestamp, sync_watermark_count
+                FROM devices
+                WHERE device_ip = %s
+            """, (self.ip,))
+            result = cursor.fetchone()
+        except Error as e:
+            if e.errno != ER_BAD_FIELD_ERROR:
+                raise
+            # Schema without the watermark columns: keep syncing the full log
+            self.logger.error(f"Error reading ZKTeco sync watermark, running full sync: {e}")
+            self.watermark_supported = False
+            return None, 0
+            
+        if not result or result[0] is None:
+            return None, 0
+        return result[0], result[1] or 0
+
+    def update_sync_watermark(self, cursor, timestamp, count):
+        """Record the device log position committed together with the current transaction"""
+        if not self.watermark_supported:
+            return
+        cursor.execute("""
+            UPDATE devices
+            SET sync_watermark_timestamp = %s, sync_watermark_count = %s
+            WHERE device_ip = %s
+        """, (timestamp, count, self.ip))
+
+    def find_sync_start(self, attendances, watermark):
+        """
+        Return the index of the first record past the watermark.
+        The device log is append-only, so the record at the watermark position
+        must still match; otherwise the log was cleared or rolled back and a
+        full reconcile (index 0) is needed.
+        """
+        if not watermark:
+            return 0
+        last_timestamp, last_count = watermark
+        if not last_count or last_timestamp is None:
+            return 0
             
-        attendances = self.get_attendances()
+        if len(attendances) < last_count:
+            self.logger.warning(f"ZKTeco log shrank from {last_count} to {len(attendances)} records, running full reconcile")
+            return 0
+            
+        if attendances[last_count - 1].timestamp != last_timestamp:
+            self.logger.warning("ZKTeco log does not match the sync watermark, running full reconcile")
+            return 0
+            
+        return last_count
+
+    def iter_batches(self, batch_size=None, full_sync=False, db_connection=None, include_stored=False):
+        """
+        Read the device log once and yield AttendanceBatches past the sync watermark,
+        read on db_connection when given. Each batch carries the (timestamp, count)
+        watermark to commit with it. With include_stored, the records before the
+        watermark are yielded first as stored batches, for sinks that list the whole log.
+        """
+        batch_size = batch_size or self.batch_size
+        
+        with metrics.timer(self, 'fetch'):
+            attendances = self.get_attendances()
+        if self.rotate_enabled:
+            # Kept for rotate_device_log, which runs once this sync is stored
+            self.fetched_log = attendances
         if not attendances:
-            print("No attendance records found on ZKTeco device")
-            db_connection.close()
-            return False
+            self.logger.info("No attendance records found on ZKTeco device")
+            return
             
-        try:
-            cursor = db_connection.cursor()
+        sync_start = 0 if full_sync else self.find_sync_start(attendances, self.load_sync_watermark(db_connection))
+        if include_stored:
+            for start in range(0, sync_start, batch_size):
+                batch = attendances[start:min(start + batch_size, sync_start)]
+                with metrics.timer(self, 'parse'):
+                    records = self.normalize_records(batch)[0]
+                yield AttendanceBatch(self.device_type, self.ip, self.device_location, records, stored=True)
+                
+        if sync_start >= len(attendances):
+            self.logger.info("No new ZKTeco attendance records since last sync")
+            return
+        if sync_start:
+            self.logger.info(f"Processing {len(attendances) - sync_start} ZKTeco records past the sync watermark")
             
-            # Update device last sync
-            cursor.execute("""
-                INSERT INTO devices (device_type, device_ip, device_location, purpose, last_sync, status)
-                VALUES ('ZK', %s, %s, 'EXIT', NOW(), 'ONLINE')
-                ON DUPLICATE KEY UPDATE last_sync = NOW(), status = 'ONLINE'
-            """, (self.ip, self.device_location))
+        for start in range(sync_start, len(attendances), batch_size):
+            batch = attendances[start:start + batch_size]
+            with metrics.timer(self, 'parse'):
+                records, errors = self.normalize_records(batch)
+            yield AttendanceBatch(
+                self.device_type,
+                self.ip,
+                self.device_location,
+                records,
+                watermark=(batch[-1].timestamp, start + len(batch)),
+                errors=errors
+            )
+
+    def store_records(self, records):
+        """
+        Store a micro-batch of punches captured live from the device right away.
+        Uses the same shift resolution and insert path as the log dump.
+        """
+        db_connection = self.connect_to_db()
+        if not db_connection:
+            return False
             
-            new_records_count = 0
-            duplicate_records_count = 0
-            error_records_count = 0
-            shift_end_records = 0
+        try:
+            # No sync run reloads the shift map while events stream in
+            self.shift_cache.refresh_if_stale(db_connection)
             
-            for record in attendances:
-                try:
-                    # Get user shift information
-                    shift_info = self.get_user_shift_info(record.user_id)
-                    
-                    # Determine event type and shift flags
-                    event_type, is_shift_start, is_shift_end = self.determine_shift_event(
-                        record.user_id, record.timestamp, shift_info
-                    )
-                    
-                    # Get user details
-                    employee_name = f"User_{record.user_id}"
-                    shift_id = None
-                    shift_name = None
-                    
-                    if shift_info:
-                        employee_name = shift_info['name']
-                        shift_id = shift_info['shift_id']
-                        shift_name = shift_info['shift_name']
-                    
-                    # Map status description
-                    status_description = self.map_status_description(record.status)
-                    
-                    # Insert attendance record
-                    cursor.execute("""
-                        INSERT INTO attendance (
-                            user_id, employee_name, timestamp, event_type, 
-                            status_code, status_description, device_type, 
-                            device_ip, device_location, verification_mode,
-                            shift_id, shift_name, is_shift_start, is_shift_end
-                        ) VALUES (%s, %s, %s, %s, %s, %s, 'ZK', %s, %s, 'Face', %s, %s, %s, %s)
-                    """, (
-                        record.user_id,
-                        employee_name,
-                        record.timestamp,
-                        event_type,
-                        record.status,
-                        status_description,
-                        self.ip,
-                        self.device_location,
-                        shift_id,
-                        shift_name,
-                        is_shift_start,
-                        is_shift_end
-                    ))
-                    
-                    new_records_count += 1
-                    if is_shift_end:
-                        shift_end_records += 1
-                        
-                except Error as e:
-                    if 'unique_clock_record' in str(e):
-                        duplicate_records_count += 1
-                    else:
-                        print(f"Error inserting record for user {record.user_id}: {e}")
-                        error_records_count += 1
-                except Exception as e:
-                    print(f"Unexpected error for record {record.user_id}: {e}")
-                    error_records_count += 1
+            cursor = db_connection.cursor()
+            counts = {'new': 0, 'duplicates': 0, 'errors': 0, 'shift_starts': 0, 'shift_ends': 0}
+            with self.shift_lock:
+                self.store_batch(cursor, self.normalize_records(records)[0], counts)
+                self.commit_batch(db_connection)
             
-            db_connection.commit()
-            print(f"ZKTeco attendance - New: {new_records_count}, Shift Ends: {shift_end_records}, Duplicates: {duplicate_records_count}, Errors: {error_records_count}")
-            return new_records_count > 0
+            if counts['new']:
+                self.report_counts(counts, 'live')
+            return counts['new'] > 0
             
         except Error as e:
-            print(f"Error storing ZKTeco attendance to database: {e}")
+            self.logger.error(f"Error storing live ZKTeco punches: {e}")
             return False
         finally:
-            if db_connection:
-                db_connection.close()
+            db_connection.close()
 
-    def export_clocking_logs(self, filename=None):
-        """Export attendance logs to CSV file"""
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"zkteco_attendance_{timestamp}.csv"
+    def live_capture(self, stop_event):
+        """
+        Live mode: keep a pyzk live_capture() session open and write punches as they happen.
+        
+        Punches are micro-batched: a batch is written when the device has been
+        quiet for live_flush_interval seconds, when it reaches batch_size, or when
+        its oldest punch is live_flush_interval old, so bursts at shift change go
+        in together. After every (re)connect, and every live_reconcile_interval
+        seconds, users are synced and the log is reconciled past the watermark
+        so nothing captured while disconnected is missed. Runs until stop_event is set.
+        """
+        retry_delay = 1
+        
+        while not stop_event.is_set():
+            try:
+                if not self.ensure_connected():
+                    raise ConnectionError("Failed to connect to ZKTeco device")
+                    
+                # Reconcile against the device log before going live
+                self.sync_users_to_db()
+                self.store_attendance_to_db()
+                self.finish_sync()
+                reconcile_at = monotonic() + self.live_reconcile_interval
+                
+                pending = []
+                first_pending_at = 0.0
+                
+                with self.device_lock:
+                    self.logger.info("ZKTeco live capture started")
+                    for record in self.conn.live_capture(new_timeout=self.live_flush_interval):
+                        now = monotonic()
+                        self.last_activity = now
+                        
+                        if record is not None:
+                            if not pending:
+                                first_pending_at = now
+                            pending.append(record)
+                            
+                        # record is None when the device was quiet for the whole timeout
+                        if pending and (record is None
+                                        or len(pending) >= self.batch_size
+                                        or now - first_pending_at >= self.live_flush_interval):
+                            self.store_records(pending)
+                            pending = []
+                            
+                        if stop_event.is_set() or now >= reconcile_at:
+                            self.conn.end_live_capture = True
+                            
+                    if pending:
+                        self.store_records(pending)
+                    self.logger.info("ZKTeco live capture paused")
+                    
+                retry_delay = 1
+                
+            except Exception as e:
+                self.logger.error(f"ZKTeco live capture error: {e}; reconnecting in {retry_delay}s")
+                self.disconnect_from_device()
+                stop_event.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, self.live_max_retry_delay)
 
-        log_path = os.path.join(self.log_dir, filename)
+    def clocking_log_options(self):
+        # The clocking log lists the whole device log; only records past the watermark are stored
+        return {'include_stored': True}
 
-        print(f"Exporting ZKTeco attendance logs to {log_path}...")
+    def format_export_row(self, row):
+        (user_id, timestamp, status_code, status_description, event_type,
+         device_type, device_ip, device_location, is_shift_start, is_shift_end) = row
+        return [
+            user_id,
+            timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            status_code,
+            status_description,
+            event_type,
+            device_type,
+            device_ip,
+            device_location,
+            'Yes' if is_shift_start else 'No',
+            'Yes' if is_shift_end else 'No'
+        ]
 
-        attendances = self.get_attendances()
-        if not attendances:
-            print("No ZKTeco attendance records found")
-            return False
+    def prepare_sync(self):
+        """Sync users before attendance so new staff resolve to their shifts"""
+        self.sync_users_to_db()
+
+    def finish_sync(self):
+        """Rotate the device log after the sync when ZK_ROTATE_LOG is enabled"""
+        if self.rotate_enabled:
+            try:
+                self.rotate_device_log()
+            except Exception as e:
+                self.logger.error(f"ZKTeco log rotation failed, device log kept: {e}")
+            finally:
+                self.fetched_log = None
 
+    def verify_log_stored(self, attendances):
+        """
+        Check that every (user_id, timestamp) in a device log dump is in attendance.
+        Records older than the retention window were archived from attendance
+        and are not checked. Returns True when nothing is missing.
+        """
+        cutoff = self.archive_cutoff()
+        keys = {
+            (str(record.user_id), record.timestamp)
+            for record in attendances
+            if cutoff is None or record.timestamp >= cutoff
+        }
+        if not keys:
+            return True
+            
+        db_connection = self.connect_to_db()
+        if not db_connection:
+            return False
         try:
-            with open(log_path, mode='w', newline='', encoding='utf-8') as file:
+            cursor = db_connection.cursor(buffered=False)
+            cursor.execute("""
+                SELECT user_id, timestamp FROM attendance
+                WHERE device_type = %s AND device_ip = %s
+                AND timestamp BETWEEN %s AND %s
+            """, (self.device_type, self.ip, min(timestamp for _, timestamp in keys),
+                  max(timestamp for _, timestamp in keys)))
+            missing = set(keys)
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                missing.difference_update((str(user_id), timestamp) for user_id, timestamp in rows)
+            cursor.close()
+        finally:
+            db_connection.close()
+            
+        if missing:
+            self.logger.warning(f"{len(missing)} of {len(keys)} ZKTeco log records are not in attendance yet, device log kept")
+            return False
+        self.logger.info(f"Verified all {len(keys)} ZKTeco log records in attendance")
+        return True
+
+    def archive_device_log(self, attendances):
+        """Write the raw device log to a gzip CSV in rotate_archive_dir before it is cleared"""
+        os.makedirs(self.rotate_archive_dir, exist_ok=True)
+        filename = f"{self.log_prefix}_{self.ip}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv.gz"
+        path = os.path.join(self.rotate_archive_dir, filename)
+        partial = path + '.partial'
+        
+        with open(partial, 'wb') as raw:
+            with gzip.open(raw, mode='wt', newline='', encoding='utf-8') as file:
                 writer = csv.writer(file)
-                writer.writerow([
-                    'User ID', 'Timestamp', 'Status Code', 'Status Description', 
-                    'Event Type', 'Device Type', 'Device IP', 'Device Location',
-                    'Shift Start', 'Shift End'
-                ])
+                writer.writerow(['UID', 'User ID', 'Timestamp', 'Status', 'Punch'])
+                writer.writerows(
+                    (record.uid, record.user_id, record.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                     record.status, record.punch)
+                    for record in attendances
+                )
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(partial, path)
+        self.logger.info(f"Archived {len(attendances)} ZKTeco log records to {path}")
+        return path
 
-                for record in attendances:
-                    status_description = self.map_status_description(record.status)
-                    
-                    # For CSV export, we'll determine shift events on the fly
-                    shift_info = self.get_user_shift_info(record.user_id)
-                    event_type, is_shift_start, is_shift_end = self.determine_shift_event(
-                        record.user_id, record.timestamp, shift_info
-                    )
-                    
-                    writer.writerow([
-                        record.user_id,
-                        record.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                        record.status,
-                        status_description,
-                        event_type,
-                        'ZK',
-                        self.ip,
-                        self.device_location,
-                        'Yes' if is_shift_start else 'No',
-                        'Yes' if is_shift_end else 'No'
-                    ])
+    def rotate_device_log(self):
+        """
+        Clear the device log once everything read from it is safely stored.
+        
+        Runs after a sync, on the log that sync fetched, and only when the log
+        holds at least rotate_min_records records, no batches are waiting in
+        the local spool, the newest punch is rotate_quiet_seconds old on the
+        device clock and every record is found in attendance. The raw log is
+        archived first when rotate_archive_dir is set. The device is disabled
+        while its record count is re-checked and the log cleared, so a punch
+        arriving after the read is never lost. The sync watermark is reset
+        afterwards. Returns True when the log was cleared.
+        """
+        attendances = self.fetched_log
+        if not attendances or len(attendances) < self.rotate_min_records:
+            return False
+        if self.spool and self.spool.has_pending(self.ip):
+            self.logger.info("ZKTeco log rotation postponed: spooled batches are not in MySQL yet")
+            return False
+            
+        with self.device_lock:
+            device_time = self._call_device(lambda conn: conn.get_time())
+            newest = max(record.timestamp for record in attendances)
+            if device_time - newest < timedelta(seconds=self.rotate_quiet_seconds):
+                self.logger.info(f"ZKTeco log rotation postponed: punches within the last {self.rotate_quiet_seconds}s")
+                return False
+                
+            with metrics.timer(self, 'rotate_verify'):
+                if not self.verify_log_stored(attendances):
+                    return False
+            if self.rotate_archive_dir:
+                self.archive_device_log(attendances)
+                
+            # No retry on a stale session here: the device must stay disabled
+            # from the count check until the log is cleared
+            conn = self.conn
+            conn.disable_device()
+            try:
+                conn.read_sizes()
+                if conn.records != len(attendances):
+                    self.logger.info(f"ZKTeco log rotation postponed: {conn.records - len(attendances)} punches arrived since the log was read")
+                    return False
+                conn.clear_attendance()
+            finally:
+                conn.enable_device()
+                self.last_activity = monotonic()
+                
+        self.logger.info(f"Cleared {len(attendances)} records from the ZKTeco device log")
+        metrics.inc(self, 'log_rotations')
+        
+        # An unreset watermark is also safe: the shrunken log triggers a full reconcile
+        db_connection = self.connect_to_db()
+        if db_connection:
+            try:
+                cursor = db_connection.cursor()
+                self.update_sync_watermark(cursor, None, 0)
+                db_connection.commit()
+            except Error as e:
+                self.logger.error(f"Error resetting ZKTeco sync watermark after rotation: {e}")
+            finally:
+                db_connection.close()
+        return True
 
-            print(f"Successfully exported {len(attendances)} ZKTeco records to {log_path}")
-            return True
+    def device_user_rows(self, users):
+        """users table values (user_id, name, privilege, card_number, department) for pyzk users"""
+        return [
+            (str(user.user_id), user.name, 'Admin' if user.privilege == const.USER_ADMIN else 'User',
+             user.password, user.group_id)
+            for user in users
+        ]
 
+    def sync_users_to_db(self, force=False):
+        """
+        Sync users from ZKTeco device to database, writing only what changed.
+        
+        Between full checks (every user_sync_interval seconds, or with force)
+        only the device's user counter is read, and users are fetched when it
+        moves. The fetched list is compared with the users table, and the new
+        or changed rows are upserted in one batch, unless both its content hash
+        and the table's (COUNT, MAX(updated_at)) match the last sync, so
+        unchanged full checks skip the diff while edits made in the table are
+        still corrected.
+        Returns True when the device users are in sync.
+        """
+        if not self.conn:
+            self.logger.warning("No active connection to ZKTeco device")
+            return False
+            
+        full_check = force or self.user_snapshot is None or monotonic() - self.user_checked_at >= self.user_sync_interval
+        try:
+            if not full_check:
+                user_count = self._call_device(lambda conn: conn.read_sizes() and conn.users)
+                if user_count == self.user_snapshot[0]:
+                    return True
+                    
+            with metrics.timer(self, 'user_fetch'):
+                users = self._call_device(lambda conn: conn.get_users())
         except Exception as e:
-            print(f"Error exporting ZKTeco logs: {str(e)}")
+            self.logger.error(f"Error reading ZKTeco users: {e}")
             return False
-
-    def sync_users_to_db(self):
-        """Sync users from ZKTeco device to database"""
-        if not self.conn:
-            print("No active connection to ZKTeco device")
+            
+        if not users:
+            self.logger.info("No users found on ZKTeco device")
             return False
             
+        rows = self.device_user_rows(users)
+        digest = hashlib.sha1(repr(sorted(rows)).encode()).hexdigest()
+            
         db_connection = self.connect_to_db()
         if not db_connection:
             return False
             
         try:
             cursor = db_connection.cursor()
-            users = self.conn.get_users()
-            
-            if not users:
-                print("No users found on ZKTeco device")
-                return False
-            
-            new_users_count = 0
-            updated_users_count = 0
-            
-            for user in users:
-                privilege = 'User'
-                if user.privilege == const.USER_ADMIN:
-                    privilege = 'Admin'
+            cursor.execute(self.USER_TABLE_VERSION_QUERY)
+            table_version = tuple(cursor.fetchone())
+            if self.user_snapshot and self.user_snapshot[1:] == (digest, table_version):
+                self.user_snapshot = (len(users), digest, table_version)
+                self.user_checked_at = monotonic()
+                return True
                 
-                cursor.execute("""
+            cursor.execute("SELECT user_id, name, privilege, card_number, department FROM users")
+            existing = {str(row[0]): _comparable(row) for row in cursor.fetchall()}
+            changed = [row for row in rows if existing.get(row[0]) != _comparable(row)]
+            
+            if changed:
+                cursor.executemany("""
                     INSERT INTO users (user_id, name, privilege, card_number, department)
                     VALUES (%s, %s, %s, %s, %s)
                     ON DUPLICATE KEY UPDATE 
@@ -412,20 +624,21 @@ class ZKDeviceManager:
                         card_number = VALUES(card_number),
                         department = VALUES(department),
                         updated_at = CURRENT_TIMESTAMP
-                """, (user.user_id, user.name, privilege, user.password, user.group_id))
+                """, changed)
+                db_connection.commit()
                 
-                if cursor.rowcount == 1:
-                    new_users_count += 1
-                else:
-                    updated_users_count += 1
-            
-            db_connection.commit()
-            print(f"ZKTeco users - New: {new_users_count}, Updated: {updated_users_count}")
+                new_users_count = sum(1 for row in changed if row[0] not in existing)
+                self.logger.info(f"ZKTeco users - New: {new_users_count}, Updated: {len(changed) - new_users_count}")
+                
+                cursor.execute(self.USER_TABLE_VERSION_QUERY)
+                table_version = tuple(cursor.fetchone())
+                
+            self.user_snapshot = (len(users), digest, table_version)
+            self.user_checked_at = monotonic()
             return True
             
         except Exception as e:
-            print(f"Error syncing ZKTeco users: {e}")
+            self.logger.error(f"Error syncing ZKTeco users: {e}")
             return False
         finally:
-            if db_connection:
-                db_connection.close()
\ No newline at end of file
+            db_connection.close()
\ No newline at end of file
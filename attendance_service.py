@@ -12,6 +12,7 @@ from datetime import datetime
 # Add the application directory to Python path
 sys.path.append('C:\\Users\\Admin\\Documents\\pyzk_tests')
 
+from Common.log import setup_logging
 from main_continuous import AttendanceSystem
 
 class AttendanceWindowsService(win32serviceutil.ServiceFramework):
@@ -38,14 +39,10 @@ class AttendanceWindowsService(win32serviceutil.ServiceFramework):
         self.main()
 
     def main(self):
-        # Set up logging to Windows Event Log
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('C:\\Users\\Admin\\Documents\\pyzk_tests\\logs\\attendance_service.log'),
-                logging.StreamHandler()
-            ]
+        # Queued JSON logging to the service log; there is no console under the service
+        setup_logging(
+            log_file='C:\\Users\\Admin\\Documents\\pyzk_tests\\logs\\attendance_service.log',
+            console=False
         )
         self.logger = logging.getLogger('AttendanceService')
         
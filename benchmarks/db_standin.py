@@ -0,0 +1,297 @@
+"""
+Database stand-ins for the benchmarks.
+
+SQLitePool serves the application's MySQL statements from a local SQLite
+file, translating the few MySQL-only constructs the ingestion path uses.
+CountingPool wraps either it or the real ConnectionPool and counts the
+statements issued, so runs can be compared by DB round trips.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from datetime import date, datetime
+from mysql.connector.errors import PoolError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shifts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    privilege TEXT DEFAULT 'User',
+    card_number TEXT,
+    department TEXT,
+    shift_id INTEGER DEFAULT 1,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    employee_name TEXT,
+    timestamp TEXT NOT NULL,
+    shift_date TEXT,
+    event_type TEXT NOT NULL,
+    status_code INTEGER,
+    status_description TEXT,
+    device_type TEXT NOT NULL,
+    device_ip TEXT NOT NULL,
+    device_location TEXT,
+    verification_mode TEXT,
+    shift_id INTEGER,
+    shift_name TEXT,
+    is_shift_start BOOLEAN DEFAULT FALSE,
+    is_shift_end BOOLEAN DEFAULT FALSE,
+    UNIQUE (user_id, timestamp, device_type, device_ip)
+);
+CREATE INDEX IF NOT EXISTS idx_shift_lookup ON attendance (user_id, shift_date, device_type, event_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance (timestamp);
+CREATE TABLE IF NOT EXISTS attendance_daily (
+    user_id TEXT NOT NULL,
+    shift_date TEXT NOT NULL,
+    shift_id INTEGER,
+    first_in TEXT,
+    last_out TEXT,
+    worked_seconds INTEGER,
+    punch_count INTEGER NOT NULL DEFAULT 0,
+    in_count INTEGER NOT NULL DEFAULT 0,
+    out_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, shift_date)
+);
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_type TEXT NOT NULL,
+    device_ip TEXT NOT NULL UNIQUE,
+    device_port INTEGER,
+    device_name TEXT,
+    device_location TEXT,
+    purpose TEXT DEFAULT 'ENTRY',
+    last_sync TEXT,
+    sync_watermark_timestamp TEXT,
+    sync_watermark_count INTEGER NOT NULL DEFAULT 0,
+    status TEXT DEFAULT 'ONLINE'
+);
+"""
+
+# Conflict targets for ON DUPLICATE KEY UPDATE statements that change columns
+UPSERT_TARGETS = {
+    'devices': 'device_ip',
+    'users': 'user_id',
+    'attendance_daily': 'user_id, shift_date',
+}
+
+_DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+sqlite3.register_adapter(datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+class _BitXor:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value ^= int(value)
+
+    def finalize(self):
+        return self.value
+
+
+def _seconds_between(start, end):
+    if start is None or end is None:
+        return None
+    return int((_convert(end) - _convert(start)).total_seconds())
+
+
+def translate(sql):
+    """Rewrite one of the application's MySQL statements for SQLite"""
+    sql = sql.replace('%s', '?')
+    sql = sql.replace('TIMESTAMPDIFF(SECOND,', 'TIMESTAMPDIFF_SECONDS(')
+    # (a, b) IN ((?, ?), ...) needs a VALUES list in SQLite
+    sql = sql.replace('IN ((?', 'IN (VALUES (?')
+    sql = re.sub(r'ON DUPLICATE KEY UPDATE\s+id\s*=\s*id', 'ON CONFLICT DO NOTHING', sql)
+
+    match = re.search(r'ON DUPLICATE KEY UPDATE', sql)
+    if match:
+        table = re.search(r'INSERT INTO\s+(\w+)', sql).group(1)
+        assignments = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', sql[match.end():])
+        sql = f"{sql[:match.start()]}ON CONFLICT({UPSERT_TARGETS[table]}) DO UPDATE SET {assignments}"
+    return sql
+
+
+def _convert(value):
+    if isinstance(value, str):
+        if _DATETIME_RE.match(value):
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        if _DATE_RE.match(value):
+            return date.fromisoformat(value)
+    return value
+
+
+class SQLiteCursor:
+    """mysql.connector-style cursor over sqlite3"""
+
+    def __init__(self, connection, dictionary=False):
+        self._cursor = connection.cursor()
+        self.dictionary = dictionary
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(translate(sql), tuple(params or ()))
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(translate(sql), [tuple(params) for params in seq_of_params])
+
+    def _row(self, row):
+        row = tuple(_convert(value) for value in row)
+        if self.dictionary:
+            return dict(zip([column[0] for column in self._cursor.description], row))
+        return row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return self._row(row) if row is not None else None
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, connection, lock):
+        self._connection = connection
+        self._lock = lock
+
+    def cursor(self, buffered=None, dictionary=False):
+        return SQLiteCursor(self._connection, dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        if self._lock is not None:
+            # Like ConnectionPool.release, never hand back an open transaction
+            self._connection.rollback()
+            self._lock.release()
+            self._lock = None
+
+
+class SQLitePool:
+    """
+    Single-connection stand-in for ConnectionPool; checkouts are serialized.
+    A checkout while the connection is out, including a second one from the
+    same thread, waits and then fails like an exhausted pool, so code that
+    needs two connections at once shows up in benchmark runs.
+    """
+
+    def __init__(self, path, wait_timeout=None):
+        self.path = path
+        self.max_size = 1
+        self.wait_timeout = float(wait_timeout or os.getenv('DB_POOL_TIMEOUT', 10))
+        self.config = {'host': 'sqlite', 'port': path}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.create_function('NOW', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self._connection.create_function('CRC32', 1, lambda value: zlib.crc32(str(value).encode()))
+        self._connection.create_function(
+            'CONCAT_WS', -1, lambda sep, *values: sep.join(str(value) for value in values if value is not None)
+        )
+        self._connection.create_function('TIMESTAMPDIFF_SECONDS', 2, _seconds_between)
+        self._connection.create_aggregate('BIT_XOR', 1, _BitXor)
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def get_connection(self):
+        if not self._lock.acquire(timeout=self.wait_timeout):
+            raise PoolError(f"No database connection available within {self.wait_timeout}s (pool size 1)")
+        return SQLiteConnection(self._connection, self._lock)
+
+    def stats_summary(self):
+        return f"sqlite {self.path}"
+
+    def close_all(self):
+        self._connection.close()
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def _count(self, sql, rows):
+        verb = sql.split(None, 1)[0].upper()
+        self._counter['statements'] += 1
+        self._counter[verb] += 1
+        self._counter['rows_sent'] += rows
+
+    def execute(self, sql, params=()):
+        self._count(sql, 1)
+        return self._cursor.execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._count(sql, len(seq_of_params))
+        return self._cursor.executemany(sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, connection, counter):
+        self._connection = connection
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._counter)
+
+    def commit(self):
+        self._counter['commits'] += 1
+        return self._connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class CountingPool:
+    """Wraps a pool and counts statements, rows sent and commits across its connections"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.counter = Counter()
+
+    def get_connection(self):
+        self.counter['checkouts'] += 1
+        return CountingConnection(self._pool.get_connection(), self.counter)
+
+    def reset(self):
+        self.counter = Counter()
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
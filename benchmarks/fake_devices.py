@@ -0,0 +1,237 @@
+"""
+Local stand-ins for the attendance readers.
+
+FakeZK replaces zk.ZK inside ZKDevice.manager and serves synthetic records
+through the same calls pyzk exposes (connect, get_attendance, get_users,
+get_time, disconnect). FakeISAPIServer is a real HTTP server answering
+/ISAPI/System/deviceInfo, paged /ISAPI/AccessControl/AcsEvent searches and a
+multipart /ISAPI/Event/notification/alertStream.
+"""
+
+import json
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_TIME = datetime(2026, 1, 5, 6, 0, 0)
+
+Attendance = namedtuple('Attendance', ['uid', 'user_id', 'timestamp', 'status', 'punch'])
+User = namedtuple('User', ['uid', 'user_id', 'name', 'privilege', 'password', 'group_id', 'card'])
+
+
+def synthetic_user_id(index, user_count):
+    return str(index % user_count + 1)
+
+
+def synthetic_timestamp(index):
+    """One event per second from BASE_TIME, so (user, timestamp) is unique and the log is ordered"""
+    return BASE_TIME + timedelta(seconds=index)
+
+
+class FakeZKConnection:
+    def __init__(self, record_count, user_count):
+        self.record_count = record_count
+        self.user_count = user_count
+        self.is_connect = True
+        self.end_live_capture = False
+
+    def get_attendance(self):
+        return [
+            Attendance(index, synthetic_user_id(index, self.user_count), synthetic_timestamp(index), index % 2, 1)
+            for index in range(self.record_count)
+        ]
+
+    def get_users(self):
+        return [
+            User(index, str(index), f"User {index}", 0, '', '', 0)
+            for index in range(1, self.user_count + 1)
+        ]
+
+    def get_time(self):
+        return datetime.now()
+
+    def disconnect(self):
+        self.is_connect = False
+
+
+class FakeZK:
+    """Drop-in for zk.ZK; configure record_count/user_count on the class before connecting"""
+
+    record_count = 0
+    user_count = 1000
+
+    def __init__(self, ip, port=4370, timeout=5, **kwargs):
+        self.ip = ip
+        self.port = port
+
+    def connect(self):
+        return FakeZKConnection(self.record_count, self.user_count)
+
+
+STREAM_BOUNDARY = 'MIME_boundary'
+
+
+def _alert_part(payload, content_length=True):
+    """One multipart part carrying an alert JSON, with or without a Content-Length header"""
+    body = json.dumps(payload).encode()
+    headers = [f"--{STREAM_BOUNDARY}", "Content-Type: application/json; charset=\"UTF-8\""]
+    if content_length:
+        headers.append(f"Content-Length: {len(body)}")
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode() + body + b'\r\n'
+
+
+def _heartbeat_part():
+    return _alert_part({'ipAddress': '127.0.0.1', 'eventType': 'videoloss', 'eventState': 'inactive',
+                        'dateTime': datetime.now().strftime('%Y-%m-%dT%H:%M:%S+00:00')})
+
+
+def _access_part(index, user_count, minor=1, content_length=True):
+    user_id = synthetic_user_id(index, user_count)
+    return _alert_part({
+        'ipAddress': '127.0.0.1',
+        'eventType': 'AccessControllerEvent',
+        'dateTime': synthetic_timestamp(index).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'AccessControllerEvent': {
+            'majorEventType': 5,
+            'subEventType': minor,
+            'employeeNoString': user_id,
+            'name': f"User {user_id}",
+            'currentVerifyMode': 'face',
+            'serialNo': index + 1,
+        },
+    }, content_length)
+
+
+def alert_stream_body(first_index, count, user_count):
+    """
+    The multipart bytes pushed for events first_index .. first_index + count - 1:
+    heartbeats between them, every third part without a Content-Length, and a
+    denied attempt (minor 76) after every fifth event, which must not be stored
+    """
+    parts = [_heartbeat_part()]
+    for offset, index in enumerate(range(first_index, first_index + count)):
+        parts.append(_access_part(index, user_count, content_length=offset % 3 != 2))
+        if offset % 5 == 4:
+            parts.append(_access_part(index, user_count, minor=76))
+            parts.append(_heartbeat_part())
+    return b''.join(parts)
+
+
+class _ISAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_alerts(self):
+        """
+        Multipart alertStream: the first subscription gets the queued push
+        events, written in small chunks that split headers, bodies and
+        boundaries; every subscription then gets a heartbeat twice a second
+        until the server stops.
+        """
+        server = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', f"multipart/mixed; boundary={STREAM_BOUNDARY}")
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        with server.push_lock:
+            body, server.push_body = server.push_body, b''
+        try:
+            for start in range(0, len(body), 37):
+                self.wfile.write(body[start:start + 37])
+                self.wfile.flush()
+            while not server.stopping.wait(0.5):
+                self.wfile.write(_heartbeat_part())
+                self.wfile.flush()
+        except OSError:
+            pass
+
+    def do_GET(self):
+        if self.path.startswith('/ISAPI/Event/notification/alertStream'):
+            self._stream_alerts()
+        elif self.path.startswith('/ISAPI/System/deviceInfo'):
+            body = b'<?xml version="1.0"?><DeviceInfo><deviceName>Fake ISAPI</deviceName></DeviceInfo>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {'statusString': 'Not Found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.startswith('/ISAPI/AccessControl/AcsEvent'):
+            self._send_json(404, {'statusString': 'Not Found'})
+            return
+
+        server = self.server
+        condition = request.get('AcsEventCond', {})
+        position = int(condition.get('searchResultPosition', 0))
+        max_results = int(condition.get('maxResults', 30))
+        end = min(position + max_results, server.record_count)
+        events = [
+            {
+                'major': 5,
+                'minor': 75,
+                'time': synthetic_timestamp(index).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+                'employeeNoString': synthetic_user_id(index, server.user_count),
+                'name': f"User {synthetic_user_id(index, server.user_count)}",
+                'verificationMode': 'face',
+                'serialNo': index + 1,
+            }
+            for index in range(position, end)
+        ]
+        self._send_json(200, {
+            'AcsEvent': {
+                'searchID': condition.get('searchID'),
+                'responseStatusStrg': 'MORE' if end < server.record_count else 'OK',
+                'numOfMatches': len(events),
+                'totalMatches': server.record_count,
+                'InfoList': events,
+            }
+        })
+
+
+class FakeISAPIServer:
+    """
+    HikVision ISAPI stand-in on 127.0.0.1, serving record_count synthetic events
+    to AcsEvent searches and push_count further events on the alertStream
+    """
+
+    def __init__(self, record_count, user_count=1000, port=0, push_count=0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), _ISAPIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.record_count = record_count
+        self.httpd.user_count = user_count
+        self.httpd.push_lock = threading.Lock()
+        self.httpd.push_body = alert_stream_body(record_count, push_count, user_count)
+        self.httpd.stopping = threading.Event()
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='fake-isapi', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
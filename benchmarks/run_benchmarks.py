@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Ingestion benchmarks against local device stand-ins.
+
+Drives ZKDeviceManager.store_attendance_to_db, HikVisionDeviceManager.store_attendance_to_db
+and export_clocking_logs over synthetic logs of each size and reports
+throughput, per-record commit latency, DB statement counts and peak memory.
+The hikvision push phase runs listen_alert_stream against the fake server's
+multipart alertStream and fails unless exactly the pushed punches are stored.
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 1000,10000 --devices zk --json results.json
+    python -m benchmarks.run_benchmarks --mysql   # DB_* must point at a scratch schema
+
+Per-record latency is the time from a batch leaving the device reader until
+it is committed, weighted by the records in the batch.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Common.db
+import Common.device_manager
+import ZKDevice.manager
+from Common.log import setup_logging
+from Common.pipeline import DatabaseSink
+from Common.shift_cache import user_shift_cache
+from HikVisionDevice.manager import HikVisionDeviceManager
+from ZKDevice.manager import ZKDeviceManager
+from benchmarks.db_standin import CountingPool, SQLitePool
+from benchmarks.fake_devices import BASE_TIME, FakeISAPIServer, FakeZK
+
+DEFAULT_SIZES = '1000,10000,100000,1000000'
+BENCH_ZK_IP = '127.0.0.2'
+
+SHIFTS = [
+    (1, 'Morning', '08:00:00', '16:00:00'),
+    (2, 'Evening', '16:00:00', '00:00:00'),
+    (3, 'Night', '00:00:00', '08:00:00'),
+    (4, 'Flexible', '09:00:00', '17:00:00'),
+]
+
+
+class TimedDatabaseSink(DatabaseSink):
+    """DatabaseSink that records how long each batch took to reach a commit"""
+
+    batch_timings = []
+
+    def write(self, batch):
+        started = time.perf_counter()
+        super().write(batch)
+        self.batch_timings.append((time.perf_counter() - started, len(batch.records)))
+
+
+def weighted_percentile(timings, percentile):
+    """Percentile of per-record latencies given (latency, record count) pairs"""
+    total = sum(count for _, count in timings)
+    if not total:
+        return 0.0
+    threshold = total * percentile / 100.0
+    seen = 0
+    for latency, count in sorted(timings):
+        seen += count
+        if seen >= threshold:
+            return latency
+    return timings[-1][0]
+
+
+def seed_database(pool, user_count, device_ips):
+    """Insert shifts and users, and clear earlier benchmark rows for the benchmark devices"""
+    connection = pool.get_connection()
+    try:
+        cursor = connection.cursor()
+        for device_ip in device_ips:
+            cursor.execute("DELETE FROM attendance WHERE device_ip = %s", (device_ip,))
+            cursor.execute("DELETE FROM devices WHERE device_ip = %s", (device_ip,))
+        cursor.executemany("""
+            INSERT INTO shifts (id, name, start_time, end_time) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """, SHIFTS)
+        cursor.executemany("""
+            INSERT INTO users (user_id, name, shift_id) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """, [(str(index), f"User {index}", index % len(SHIFTS) + 1) for index in range(1, user_count + 1)])
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def measure(pool, run):
+    """Run one benchmark step; returns (result, seconds, peak traced MB)"""
+    pool.reset()
+    TimedDatabaseSink.batch_timings = []
+    user_shift_cache._version = None
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def report_row(device, phase, size, elapsed, peak_mb, counter, timings=None):
+    row = {
+        'device': device,
+        'phase': phase,
+        'records': size,
+        'seconds': round(elapsed, 3),
+        'records_per_sec': round(size / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(weighted_percentile(timings or [], 50) * 1000, 3),
+        'p99_ms': round(weighted_percentile(timings or [], 99) * 1000, 3),
+        'statements': counter['statements'],
+        'inserts': counter['INSERT'],
+        'selects': counter['SELECT'],
+        'updates': counter['UPDATE'],
+        'commits': counter['commits'],
+        'peak_mb': round(peak_mb, 1),
+    }
+    print(f"{device:<10}{phase:<8}{size:>9}{row['seconds']:>10.2f}{row['records_per_sec']:>12.0f}"
+          f"{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['statements']:>8}{row['inserts']:>8}"
+          f"{row['selects']:>8}{row['updates']:>8}{row['commits']:>8}{row['peak_mb']:>9.1f}")
+    return row
+
+
+def bench_zk(pool, size, log_dir):
+    FakeZK.record_count = size
+    manager = ZKDeviceManager(ip=BENCH_ZK_IP, port=4370, device_location='Benchmark Exit')
+    manager.log_dir = log_dir
+    manager.connect_to_device()
+
+    rows = []
+    _, elapsed, peak = measure(pool, manager.store_attendance_to_db)
+    rows.append(report_row('zk', 'store', size, elapsed, peak, pool.counter, TimedDatabaseSink.batch_timings))
+
+    end_time = BASE_TIME + timedelta(seconds=size + 1)
+    _, elapsed, peak = measure(
+        pool, lambda: manager.export_clocking_logs(start_time=BASE_TIME, end_time=end_time)
+    )
+    rows.append(report_row('zk', 'export', size, elapsed, peak, pool.counter))
+    manager.disconnect_from_device()
+    return rows
+
+
+def bench_hik(pool, size, log_dir, page_size):
+    server = FakeISAPIServer(size).start()
+    try:
+        manager = HikVisionDeviceManager(ip='127.0.0.1', port=server.port, device_location='Benchmark Entry')
+        manager.log_dir = log_dir
+        if page_size:
+            manager.page_size = page_size
+        manager.connect_to_device()
+
+        rows = []
+        _, elapsed, peak = measure(pool, lambda: manager.store_attendance_to_db(start_time=BASE_TIME))
+        rows.append(report_row('hikvision', 'store', size, elapsed, peak, pool.counter, TimedDatabaseSink.batch_timings))
+
+        end_time = BASE_TIME + timedelta(seconds=size + 1)
+        _, elapsed, peak = measure(
+            pool, lambda: manager.export_clocking_logs(start_time=BASE_TIME, end_time=end_time)
+        )
+        rows.append(report_row('hikvision', 'export', size, elapsed, peak, pool.counter))
+        manager.disconnect_from_device()
+        return rows
+    finally:
+        server.stop()
+
+
+def count_device_rows(pool, device_ip):
+    connection = pool.get_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM attendance WHERE device_ip = %s", (device_ip,))
+        return cursor.fetchone()[0]
+    finally:
+        connection.close()
+
+
+def bench_hik_push(pool, size, log_dir):
+    """
+    Push mode end to end: a gap-fill poll of size // 10 events, then size events
+    on the alertStream, split across chunks and mixed with heartbeats and
+    denied attempts. Only the gap-fill and the accepted punches may be stored.
+    """
+    gap_fill = size // 10
+    server = FakeISAPIServer(gap_fill, push_count=size).start()
+    stop_event = threading.Event()
+    delivered = threading.Event()
+    try:
+        manager = HikVisionDeviceManager(ip='127.0.0.1', port=server.port, device_location='Benchmark Entry')
+        manager.log_dir = log_dir
+        pushed = []
+        store_events = manager.store_events
+
+        def counting_store_events(records):
+            result = store_events(records)
+            pushed.extend(records)
+            if len(pushed) >= size:
+                delivered.set()
+            return result
+
+        manager.store_events = counting_store_events
+        listener = threading.Thread(target=manager.listen_alert_stream, args=(stop_event,), daemon=True)
+
+        def run():
+            listener.start()
+            if not delivered.wait(60 + size / 100):
+                raise RuntimeError(f"alertStream delivered {len(pushed)} of {size} events")
+            stop_event.set()
+            listener.join()
+
+        _, elapsed, peak = measure(pool, run)
+        row = report_row('hikvision', 'push', size, elapsed, peak, pool.counter)
+    finally:
+        stop_event.set()
+        server.stop()
+
+    stored = count_device_rows(pool, '127.0.0.1')
+    if len(pushed) != size or stored != gap_fill + size:
+        raise RuntimeError(f"push check failed: {len(pushed)} events delivered and {stored} rows stored, "
+                           f"expected {size} and {gap_fill + size}")
+    return [row]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance ingestion benchmarks")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"comma-separated record counts (default {DEFAULT_SIZES})")
+    parser.add_argument('--devices', default='zk,hikvision', help="comma-separated: zk, hikvision")
+    parser.add_argument('--users', type=int, default=1000, help="distinct users in the synthetic logs")
+    parser.add_argument('--hik-page-size', type=int, default=None, help="override HIK_PAGE_SIZE for the AcsEvent search")
+    parser.add_argument('--mysql', action='store_true', help="use the DB_* MySQL database instead of SQLite")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="show the managers' log output")
+    args = parser.parse_args()
+
+    if args.verbose:
+        setup_logging(console=True)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    devices = [device.strip().lower() for device in args.devices.split(',') if device.strip()]
+
+    # Every DatabaseSink created by store_attendance_to_db records batch timings
+    Common.device_manager.DatabaseSink = TimedDatabaseSink
+    ZKDevice.manager.ZK = FakeZK
+    FakeZK.user_count = args.users
+
+    results = []
+    print(f"{'device':<10}{'phase':<8}{'records':>9}{'seconds':>10}{'rec/s':>12}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'stmts':>8}{'insert':>8}{'select':>8}{'update':>8}{'commits':>8}{'peak MB':>9}")
+
+    with tempfile.TemporaryDirectory(prefix='attendance-bench-') as work_dir:
+        for size in sizes:
+            for device in devices:
+                if args.mysql:
+                    pool = CountingPool(Common.db.ConnectionPool())
+                else:
+                    pool = CountingPool(SQLitePool(os.path.join(work_dir, f"{device}_{size}.db")))
+                # Managers pick up the process-wide pool when they are created
+                Common.db._pool = pool
+                seed_database(pool, args.users, [BENCH_ZK_IP, '127.0.0.1'])
+
+                if device == 'zk':
+                    results.extend(bench_zk(pool, size, work_dir))
+                elif device == 'hikvision':
+                    results.extend(bench_hik(pool, size, work_dir, args.hik_page_size))
+                    seed_database(pool, args.users, ['127.0.0.1'])
+                    results.extend(bench_hik_push(pool, size, work_dir))
+                else:
+                    parser.error(f"unknown device {device}")
+                pool.close_all()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,8 +23,9 @@ echo SUCCESS: All dependencies installed!
 echo.
 echo Next steps:
 echo 1. Configure your .env file with database credentials
-echo 2. Test the system: python main_continuous.py
-echo 3. Install as Windows service
+echo 2. Apply database migrations: python setup\migrate.py
+echo 3. Test the system: python main_continuous.py
+echo 4. Install as Windows service
 echo.
 pause
 exit /b 0
@@ -1,63 +1,55 @@
-from ZKDevice.manager import ZKDeviceManager
-from HikVisionDevice.manager import HikVisionDeviceManager
+import logging
+from Common.device_registry import load_managers
+from Common.log import setup_logging, stop_logging
+from Common.pipeline import CsvLogSink, DatabaseSink, SyncPipeline
 from datetime import datetime
 
+logger = logging.getLogger('AttendanceSystem')
+
 def main():
-    print("=== Dual Device Attendance System ===")
-    print("HikVision (IN Reader) + ZKTeco (OUT Reader)")
-    print(f"Execution started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    # Managers log through the same queue, so their output stays in order with ours
+    setup_logging(console=True)
     
-    # Initialize device managers
-    hik_manager = HikVisionDeviceManager()
-    zk_manager = ZKDeviceManager()
+    logger.info("=== Multi Device Attendance System ===")
+    logger.info("HikVision (IN Readers) + ZKTeco (OUT Readers)")
+    logger.info(f"Execution started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    # Test connections
-    print("=== Connection Tests ===")
-    hik_manager.test_connections()
-    zk_manager.test_connections()
+    # Initialize device managers from DEVICES_CONFIG, the devices table or the environment
+    managers = load_managers()
     
-    # Process HikVision (IN Reader)
-    print("\n=== Processing HikVision (IN Reader) ===")
-    if hik_manager.connect_to_device():
-        try:
-            if hik_manager.store_attendance_to_db():
-                print("✓ HikVision attendance data stored successfully")
-            else:
-                print("✗ No new HikVision attendance data")
-                
-            hik_manager.export_clocking_logs()
-            
-        except Exception as e:
-            print(f"✗ Error during HikVision processing: {e}")
-        finally:
-            hik_manager.disconnect_from_device()
-    else:
-        print("✗ Failed to connect to HikVision device")
+    # Test connections
+    logger.info("=== Connection Tests ===")
+    for manager in managers:
+        manager.test_connections()
     
-    # Process ZKTeco (OUT Reader)
-    print("\n=== Processing ZKTeco (OUT Reader) ===")
-    if zk_manager.connect_to_device():
-        try:
-            # Sync users first
-            if zk_manager.sync_users_to_db():
-                print("✓ ZKTeco users synchronized")
-            
-            if zk_manager.store_attendance_to_db():
-                print("✓ ZKTeco attendance data stored successfully")
-            else:
-                print("✗ No new ZKTeco attendance data")
+    for manager in managers:
+        logger.info(f"=== Processing {manager.name} ({manager.purpose}) ===")
+        if manager.connect_to_device():
+            try:
+                # ZKTeco syncs users first
+                manager.prepare_sync()
                 
-            zk_manager.export_clocking_logs()
-            
-        except Exception as e:
-            print(f"✗ Error during ZKTeco processing: {e}")
-        finally:
-            zk_manager.disconnect_from_device()
-    else:
-        print("✗ Failed to connect to ZKTeco device")
+                # One device read feeds both the database and the clocking log, which
+                # lists the device log as before along with the shift flags just stored
+                database = DatabaseSink(manager)
+                pipeline = SyncPipeline(manager, [database, CsvLogSink(manager, database=database)])
+                results = pipeline.run(**manager.clocking_log_options())
+                manager.finish_sync()
+                if results['database']:
+                    logger.info(f"✓ {manager.name} attendance data stored successfully")
+                else:
+                    logger.warning(f"✗ No new {manager.name} attendance data")
+                    
+            except Exception as e:
+                logger.error(f"✗ Error during {manager.name} processing: {e}")
+            finally:
+                manager.disconnect_from_device()
+        else:
+            logger.error(f"✗ Failed to connect to {manager.name}")
     
-    print(f"\nExecution completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=== System Ready ===")
+    logger.info(f"Execution completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info("=== System Ready ===")
+    stop_logging()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
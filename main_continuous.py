@@ -5,153 +5,381 @@ Production-ready continuous attendance system for Windows Server
 
 import time
 import logging
+import threading
 import sys
 import os
-from datetime import datetime, timedelta
-import mysql.connector
+from concurrent.futures import ThreadPoolExecutor
 from mysql.connector import Error
 
 # Add the application directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from ZKDevice.manager import ZKDeviceManager
-from HikVisionDevice.manager import HikVisionDeviceManager
+from Common.circuit_breaker import CircuitBreaker, DeviceUnavailableError
+from Common.db import get_db_pool
+from Common.device_registry import create_manager, load_device_configs
+from Common.log import setup_logging, stop_logging
+from Common.metrics import MetricsServer, metrics
+from Common.pipeline import CsvLogSink, DatabaseSink, SyncPipeline
+from Common.spool import AttendanceSpool, SpoolDrainer, SpoolSink
+
+class DeviceJob:
+    """Scheduling state of one polled reader"""
+    
+    def __init__(self, manager, interval, deadline):
+        self.manager = manager
+        self.name = manager.name
+        self.interval = interval
+        self.deadline = deadline
+        # Failing devices back off on their own without stalling healthy ones
+        self.breaker = CircuitBreaker(self.name)
+        self.next_due = 0.0
+        self.future = None
+        self.keepalive_future = None
+        self.started_at = None
+        self.deadline_reported = False
+        
+    def is_busy(self):
+        return self.future is not None and not self.future.done()
+        
+    def needs_keepalive(self):
+        """True when the idle session of a reachable device is due for a keepalive"""
+        manager = self.manager
+        if self.is_busy() or (self.keepalive_future is not None and not self.keepalive_future.done()):
+            return False
+        if self.breaker.state != CircuitBreaker.CLOSED or not manager.is_connected():
+            return False
+        return time.monotonic() - manager.last_activity >= manager.keepalive_interval
 
 class AttendanceSystem:
     def __init__(self):
-        self.sync_interval = 60  # seconds
+        self.sync_interval = int(os.getenv('SYNC_INTERVAL', 60))  # seconds
         self.running = True
         self.setup_logging()
         
-        # Initialize device managers
-        self.hik_manager = HikVisionDeviceManager()
-        self.zk_manager = ZKDeviceManager()
+        # Process-wide MySQL pool shared with the device managers
+        self.db_pool = get_db_pool()
+        
+        # HikVision push mode: events arrive on the alertStream instead of being polled
+        self.hik_push_mode = os.getenv('HIK_PUSH_MODE', 'false').lower() in ('1', 'true', 'yes')
+        # ZKTeco live mode: punches are captured as they happen instead of polled
+        self.zk_live_mode = os.getenv('ZK_LIVE_MODE', 'false').lower() in ('1', 'true', 'yes')
+        # Also write each polled batch to a clocking log CSV from the same device read
+        self.csv_log_sink = os.getenv('CSV_LOG_SINK', 'false').lower() in ('1', 'true', 'yes')
+        self.stop_event = threading.Event()
+        self.listener_threads = []
+        
+        # Readers come from DEVICES_CONFIG or the devices table (see Common/device_registry.py)
+        self.managers = []
+        self.device_jobs = []
+        default_deadline = int(os.getenv('DEVICE_SYNC_DEADLINE', 50))
+        type_deadlines = {
+            'HIKVISION': int(os.getenv('HIK_SYNC_DEADLINE', default_deadline)),
+            'ZK': int(os.getenv('ZK_SYNC_DEADLINE', default_deadline)),
+        }
+        for config in load_device_configs():
+            manager = create_manager(config)
+            self.managers.append(manager)
+            if self.is_streaming(manager):
+                continue
+            self.device_jobs.append(DeviceJob(
+                manager,
+                int(config.get('sync_interval') or self.sync_interval),
+                int(config.get('sync_deadline') or type_deadlines[manager.device_type])
+            ))
+        
+        # Spool mode: device reads go to a local SQLite spool first and a background
+        # drainer loads them into MySQL, so reads continue through database outages
+        self.spool = None
+        self.spool_drainer = None
+        if os.getenv('SPOOL_ENABLED', 'false').lower() in ('1', 'true', 'yes'):
+            self.spool = AttendanceSpool()
+            for manager in self.managers:
+                manager.spool = self.spool
+            self.spool_drainer = SpoolDrainer(self.spool, self.managers)
+            self.logger.info(f"Spooling device reads to {self.spool.path} ({self.spool.stats_summary()})")
+        
+        # Devices are polled concurrently by a bounded pool, each on its own schedule
+        # and within its own deadline, so adding a reader does not lengthen a cycle.
+        # Every running sync holds one pooled connection, so workers never exceed
+        # the pool size; the rest would only wait for a connection
+        workers = int(os.getenv('SYNC_WORKERS', min(32, len(self.device_jobs), self.db_pool.max_size)))
+        if workers > self.db_pool.max_size:
+            self.logger.warning(f"SYNC_WORKERS={workers} is above DB_POOL_SIZE={self.db_pool.max_size}; "
+                                f"using {self.db_pool.max_size} sync workers")
+            workers = self.db_pool.max_size
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='device-sync')
+        self.success_count = 0
+        self.error_count = 0
         
-        self.logger.info("Attendance System initialized on Windows Server")
+        # /metrics, /health and /ready are served from in-memory state (METRICS_PORT=0 disables)
+        metrics.polled_devices = len(self.device_jobs)
+        metrics.add_collector(self.pool_metrics)
+        self.metrics_port = int(os.getenv('METRICS_PORT', 9108))
+        self.metrics_server = None
+        
+        self.logger.info(f"Attendance System initialized on Windows Server with {len(self.managers)} devices")
+
+    def is_streaming(self, manager):
+        """True when the device pushes events (HikVision push / ZKTeco live mode) instead of being polled"""
+        if manager.device_type == 'HIKVISION':
+            return self.hik_push_mode
+        return self.zk_live_mode
 
     def setup_logging(self):
-        """Setup comprehensive logging for Windows"""
+        """
+        Setup logging for Windows: records are queued and written as JSON lines
+        by a background thread, so syncs never wait on log I/O. The console
+        handler is only added when running in a terminal (see Common/log.py).
+        """
         log_dir = os.getenv('LOG_DIR', 'C:\\AttendanceSystem\\logs')
         os.makedirs(log_dir, exist_ok=True)
         
-        log_file = os.path.join(log_dir, 'attendance_system.log')
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+        setup_logging(log_file=os.path.join(log_dir, 'attendance_system.log'))
         self.logger = logging.getLogger('AttendanceSystem')
 
     def test_connections(self):
         """Test all connections"""
         self.logger.info("Testing device connections...")
         
-        # Test HikVision
-        if self.hik_manager.connect_to_device():
-            self.logger.info("✓ HikVision connection successful")
-            self.hik_manager.disconnect_from_device()
-        else:
-            self.logger.error("✗ HikVision connection failed")
+        for manager in self.managers:
+            if manager.connect_to_device():
+                self.logger.info(f"✓ {manager.name} connection successful")
+                manager.disconnect_from_device()
+            else:
+                self.logger.error(f"✗ {manager.name} connection failed")
         
-        # Test ZKTeco
-        if self.zk_manager.connect_to_device():
-            self.logger.info("✓ ZKTeco connection successful")
-            self.zk_manager.disconnect_from_device()
-        else:
-            self.logger.error("✗ ZKTeco connection failed")
+        # Test database through the shared pool
+        try:
+            db_connection = self.db_pool.get_connection()
+            db_connection.close()
+            self.logger.info("✓ Database connection successful")
+        except Error as e:
+            self.logger.error(f"✗ Database connection failed: {e}")
 
-    def sync_attendance_data(self):
-        """Synchronize attendance data from both devices"""
-        sync_time = datetime.now()
-        self.logger.info(f"Starting synchronization at {sync_time}")
-        
-        success_count = 0
-        error_count = 0
-        
-        # Process HikVision (IN Reader)
+    def run_pipeline(self, manager):
+        """Read the device once and fan its records out to the enabled sinks; True when new data was stored"""
+        sinks = [SpoolSink(self.spool) if self.spool else DatabaseSink(manager)]
+        if self.csv_log_sink:
+            # Spooled batches have no shift flags yet
+            sinks.append(CsvLogSink(manager, database=sinks[0] if isinstance(sinks[0], DatabaseSink) else None))
+        return SyncPipeline(manager, sinks).run()[sinks[0].name]
+
+    def sync_device(self, job):
+        """Sync one reader on a worker thread; returns True when new data was stored"""
+        job.started_at = time.monotonic()
+        manager = job.manager
+        self.logger.info(f"Processing {manager.name}...")
+        # The session is kept across cycles; only probe and handshake when it is gone
+        if not manager.is_connected():
+            with metrics.timer(manager, 'connect'):
+                if not manager.is_reachable():
+                    raise DeviceUnavailableError(f"{manager.name} is unreachable at {manager.ip}:{manager.port}")
+                if not manager.ensure_connected():
+                    raise DeviceUnavailableError(f"Failed to connect to {manager.name}")
+            
         try:
-            self.logger.info("Processing HikVision device...")
-            if self.hik_manager.connect_to_device():
-                if self.hik_manager.store_attendance_to_db():
-                    success_count += 1
-                    self.logger.info("HikVision data synchronized successfully")
-                else:
-                    error_count += 1
-                    self.logger.warning("No new HikVision data")
-                self.hik_manager.disconnect_from_device()
+            manager.prepare_sync()
+            
+            stored = self.run_pipeline(manager)
+            manager.finish_sync()
+            if stored:
+                self.logger.info(f"{manager.name} data synchronized successfully")
+                return True
+            self.logger.warning(f"No new {manager.name} data")
+            return False
+        except Exception:
+            manager.disconnect_from_device()
+            raise
+
+    def start_listeners(self):
+        """Start the spool drainer and background listeners for devices running in push or live mode"""
+        if self.spool_drainer:
+            thread = threading.Thread(
+                target=self.spool_drainer.run,
+                args=(self.stop_event,),
+                name='spool-drainer',
+                daemon=True
+            )
+            thread.start()
+            self.listener_threads.append(thread)
+            
+        for manager in self.managers:
+            if not self.is_streaming(manager):
+                continue
+            if manager.device_type == 'HIKVISION':
+                self.logger.info(f"Starting {manager.name} alertStream listener (push mode)")
+                target = manager.listen_alert_stream
             else:
-                error_count += 1
-                self.logger.error("Failed to connect to HikVision")
-        except Exception as e:
-            error_count += 1
-            self.logger.error(f"HikVision synchronization error: {e}")
+                self.logger.info(f"Starting {manager.name} live capture (live mode)")
+                target = manager.live_capture
+            thread = threading.Thread(
+                target=target,
+                args=(self.stop_event,),
+                name=f"{manager.log_prefix}-listener-{manager.ip}",
+                daemon=True
+            )
+            thread.start()
+            self.listener_threads.append(thread)
 
-        # Process ZKTeco (OUT Reader)
+    def send_keepalives(self):
+        """
+        Keep idle device sessions open between syncs. Pings run on the worker
+        pool, so a stale session that waits for its socket timeout never holds
+        up the scheduler; devices whose circuit is not closed are not pinged.
+        """
+        for job in self.device_jobs:
+            if job.needs_keepalive():
+                job.keepalive_future = self.executor.submit(job.manager.keepalive)
+
+    def finish_job(self, job):
+        """Record the outcome of a completed device sync and schedule its next run"""
+        future, job.future = job.future, None
+        breaker = job.breaker
+        duration = time.monotonic() - job.started_at if job.started_at is not None else 0.0
         try:
-            self.logger.info("Processing ZKTeco device...")
-            if self.zk_manager.connect_to_device():
-                # Sync users first
-                self.zk_manager.sync_users_to_db()
-                
-                if self.zk_manager.store_attendance_to_db():
-                    success_count += 1
-                    self.logger.info("ZKTeco data synchronized successfully")
-                else:
-                    error_count += 1
-                    self.logger.warning("No new ZKTeco data")
-                self.zk_manager.disconnect_from_device()
+            if future.result():
+                self.success_count += 1
+                outcome = 'success'
             else:
-                error_count += 1
-                self.logger.error("Failed to connect to ZKTeco")
+                self.error_count += 1
+                outcome = 'no_data'
+            if breaker.record_success():
+                self.logger.info(f"{job.name} is reachable again, circuit closed")
+                job.manager.update_device_status('ONLINE')
+            metrics.sync_finished(job.manager, outcome, duration, breaker.state)
+            return
+        except DeviceUnavailableError as e:
+            self.error_count += 1
+            self.logger.error(str(e))
         except Exception as e:
-            error_count += 1
-            self.logger.error(f"ZKTeco synchronization error: {e}")
+            self.error_count += 1
+            self.logger.error(f"{job.name} synchronization error: {e}")
+        finally:
+            job.next_due = time.monotonic() + job.interval
+            
+        # A deadline overrun was already counted against the breaker
+        if not job.deadline_reported and breaker.record_failure():
+            self.logger.error(f"{job.name} marked OFFLINE, backing off for {breaker.seconds_until_retry():.0f}s")
+            job.manager.update_device_status('OFFLINE')
+        metrics.sync_finished(job.manager, 'failure', duration, breaker.state)
+
+    def sync_attendance_data(self):
+        """
+        Scheduler tick: collect finished device syncs, flag overruns and submit
+        devices that are due. Each device runs on its own interval, so one slow
+        or unreachable reader never delays the others.
+        """
+        now = time.monotonic()
+        for job in self.device_jobs:
+            if job.future is not None:
+                if job.future.done():
+                    self.finish_job(job)
+                elif (job.started_at is not None and not job.deadline_reported
+                        and now - job.started_at > job.deadline):
+                    # The worker cannot be interrupted; the device stays busy until it returns
+                    job.deadline_reported = True
+                    self.error_count += 1
+                    metrics.inc(job.manager, 'sync_deadline')
+                    self.logger.error(f"{job.name} synchronization exceeded its {job.deadline}s deadline")
+                    if job.breaker.record_failure():
+                        self.logger.error(f"{job.name} marked OFFLINE, backing off for {job.breaker.seconds_until_retry():.0f}s")
+                        job.manager.update_device_status('OFFLINE')
+                continue
+                
+            if now < job.next_due:
+                continue
+            # A keepalive still holds the session; the sync starts once it returns
+            if job.keepalive_future is not None and not job.keepalive_future.done():
+                continue
+                
+            if not job.breaker.allow_request():
+                retry_in = job.breaker.seconds_until_retry()
+                self.logger.info(f"{job.name} circuit open, next connection attempt in {retry_in:.0f}s")
+                job.next_due = now + max(1, min(retry_in, job.interval))
+                continue
+                
+            job.started_at = None
+            job.deadline_reported = False
+            job.future = self.executor.submit(self.sync_device, job)
 
-        # Log synchronization results
-        duration = (datetime.now() - sync_time).total_seconds()
-        self.logger.info(f"Synchronization completed in {duration:.2f}s - Success: {success_count}, Errors: {error_count}")
+    def pool_metrics(self):
+        """DB pool gauges for /metrics, read from the pool's in-memory counters"""
+        stats = dict(self.db_pool.stats)
+        return [
+            ('attendance_db_pool_in_use', 'gauge', 'Connections checked out', stats['in_use']),
+            ('attendance_db_pool_checkouts_total', 'counter', 'Connection checkouts', stats['checkouts']),
+            ('attendance_db_pool_waits_total', 'counter', 'Checkouts that waited for a connection', stats['waits']),
+            ('attendance_db_pool_timeouts_total', 'counter', 'Checkouts that timed out', stats['timeouts']),
+        ]
 
-        return success_count > 0
+    def start_metrics_server(self):
+        """Serve /metrics, /health and /ready unless METRICS_PORT is 0"""
+        if not self.metrics_port:
+            return
+        try:
+            self.metrics_server = MetricsServer(port=self.metrics_port).start()
+            self.logger.info(f"Metrics and health endpoints on http://{self.metrics_server.host}:{self.metrics_port}/")
+        except OSError as e:
+            self.logger.error(f"Could not start metrics server on port {self.metrics_port}: {e}")
+
+    def log_summary(self, since):
+        """Log results since the last summary; returns True if any device stored new data or none had errors"""
+        duration = time.monotonic() - since
+        self.logger.info(f"Synchronization summary for the last {duration:.0f}s - Success: {self.success_count}, Errors: {self.error_count}, Busy: {sum(job.is_busy() for job in self.device_jobs)}/{len(self.device_jobs)}")
+        self.logger.info(f"DB pool - {self.db_pool.stats_summary()}")
+        if self.spool:
+            self.logger.info(f"Spool - {self.spool.stats_summary()}")
+        success = self.success_count > 0 or self.error_count == 0
+        self.success_count = 0
+        self.error_count = 0
+        return success
 
     def run_continuous(self):
         """Main continuous loop"""
         self.logger.info("Starting continuous attendance synchronization")
         self.test_connections()
+        self.start_metrics_server()
+        self.start_listeners()
         
         consecutive_errors = 0
-        max_consecutive_errors = 5
+        summary_at = time.monotonic()
         
         while self.running:
             try:
-                success = self.sync_attendance_data()
+                metrics.heartbeat()
+                self.sync_attendance_data()
+                self.send_keepalives()
                 
-                if success:
-                    consecutive_errors = 0
-                else:
-                    consecutive_errors += 1
-                    self.logger.warning(f"Consecutive errors: {consecutive_errors}")
-                    
-                    if consecutive_errors >= max_consecutive_errors:
-                        self.logger.error("Too many consecutive errors, waiting before retry")
-                        time.sleep(300)  # Wait 5 minutes before retry
+                if time.monotonic() - summary_at >= self.sync_interval:
+                    if self.log_summary(summary_at):
                         consecutive_errors = 0
+                    else:
+                        consecutive_errors += 1
+                        # Unreachable devices back off through their circuit breakers,
+                        # so the scheduler itself keeps ticking
+                        self.logger.warning(f"Consecutive errors: {consecutive_errors}")
+                    summary_at = time.monotonic()
                 
-                # Wait for next sync interval
-                for _ in range(self.sync_interval):
-                    if not self.running:
-                        break
-                    time.sleep(1)
+                time.sleep(1)
                     
             except Exception as e:
                 self.logger.error(f"Unexpected error in main loop: {e}")
                 consecutive_errors += 1
                 time.sleep(60)  # Wait 1 minute before retry
 
+        self.stop_event.set()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        for thread in self.listener_threads:
+            thread.join(timeout=5)
+        self.executor.shutdown(wait=False)
+        for manager in self.managers:
+            manager.disconnect_from_device()
+        if self.spool:
+            self.spool.close()
+        self.db_pool.close_all()
         self.logger.info("Attendance system stopped gracefully")
+        stop_logging()
 
 def main():
     """Main entry point"""
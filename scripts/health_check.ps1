@@ -20,25 +20,29 @@ if ($Service -and $Service.Status -eq 'Running') {
     Write-Log "Attempted to restart $ServiceName"
 }
 
-# Check database connectivity
+# Check the service's own health endpoints (served from memory, no database queries)
+$MetricsUrl = "http://127.0.0.1:9108"
+
 try {
-    $ConnectionString = "server=localhost;database=attendance_db;user=attendance_user;password=StrongPassword123!;port=3306"
-    $Connection = New-Object MySql.Data.MySqlClient.MySqlConnection($ConnectionString)
-    $Connection.Open()
-    $Connection.Close()
-    Write-Log "✓ Database connection successful"
+    $Health = Invoke-WebRequest -Uri "$MetricsUrl/health" -UseBasicParsing -TimeoutSec 5 | Select-Object -ExpandProperty Content | ConvertFrom-Json
+    Write-Log "✓ Sync loop alive (heartbeat $([math]::Round($Health.heartbeat_age, 1))s ago)"
 } catch {
-    Write-Log "✗ Database connection failed: $($_.Exception.Message)"
+    Write-Log "✗ Health check failed: $($_.Exception.Message)"
 }
 
-# Check recent data
 try {
-    $Connection.Open()
-    $Command = $Connection.CreateCommand()
-    $Command.CommandText = "SELECT COUNT(*) FROM attendance WHERE created_at >= DATE_SUB(NOW(), INTERVAL 1 HOUR)"
-    $RecentRecords = $Command.ExecuteScalar()
-    $Connection.Close()
-    Write-Log "✓ Recent records (last hour): $RecentRecords"
+    $Ready = Invoke-WebRequest -Uri "$MetricsUrl/ready" -UseBasicParsing -TimeoutSec 5 | Select-Object -ExpandProperty Content | ConvertFrom-Json
+    Write-Log "✓ Service ready"
 } catch {
-    Write-Log "✗ Could not check recent records: $($_.Exception.Message)"
-}
\ No newline at end of file
+    Write-Log "✗ Service not ready: $($_.Exception.Message)"
+    if ($_.ErrorDetails.Message) {
+        $Ready = $_.ErrorDetails.Message | ConvertFrom-Json
+    }
+}
+
+if ($Ready) {
+    foreach ($Device in $Ready.devices.PSObject.Properties) {
+        $State = $Device.Value
+        Write-Log "  $($Device.Name): $($State.last_outcome), circuit $($State.circuit_state), last success $($State.last_success_age)s ago"
+    }
+}
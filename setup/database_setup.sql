@@ -33,12 +33,14 @@ CREATE TABLE IF NOT EXISTS users (
     INDEX idx_shift (shift_id)
 );
 
--- Attendance table
+-- Attendance table, partitioned by month on timestamp. Partitioned tables
+-- cannot have foreign keys and need the partitioning column in every unique key.
 CREATE TABLE IF NOT EXISTS attendance (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
     user_id VARCHAR(50) NOT NULL,
     employee_name VARCHAR(100),
     timestamp DATETIME NOT NULL,
+    shift_date DATE NULL,
     event_type ENUM('IN', 'OUT', 'UNKNOWN') NOT NULL,
     status_code INT,
     status_description VARCHAR(100),
@@ -52,15 +54,57 @@ CREATE TABLE IF NOT EXISTS attendance (
     is_shift_end BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    FOREIGN KEY (shift_id) REFERENCES shifts(id),
-    INDEX idx_user_id (user_id),
+    PRIMARY KEY (id, timestamp),
     INDEX idx_timestamp (timestamp),
-    INDEX idx_device_type (device_type),
-    INDEX idx_event_type (event_type),
     INDEX idx_shift (shift_id),
-    INDEX idx_shift_start (is_shift_start),
-    INDEX idx_shift_end (is_shift_end),
+    -- First IN / last OUT lookups and flag updates per (user_id, shift_date)
+    INDEX idx_shift_lookup (user_id, shift_date, device_type, event_type, timestamp),
     UNIQUE KEY unique_clock_record (user_id, timestamp, device_type, device_ip)
+)
+-- Monthly partitions are split off pmax by setup/maintain_partitions.py
+PARTITION BY RANGE COLUMNS (timestamp) (
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+-- Compressed archive for partitions past the retention window
+CREATE TABLE IF NOT EXISTS attendance_archive (
+    id INT NOT NULL,
+    user_id VARCHAR(50) NOT NULL,
+    employee_name VARCHAR(100),
+    timestamp DATETIME NOT NULL,
+    shift_date DATE NULL,
+    event_type ENUM('IN', 'OUT', 'UNKNOWN') NOT NULL,
+    status_code INT,
+    status_description VARCHAR(100),
+    device_type ENUM('HIKVISION', 'ZK', 'MANUAL') NOT NULL,
+    device_ip VARCHAR(15) NOT NULL,
+    device_location VARCHAR(100),
+    verification_mode VARCHAR(50),
+    shift_id INT,
+    shift_name VARCHAR(50),
+    is_shift_start BOOLEAN DEFAULT FALSE,
+    is_shift_end BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NULL,
+    PRIMARY KEY (id, timestamp),
+    INDEX idx_archive_user (user_id, timestamp),
+    INDEX idx_archive_timestamp (timestamp)
+) ROW_FORMAT=COMPRESSED;
+
+-- Daily summary: one row per user and shift day, kept current by the ingestion path
+CREATE TABLE IF NOT EXISTS attendance_daily (
+    user_id VARCHAR(50) NOT NULL,
+    shift_date DATE NOT NULL,
+    shift_id INT,
+    first_in DATETIME NULL,
+    last_out DATETIME NULL,
+    worked_seconds INT NULL,
+    punch_count INT NOT NULL DEFAULT 0,
+    in_count INT NOT NULL DEFAULT 0,
+    out_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, shift_date),
+    INDEX idx_daily_shift_date (shift_date)
 );
 
 -- Device information table
@@ -68,18 +112,36 @@ CREATE TABLE IF NOT EXISTS devices (
     id INT AUTO_INCREMENT PRIMARY KEY,
     device_type ENUM('HIKVISION', 'ZK') NOT NULL,
     device_ip VARCHAR(15) NOT NULL UNIQUE,
+    device_port INT NULL,
     device_name VARCHAR(100),
     device_location VARCHAR(100),
     device_model VARCHAR(50),
     serial_number VARCHAR(100),
     purpose ENUM('ENTRY', 'EXIT', 'BOTH') DEFAULT 'ENTRY',
     last_sync TIMESTAMP NULL,
+    sync_watermark_timestamp DATETIME NULL,
+    sync_watermark_count INT NOT NULL DEFAULT 0,
     status ENUM('ONLINE', 'OFFLINE', 'MAINTENANCE') DEFAULT 'ONLINE',
+    -- Only rows with polled set are loaded by the device registry
+    polled BOOLEAN NOT NULL DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
 
--- Insert default devices
-INSERT IGNORE INTO devices (device_type, device_ip, device_name, device_location, purpose) VALUES
-('HIKVISION', '192.168.1.30', 'HikVision Face Reader Pro', 'Main Entrance', 'ENTRY'),
-('ZK', '192.168.1.20', 'ZKTeco SpeedFace V5L', 'Main Exit', 'EXIT');
\ No newline at end of file
+-- Applied schema versions (see setup/migrate.py)
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(100) NOT NULL PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- This script already contains every migration below
+INSERT IGNORE INTO schema_migrations (version) VALUES
+('001_device_sync_watermark'),
+('002_device_port'),
+('003_attendance_shift_date'),
+('004_backfill_shift_date'),
+('005_attendance_daily'),
+('006_backfill_attendance_daily'),
+('007_attendance_archive'),
+('008_partition_attendance'),
+('009_device_polled');
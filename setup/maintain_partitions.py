@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Monthly partition maintenance for the attendance table.
+
+    python setup/maintain_partitions.py                    # add upcoming months, archive expired ones
+    python setup/maintain_partitions.py --dry-run          # show what would be archived
+    python setup/maintain_partitions.py --archive-dir D:\\AttendanceArchive
+
+Adds a partition for every month up to PARTITION_MONTHS_AHEAD ahead, then
+archives and drops partitions older than ATTENDANCE_RETENTION_MONTHS (0 keeps
+everything) into attendance_archive, or into gzip CSV files under ARCHIVE_DIR.
+Schedule it daily, e.g. with Windows Task Scheduler:
+
+    schtasks /Create /SC DAILY /ST 02:30 /TN AttendancePartitions /TR "C:\\AttendanceSystem\\venv\\Scripts\\python.exe C:\\AttendanceSystem\\setup\\maintain_partitions.py"
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from dotenv import load_dotenv
+from mysql.connector import Error
+from Common.db import load_db_config
+from Common.log import setup_logging, stop_logging
+from Common.partitions import archive_partitions, ensure_future_partitions
+
+logger = logging.getLogger('maintain_partitions')
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Add and archive monthly attendance partitions")
+    parser.add_argument('--months-ahead', type=int, default=int(os.getenv('PARTITION_MONTHS_AHEAD', 3)),
+                        help="months of empty partitions to keep prepared")
+    parser.add_argument('--retention-months', type=int, default=int(os.getenv('ATTENDANCE_RETENTION_MONTHS', 0)),
+                        help="months kept in attendance before archiving (0 disables archiving)")
+    parser.add_argument('--archive-dir', default=os.getenv('ARCHIVE_DIR'),
+                        help="write gzip CSV files here instead of attendance_archive")
+    parser.add_argument('--dry-run', action='store_true', help="list partitions that would be archived")
+    args = parser.parse_args()
+
+    setup_logging(console=True)
+    try:
+        connection = mysql.connector.connect(**load_db_config())
+    except Error as e:
+        logger.error(f"Error connecting to MySQL database: {e}")
+        stop_logging()
+        sys.exit(1)
+
+    try:
+        if not args.dry_run:
+            ensure_future_partitions(connection, args.months_ahead)
+        if args.retention_months > 0:
+            archived = archive_partitions(connection, args.retention_months, args.archive_dir, dry_run=args.dry_run)
+            if not archived and not args.dry_run:
+                logger.info(f"No partitions older than {args.retention_months} months")
+    except Exception as e:
+        logger.error(f"Partition maintenance failed: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
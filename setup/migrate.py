@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Apply pending schema migrations from setup/migrations in version order.
+
+    python setup/migrate.py            # apply pending migrations
+    python setup/migrate.py --status   # list applied and pending versions
+
+A migration is either NNN_name.sql (statements separated by ';') or
+NNN_name.py defining apply(connection). Applied versions are recorded in
+schema_migrations. MySQL commits DDL implicitly, so a migration interrupted
+halfway is run again from the start: statements that fail only because their
+change is already in place (duplicate column or index, index already dropped)
+are skipped. That also adopts databases where earlier files were applied by hand.
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from dotenv import load_dotenv
+from mysql.connector import Error
+from Common.db import load_db_config
+from Common.log import setup_logging, stop_logging
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# ER_DUP_FIELDNAME, ER_DUP_KEYNAME, ER_CANT_DROP_FIELD_OR_KEY
+ALREADY_APPLIED_ERRORS = {1060, 1061, 1091}
+
+logger = logging.getLogger('migrate')
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Return [(version, path)] for the .sql and .py migrations, sorted by version"""
+    migrations = []
+    for filename in os.listdir(directory):
+        version, extension = os.path.splitext(filename)
+        if extension in ('.sql', '.py') and version[:3].isdigit():
+            migrations.append((version, os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def split_statements(sql):
+    """Split a migration file into statements, dropping -- comment lines"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(100) NOT NULL PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_sql(connection, path):
+    cursor = connection.cursor()
+    with open(path, encoding='utf-8') as f:
+        statements = split_statements(f.read())
+    for statement in statements:
+        try:
+            cursor.execute(statement)
+        except Error as e:
+            if e.errno not in ALREADY_APPLIED_ERRORS:
+                raise
+            logger.info(f"  already applied, skipping: {e.msg}")
+    connection.commit()
+
+
+def apply_python(connection, path):
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.apply(connection)
+    connection.commit()
+
+
+def migrate(connection, status_only=False):
+    """Apply every pending migration; returns the versions applied"""
+    cursor = connection.cursor()
+    applied = applied_versions(cursor)
+    pending = [(version, path) for version, path in discover_migrations() if version not in applied]
+
+    if status_only:
+        for version, _ in discover_migrations():
+            logger.info(f"{'applied' if version in applied else 'pending'}  {version}")
+        return []
+
+    if not pending:
+        logger.info("Schema is up to date")
+        return []
+
+    done = []
+    for version, path in pending:
+        logger.info(f"Applying {version}...")
+        if path.endswith('.py'):
+            apply_python(connection, path)
+        else:
+            apply_sql(connection, path)
+        cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        connection.commit()
+        done.append(version)
+        logger.info(f"Applied {version}")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply attendance database schema migrations")
+    parser.add_argument('--status', action='store_true', help="list applied and pending migrations without applying")
+    args = parser.parse_args()
+
+    load_dotenv()
+    setup_logging(console=True)
+    try:
+        connection = mysql.connector.connect(**load_db_config())
+    except Error as e:
+        logger.error(f"Error connecting to MySQL database: {e}")
+        stop_logging()
+        sys.exit(1)
+
+    try:
+        migrate(connection, status_only=args.status)
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+-- Per-device sync watermark used for incremental ZKTeco sync
+ALTER TABLE devices
+    ADD COLUMN sync_watermark_timestamp DATETIME NULL AFTER last_sync,
+    ADD COLUMN sync_watermark_count INT NOT NULL DEFAULT 0 AFTER sync_watermark_timestamp;
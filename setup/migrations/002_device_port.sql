@@ -0,0 +1,3 @@
+-- Per-device port for the device registry (NULL uses the ZK_/HIK_ default)
+ALTER TABLE devices
+    ADD COLUMN device_port INT NULL AFTER device_ip;
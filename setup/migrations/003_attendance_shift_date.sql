@@ -0,0 +1,18 @@
+-- Stored shift day for index-friendly shift lookups, replacing DATE(timestamp) filters.
+-- Every statement runs in place without blocking reads or writes.
+ALTER TABLE attendance
+    ADD COLUMN shift_date DATE NULL AFTER timestamp,
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- One composite index for the first IN / last OUT lookups and flag updates
+ALTER TABLE attendance
+    ADD INDEX idx_shift_lookup (user_id, shift_date, device_type, event_type, timestamp),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- user_id lookups are covered by unique_clock_record and idx_shift_lookup; the
+-- low-cardinality type and flag indexes are never used for lookups but cost every insert
+ALTER TABLE attendance DROP INDEX idx_user_id, ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE attendance DROP INDEX idx_device_type, ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE attendance DROP INDEX idx_event_type, ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE attendance DROP INDEX idx_shift_start, ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE attendance DROP INDEX idx_shift_end, ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,32 @@
+"""
+Fill attendance.shift_date for rows stored before 003_attendance_shift_date.
+
+Uses the shift recorded on each row and the same rule as
+DeviceManager.calculate_shift_date_range: on a night shift (end before start)
+an event before the shift start belongs to the previous day. Rows are updated
+in id ranges with a commit after each, so no long-running lock is held.
+"""
+
+CHUNK_SIZE = 5000
+
+
+def apply(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT MIN(id), MAX(id) FROM attendance WHERE shift_date IS NULL")
+    first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+
+    for start in range(first_id, last_id + 1, CHUNK_SIZE):
+        cursor.execute("""
+            UPDATE attendance a
+            JOIN shifts s ON s.id = a.shift_id
+            SET a.shift_date = CASE
+                WHEN s.end_time < s.start_time AND TIME(a.timestamp) < s.start_time
+                THEN DATE(a.timestamp) - INTERVAL 1 DAY
+                ELSE DATE(a.timestamp)
+            END
+            WHERE a.id >= %s AND a.id < %s
+            AND a.shift_date IS NULL
+        """, (start, start + CHUNK_SIZE))
+        connection.commit()
@@ -0,0 +1,16 @@
+-- Per-user, per-shift-day summary maintained by the ingestion path
+-- (first IN from entry readers, last OUT from exit readers)
+CREATE TABLE IF NOT EXISTS attendance_daily (
+    user_id VARCHAR(50) NOT NULL,
+    shift_date DATE NOT NULL,
+    shift_id INT,
+    first_in DATETIME NULL,
+    last_out DATETIME NULL,
+    worked_seconds INT NULL,
+    punch_count INT NOT NULL DEFAULT 0,
+    in_count INT NOT NULL DEFAULT 0,
+    out_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, shift_date),
+    INDEX idx_daily_shift_date (shift_date)
+);
@@ -0,0 +1,15 @@
+"""
+Build attendance_daily for every shift day already stored in attendance.
+Runs one committed day at a time via rebuild_daily_summary.
+"""
+
+from Common.daily_summary import rebuild_daily_summary
+
+
+def apply(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT MIN(shift_date), MAX(shift_date) FROM attendance")
+    first_date, last_date = cursor.fetchone()
+    if first_date is None:
+        return
+    rebuild_daily_summary(connection, first_date, last_date)
@@ -0,0 +1,25 @@
+-- Compressed archive for attendance partitions past the retention window
+-- (filled by setup/maintain_partitions.py before a partition is dropped)
+CREATE TABLE IF NOT EXISTS attendance_archive (
+    id INT NOT NULL,
+    user_id VARCHAR(50) NOT NULL,
+    employee_name VARCHAR(100),
+    timestamp DATETIME NOT NULL,
+    shift_date DATE NULL,
+    event_type ENUM('IN', 'OUT', 'UNKNOWN') NOT NULL,
+    status_code INT,
+    status_description VARCHAR(100),
+    device_type ENUM('HIKVISION', 'ZK', 'MANUAL') NOT NULL,
+    device_ip VARCHAR(15) NOT NULL,
+    device_location VARCHAR(100),
+    verification_mode VARCHAR(50),
+    shift_id INT,
+    shift_name VARCHAR(50),
+    is_shift_start BOOLEAN DEFAULT FALSE,
+    is_shift_end BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NULL,
+    PRIMARY KEY (id, timestamp),
+    INDEX idx_archive_user (user_id, timestamp),
+    INDEX idx_archive_timestamp (timestamp)
+) ROW_FORMAT=COMPRESSED;
@@ -0,0 +1,46 @@
+"""
+Partition attendance by month on timestamp.
+
+MySQL requires the partitioning column in every unique key and does not allow
+foreign keys on partitioned tables, so the primary key becomes (id, timestamp)
+and the shift_id foreign key is dropped (idx_shift stays). Existing rows are
+split into one partition per month from the oldest event, with pmax catching
+anything past the prepared months.
+
+Partitioning copies the table once; on a large attendance table run this in a
+quiet period. Later months are added by setup/maintain_partitions.py.
+"""
+
+from datetime import date
+from Common.partitions import add_months, list_partitions, month_start, partition_definitions
+
+MONTHS_AHEAD = 3
+
+
+def apply(connection):
+    cursor = connection.cursor()
+    if list_partitions(cursor):
+        return
+
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'attendance'
+        AND REFERENCED_TABLE_NAME IS NOT NULL
+    """)
+    for (constraint_name,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE attendance DROP FOREIGN KEY {constraint_name}")
+
+    cursor.execute("SELECT MIN(timestamp) FROM attendance")
+    oldest = cursor.fetchone()[0]
+    first_month = month_start(oldest or date.today())
+    last_month = add_months(month_start(date.today()), MONTHS_AHEAD)
+
+    cursor.execute(f"""
+        ALTER TABLE attendance
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, timestamp)
+        PARTITION BY RANGE COLUMNS (timestamp) (
+            {', '.join(partition_definitions(first_month, last_month))}
+        )
+    """)
@@ -0,0 +1,4 @@
+-- Readers are only polled from the devices table once they opt in; rows that
+-- earlier syncs upserted for environment readers, and retired readers, stay off
+ALTER TABLE devices
+    ADD COLUMN polled BOOLEAN NOT NULL DEFAULT FALSE AFTER status;
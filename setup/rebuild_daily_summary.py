@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Regenerate attendance_daily from the attendance table for a range of shift dates.
+
+    python setup/rebuild_daily_summary.py --from 2026-01-01 --to 2026-01-31
+    python setup/rebuild_daily_summary.py --days 7     # the last 7 shift days up to today
+
+Each day is rebuilt and committed on its own, so the command can be re-run
+or interrupted safely while ingestion continues.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector
+from dotenv import load_dotenv
+from mysql.connector import Error
+from Common.daily_summary import rebuild_daily_summary
+from Common.db import load_db_config
+from Common.log import setup_logging, stop_logging
+
+logger = logging.getLogger('rebuild_daily_summary')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the attendance_daily summary table")
+    parser.add_argument('--from', dest='start_date', type=date.fromisoformat, help="first shift date (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='end_date', type=date.fromisoformat, help="last shift date (default today)")
+    parser.add_argument('--days', type=int, help="rebuild this many shift days ending at --to")
+    args = parser.parse_args()
+
+    end_date = args.end_date or date.today()
+    if args.days:
+        start_date = end_date - timedelta(days=args.days - 1)
+    elif args.start_date:
+        start_date = args.start_date
+    else:
+        parser.error("give --from or --days")
+    if start_date > end_date:
+        parser.error("--from is after --to")
+
+    load_dotenv()
+    setup_logging(console=True)
+    try:
+        connection = mysql.connector.connect(**load_db_config())
+    except Error as e:
+        logger.error(f"Error connecting to MySQL database: {e}")
+        stop_logging()
+        sys.exit(1)
+
+    try:
+        logger.info(f"Rebuilding attendance_daily for {start_date} to {end_date}...")
+        written = rebuild_daily_summary(connection, start_date, end_date)
+        logger.info(f"Wrote {written} daily summary rows")
+    except Error as e:
+        logger.error(f"Error rebuilding daily summary: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()